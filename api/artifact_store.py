@@ -0,0 +1,500 @@
+"""Store for extraction artifacts, shared by the API and the extraction workers.
+
+Exports are streamed into files (gzip-compressed, unless the format
+compresses itself) as they are produced, rather than built in memory and
+saved in a database row. Each artifact is hashed (SHA-256 over the stored
+bytes) while it is written, so downloads can advertise and verify a checksum
+without a second pass. Files are written under a temporary name and renamed
+into place on commit, so a crashed or abandoned export never leaves a partial
+artifact that looks complete. A gzip artifact can instead be marked as it
+goes and resumed from its last mark by a later writer.
+
+A job may run in a worker process on another machine than the API process
+that serves its download, so artifacts must live somewhere both can read.
+``ARTIFACT_STORE`` picks the backend:
+
+- ``database`` (the default): artifacts are kept in the ``artifact_chunks``
+  table, in ``ARTIFACT_DB_CHUNK_BYTES`` pieces. Writers still produce a local
+  file in a temporary staging directory (writable on read-only deployments
+  too) and upload it at each mark and on commit.
+- ``directory``: artifacts are files under ``ARTIFACT_DIR``, which must then
+  be set to a directory every API and worker process mounts (a shared
+  volume). Setting ``ARTIFACT_DIR`` alone selects this backend.
+
+The extraction worker refuses to start on a store the API cannot read
+(``ArtifactStore.shared``).
+"""
+
+import base64
+import hashlib
+import logging
+import os
+from pathlib import Path
+import re
+import struct
+import tempfile
+from typing import IO, Iterator, NamedTuple
+import uuid
+import zlib
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from .database import engine
+from .models import ArtifactChunk
+
+
+ARTIFACT_DIR = Path(
+    os.environ.get("ARTIFACT_DIR") or Path(__file__).parent.parent / "data" / "artifacts"
+)
+ARTIFACT_STORE = os.environ.get("ARTIFACT_STORE") or (
+    "directory" if os.environ.get("ARTIFACT_DIR") else "database"
+)
+ARTIFACT_DB_CHUNK_BYTES = int(os.environ.get("ARTIFACT_DB_CHUNK_BYTES", str(1024 * 1024)))
+ARTIFACT_STAGING_DIR = Path(tempfile.gettempdir()) / "healthdb-artifacts"
+ARTIFACT_CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger("healthdb.artifacts")
+
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+_PARTIAL_PATTERN = re.compile(r"^\.[0-9a-f]{32}\.partial$")
+_CHUNKS = ArtifactChunk.__table__
+
+
+class ArtifactCorrupted(Exception):
+    """A stored artifact no longer matches the checksum recorded for it."""
+
+
+class Artifact(NamedTuple):
+    name: str
+    sha256: str
+    size: int
+
+    @property
+    def digest_header(self) -> str:
+        """RFC 3230 ``Digest`` value for the stored bytes."""
+        return "sha-256=" + base64.b64encode(bytes.fromhex(self.sha256)).decode()
+
+
+class _HashingFile:
+    """Write-only file wrapper that hashes and counts what passes through."""
+
+    def __init__(self, raw):
+        self._raw = raw
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self._raw.write(data)
+
+    def flush(self) -> None:
+        self._raw.flush()
+
+    def tell(self) -> int:
+        return self.size
+
+    @property
+    def closed(self) -> bool:
+        return self._raw.closed
+
+
+class ArtifactMark(NamedTuple):
+    """A point a partially written gzip artifact can be resumed from."""
+
+    partial: str  # partial file name in the store
+    offset: int  # stored bytes up to the mark
+    crc32: int  # of the uncompressed content up to the mark
+    length: int  # uncompressed bytes up to the mark
+
+
+# A gzip member header with mtime=0 and no embedded filename, so identical
+# exports are byte-identical; XFL 2 = maximum compression.
+_GZIP_HEADER = b"\x1f\x8b\x08\x00" + struct.pack("<L", 0) + b"\x02\xff"
+
+
+class ArtifactWriter:
+    """Text in, gzip bytes out. Use as a context manager; call ``commit``.
+
+    The gzip stream is produced here (one deflate stream, CRC and length
+    tracked alongside) rather than by GzipFile, so ``mark`` can flush it to a
+    byte boundary that a later writer resumes from: ``resume`` copies the
+    marked prefix of the old partial file into a fresh one and carries on.
+    Copying, rather than appending in place, means a stale writer that has
+    not yet noticed it lost its job cannot scribble over the new one.
+
+    With ``compress=False`` the artifact is stored as written to ``binary``,
+    for formats that compress internally (Parquet, Arrow IPC).
+
+    Leaving the block without committing discards the partial file, unless
+    it has been marked (and so may be resumed); ``discard`` always does.
+    """
+
+    def __init__(
+        self,
+        store: "ArtifactStore",
+        name: str,
+        compress: bool = True,
+        resume: ArtifactMark | None = None,
+    ):
+        self.name = name
+        self._store = store
+        self._final = store.path(name)
+        self._partial = self._final.with_name(f".{uuid.uuid4().hex}.partial")
+        self._raw = open(self._partial, "wb")
+        self._hashing = _HashingFile(self._raw)
+        self._deflate = (
+            zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, 0) if compress else None
+        )
+        self._crc32 = 0
+        self._length = 0
+        self._saved = 0  # stored bytes the store already holds for the partial
+        self._marked = False
+        self._done = False
+        if resume is not None:
+            self._resume(resume)
+        elif compress:
+            self._hashing.write(_GZIP_HEADER)
+
+    def _resume(self, mark: ArtifactMark) -> None:
+        if self._deflate is None:
+            raise ValueError("only gzip artifacts can be resumed")
+        try:
+            with self._store.open_partial(mark.partial) as source:
+                remaining = mark.offset
+                while remaining > 0:
+                    chunk = source.read(min(ARTIFACT_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    self._hashing.write(chunk)
+                    remaining -= len(chunk)
+        except FileNotFoundError:
+            remaining = mark.offset
+        if remaining:
+            self.discard()
+            raise ArtifactCorrupted(mark.partial)
+        self._crc32, self._length = mark.crc32, mark.length
+        self._marked = True
+
+    @property
+    def binary(self) -> _HashingFile:
+        """Byte sink for uncompressed artifacts."""
+        if self._deflate is not None:
+            raise ValueError("binary writes need an uncompressed artifact")
+        return self._hashing
+
+    def write(self, text: str) -> int:
+        data = text.encode("utf-8")
+        self._crc32 = zlib.crc32(data, self._crc32)
+        self._length += len(data)
+        self._hashing.write(self._deflate.compress(data))
+        return len(text)
+
+    def mark(self) -> ArtifactMark:
+        """Flush everything written so far to the store; return where to resume."""
+        if self._deflate is None:
+            raise ValueError("only gzip artifacts can be resumed")
+        # A full flush ends on a byte boundary with no back-references, so a
+        # fresh compressor can continue the same deflate stream from here.
+        self._hashing.write(self._deflate.flush(zlib.Z_FULL_FLUSH))
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._store.save_partial(self._partial, self._saved, self._hashing.size)
+        self._saved = self._hashing.size
+        self._marked = True
+        return ArtifactMark(self._partial.name, self._hashing.size, self._crc32, self._length)
+
+    def commit(self) -> Artifact:
+        if self._deflate is not None:
+            self._hashing.write(self._deflate.flush())
+            self._hashing.write(struct.pack("<LL", self._crc32, self._length & 0xFFFFFFFF))
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        os.replace(self._partial, self._final)
+        self._store.publish(self._final, self._partial.name, self._saved)
+        self._done = True
+        return Artifact(self.name, self._hashing.sha256.hexdigest(), self._hashing.size)
+
+    def discard(self) -> None:
+        if self._done:
+            return
+        self._done = True
+        self._raw.close()
+        self._partial.unlink(missing_ok=True)
+        if self._saved:
+            self._store.delete_partial(self._partial.name)
+
+    def __enter__(self) -> "ArtifactWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._marked and not self._done:
+            # Resumable from the last mark; leave the partial in the store.
+            self._done = True
+            self._raw.close()
+            self._store.release_partial(self._partial)
+            return
+        self.discard()
+
+
+class ArtifactStore:
+    """Artifacts as files under ``root``.
+
+    ``shared`` says whether processes other than this one can read them,
+    i.e. whether ``root`` is a mount every API and worker process has.
+    """
+
+    def __init__(self, root: Path = ARTIFACT_DIR, shared: bool = False):
+        self.root = Path(root)
+        self.shared = shared
+
+    def path(self, name: str) -> Path:
+        if not _NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid artifact name: {name!r}")
+        self.root.mkdir(parents=True, exist_ok=True)
+        return self.root / name
+
+    def size(self, name: str) -> int | None:
+        try:
+            return self.path(name).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def partial_path(self, name: str) -> Path:
+        if not _PARTIAL_PATTERN.match(name):
+            raise ValueError(f"Invalid partial artifact name: {name!r}")
+        return self.root / name
+
+    def open_partial(self, name: str) -> IO[bytes]:
+        """The saved bytes of a marked partial; FileNotFoundError if gone."""
+        return open(self.partial_path(name), "rb")
+
+    def save_partial(self, partial: Path, start: int, end: int) -> None:
+        """Keep bytes ``start``..``end`` (exclusive) of a marked partial file."""
+
+    def release_partial(self, partial: Path) -> None:
+        """A writer is done with a marked partial file it leaves for resuming."""
+
+    def publish(self, final: Path, partial: str, saved: int) -> None:
+        """A writer committed ``final``, whose first ``saved`` bytes were saved as ``partial``."""
+
+    def delete_partial(self, name: str, db: Session | None = None) -> None:
+        """Remove a partial; with ``db``, as part of that session's transaction."""
+        self.partial_path(name).unlink(missing_ok=True)
+
+    def writer(self, name: str, compress: bool = True, resume: ArtifactMark | None = None) -> ArtifactWriter:
+        return ArtifactWriter(self, name, compress, resume)
+
+    def delete(self, name: str) -> None:
+        self.path(name).unlink(missing_ok=True)
+
+    def _read(self, name: str, start: int, end: int) -> Iterator[bytes]:
+        """Stored bytes ``start``..``end`` (inclusive); fewer if the artifact is short."""
+        with open(self.path(name), "rb") as handle:
+            handle.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = handle.read(min(ARTIFACT_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def iter_bytes(
+        self,
+        artifact: Artifact,
+        start: int = 0,
+        end: int | None = None,
+        verify: bool = False,
+    ) -> Iterator[bytes]:
+        """Stored bytes ``start``..``end`` (inclusive), in chunks.
+
+        With ``verify`` (whole-file reads only) the last chunk is held back
+        until the checksum matches, so a corrupted file ends in a failed,
+        short transfer instead of a complete-looking one.
+        """
+        end = artifact.size - 1 if end is None else end
+        digest = hashlib.sha256() if verify else None
+        pending = None
+        remaining = end - start + 1
+        for chunk in self._read(artifact.name, start, end):
+            remaining -= len(chunk)
+            if digest is None:
+                yield chunk
+                continue
+            digest.update(chunk)
+            if pending is not None:
+                yield pending
+            pending = chunk
+        if digest is not None:
+            if remaining or digest.hexdigest() != artifact.sha256:
+                logger.error("Artifact %s failed checksum verification", artifact.name)
+                raise ArtifactCorrupted(artifact.name)
+            if pending is not None:
+                yield pending
+
+    def iter_decompressed(self, artifact: Artifact) -> Iterator[bytes]:
+        """The artifact's original content, for clients that cannot take gzip.
+
+        gzip's own CRC check raises if the stored bytes were damaged.
+        """
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in self._read(artifact.name, 0, artifact.size - 1):
+            if data := decompressor.decompress(chunk):
+                yield data
+        if not decompressor.eof:
+            raise ArtifactCorrupted(artifact.name)
+        if data := decompressor.flush():
+            yield data
+
+
+class DatabaseArtifactStore(ArtifactStore):
+    """Artifacts as ``artifact_chunks`` rows, readable by every process.
+
+    Writers stage files under ``root``; ``save_partial`` uploads what a mark
+    adds and ``publish`` moves the saved partial rows to the final name and
+    uploads the rest, in one transaction, before removing the local file.
+    """
+
+    def __init__(self, root: Path = ARTIFACT_STAGING_DIR, chunk_bytes: int = ARTIFACT_DB_CHUNK_BYTES):
+        super().__init__(root, shared=True)
+        self.chunk_bytes = chunk_bytes
+
+    def _upload(self, connection, name: str, path: Path, start: int, end: int | None = None) -> None:
+        """Append bytes ``start``..``end`` (exclusive; default: to EOF) of ``path`` to ``name``'s rows."""
+        seq = connection.execute(
+            select(func.coalesce(func.max(_CHUNKS.c.seq) + 1, 0)).where(_CHUNKS.c.name == name)
+        ).scalar()
+        with open(path, "rb") as handle:
+            handle.seek(start)
+            remaining = float("inf") if end is None else end - start
+            while remaining > 0:
+                data = handle.read(int(min(self.chunk_bytes, remaining)))
+                if not data:
+                    break
+                connection.execute(insert(_CHUNKS).values(name=name, seq=seq, data=data))
+                seq += 1
+                remaining -= len(data)
+
+    def size(self, name: str) -> int | None:
+        self.path(name)
+        with engine.connect() as connection:
+            count, total = connection.execute(
+                select(func.count(), func.sum(func.length(_CHUNKS.c.data))).where(_CHUNKS.c.name == name)
+            ).one()
+        return int(total or 0) if count else None
+
+    def open_partial(self, name: str) -> IO[bytes]:
+        self.partial_path(name)
+        self.root.mkdir(parents=True, exist_ok=True)
+        copy = tempfile.TemporaryFile(dir=self.root)
+        found = False
+        for data in self._chunks(name):
+            copy.write(data)
+            found = True
+        if not found:
+            copy.close()
+            raise FileNotFoundError(name)
+        copy.seek(0)
+        return copy
+
+    def save_partial(self, partial: Path, start: int, end: int) -> None:
+        with engine.begin() as connection:
+            self._upload(connection, partial.name, partial, start, end)
+
+    def release_partial(self, partial: Path) -> None:
+        partial.unlink(missing_ok=True)
+
+    def publish(self, final: Path, partial: str, saved: int) -> None:
+        with engine.begin() as connection:
+            connection.execute(delete(_CHUNKS).where(_CHUNKS.c.name == final.name))
+            if saved:
+                connection.execute(update(_CHUNKS).where(_CHUNKS.c.name == partial).values(name=final.name))
+            self._upload(connection, final.name, final, saved)
+        final.unlink(missing_ok=True)
+
+    def delete_partial(self, name: str, db: Session | None = None) -> None:
+        super().delete_partial(name)
+        statement = delete(_CHUNKS).where(_CHUNKS.c.name == name)
+        if db is not None:
+            db.execute(statement)
+            return
+        with engine.begin() as connection:
+            connection.execute(statement)
+
+    def delete(self, name: str) -> None:
+        super().delete(name)
+        with engine.begin() as connection:
+            connection.execute(delete(_CHUNKS).where(_CHUNKS.c.name == name))
+
+    def _chunks(self, name: str, first: int = 0) -> Iterator[bytes]:
+        """The rows of ``name`` from ``seq`` ``first`` on, one query each.
+
+        Downloads stream for as long as the client reads, so no connection
+        is held between rows.
+        """
+        seq = first
+        while True:
+            with engine.connect() as connection:
+                data = connection.execute(
+                    select(_CHUNKS.c.data).where(_CHUNKS.c.name == name, _CHUNKS.c.seq == seq)
+                ).scalar()
+            if data is None:
+                return
+            yield bytes(data)
+            seq += 1
+
+    def _read(self, name: str, start: int, end: int) -> Iterator[bytes]:
+        self.path(name)
+        with engine.connect() as connection:
+            lengths = connection.execute(
+                select(_CHUNKS.c.seq, func.length(_CHUNKS.c.data))
+                .where(_CHUNKS.c.name == name)
+                .order_by(_CHUNKS.c.seq)
+            ).all()
+        offset = 0
+        for seq, length in lengths:
+            if offset + length > start:
+                break
+            offset += length
+        else:
+            return
+        for data in self._chunks(name, seq):
+            if offset > end:
+                return
+            piece = data[max(start - offset, 0):end - offset + 1]
+            offset += len(data)
+            if piece:
+                yield piece
+
+
+def parse_byte_range(header: str, size: int) -> tuple[int, int] | None:
+    """Parse a single-range ``Range`` header into inclusive (start, end).
+
+    Returns None for headers this store does not honour (other units,
+    multiple ranges), which are answered with the full body. Raises
+    ValueError when the range cannot be satisfied.
+    """
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", header or "")
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the final N bytes.
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+artifact_store = (
+    ArtifactStore(ARTIFACT_DIR, shared="ARTIFACT_DIR" in os.environ)
+    if ARTIFACT_STORE == "directory"
+    else DatabaseArtifactStore()
+)
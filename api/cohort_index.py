@@ -0,0 +1,459 @@
+"""In-process feature index over contributed, de-identified records.
+
+Feasibility questions ("how many consented patients have a myeloma diagnosis
+and a lenalidomide record?") are answered by intersecting per-term patient
+bitsets instead of re-reading and re-decoding every ExtractedMedicalData row.
+The same postings double as analytics rollups: each analytics label keeps its
+patient set, so per-scope group counts come from maintained sets rather than
+from a pass over the records.
+
+Each process keeps its own index. It is built lazily from the database, then
+caught up on every use with a (created_at, id) keyset watermark, so records
+written by other workers appear on the next query without a rescan. Rows can
+commit out of watermark order (a transaction stamps created_at before it
+commits, and servers' clocks differ), so each catch-up re-reads the ids of
+the last ``COHORT_INDEX_LAG_SECONDS`` before the watermark and loads those it
+has not seen; importers re-date their rows just before commit to stay within
+that window (``MedicalDataWriter.finish``). A full rebuild after
+``COHORT_INDEX_MAX_AGE_SECONDS`` is the backstop for anything later still.
+Catch-ups run at most once per
+``COHORT_INDEX_SYNC_INTERVAL_SECONDS``; writes made through this process
+(``refresh``, ``load_patient``) are applied immediately. ``version`` changes
+whenever indexed content does, so results derived from the index can be
+cached against it. The index is an accelerator, not an access
+control: callers still intersect results with the current consent scope, so a
+stale index can only under-count, never widen what a researcher sees.
+"""
+
+from array import array
+from datetime import timedelta
+import os
+import threading
+import time
+from typing import Any, Iterable
+
+from sqlalchemy.orm import Session
+
+from .models import ExtractedMedicalData
+from .record_stream import (
+    PAYLOAD_TEXT, after_watermark, decode_payload_text, record_query, through_watermark,
+)
+from .term_matcher import TermMatcher
+
+
+COHORT_INDEX_MAX_AGE_SECONDS = int(os.environ.get("COHORT_INDEX_MAX_AGE_SECONDS", "900"))
+COHORT_INDEX_SYNC_INTERVAL_SECONDS = float(os.environ.get("COHORT_INDEX_SYNC_INTERVAL_SECONDS", "2"))
+# How far behind the watermark a catch-up looks for rows that committed late.
+COHORT_INDEX_LAG_SECONDS = float(os.environ.get("COHORT_INDEX_LAG_SECONDS", "60"))
+# Rows loaded per query when a catch-up fetches the records it has not seen.
+COHORT_INDEX_FETCH_BATCH = 500
+
+# Payload fields whose text a cohort criterion is matched against, per kind.
+DIAGNOSIS_TEXT_FIELDS = ("display", "cancer_type", "code", "icd_code")
+TREATMENT_TEXT_FIELDS = ("medication", "procedure", "regimen", "display")
+
+# Feature kinds holding exact analytics labels (not lower-cased search text).
+ANALYTICS_KINDS = (
+    "diagnosis_label", "treatment_label", "age_band", "sex", "response", "vital_status",
+)
+
+# Per-category inventory of payload fields: kind "field:<category>", text is
+# the field name, posting is the patients holding a non-empty value.
+FIELD_KIND_PREFIX = "field:"
+
+
+
+def _field_text(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+def record_features(data_category: str, payload: dict | None) -> Iterable[tuple[str, str]]:
+    """Yield the (kind, text) features a record contributes.
+
+    Cohort search kinds carry lower-cased text for substring matching;
+    analytics kinds carry the label exactly as it is reported; field kinds
+    name the payload fields the record fills in.
+    """
+    if payload is None:
+        return
+
+    for field, value in payload.items():
+        if value is None or value == "" or value == []:
+            continue
+        yield FIELD_KIND_PREFIX + str(data_category), str(field)
+
+    if data_category == "diagnosis":
+        text = " ".join(_field_text(payload.get(k)) for k in DIAGNOSIS_TEXT_FIELDS)
+        if text.strip():
+            yield "diagnosis", text.lower()
+        label = payload.get("display") or payload.get("cancer_type") or "Unknown"
+        yield "diagnosis_label", str(label)
+    elif data_category == "treatment":
+        text = " ".join(_field_text(payload.get(k)) for k in TREATMENT_TEXT_FIELDS)
+        if text.strip():
+            yield "treatment", text.lower()
+        label = (
+            payload.get("medication") or payload.get("procedure")
+            or payload.get("regimen") or "Unknown"
+        )
+        yield "treatment_label", str(label)
+    elif data_category == "demographics":
+        age_band = payload.get("age_band") or payload.get("age_range")
+        if age_band:
+            yield "age_band", str(age_band)
+        if payload.get("sex"):
+            yield "sex", str(payload["sex"])
+    elif data_category == "outcome":
+        if payload.get("response"):
+            yield "response", str(payload["response"])
+        if payload.get("vital_status"):
+            yield "vital_status", str(payload["vital_status"])
+
+    stage = _field_text(payload.get("stage"))
+    if stage:
+        yield "stage", stage.lower()
+
+
+def newest_record(db: Session) -> tuple[Any, str] | None:
+    """(created_at, id) of the most recently written record, if any."""
+    newest = db.query(
+        ExtractedMedicalData.created_at, ExtractedMedicalData.id,
+    ).filter(
+        ExtractedMedicalData.created_at != None
+    ).order_by(
+        ExtractedMedicalData.created_at.desc(), ExtractedMedicalData.id.desc()
+    ).first()
+    return None if newest is None else (newest[0], str(newest[1]))
+
+
+def _bitmap(slot_groups: Iterable[Iterable[int]], size: int) -> int:
+    """OR several slot collections into a single int bitset in linear time."""
+    buffer = bytearray((size >> 3) + 1)
+    for slots in slot_groups:
+        for slot in slots:
+            buffer[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def _iter_slots(bits: int) -> Iterable[int]:
+    digits = bin(bits)[:1:-1]
+    position = digits.find("1")
+    while position != -1:
+        yield position
+        position = digits.find("1", position + 1)
+
+
+class CohortIndex:
+    """Normalized record terms mapped to compact sets of patient slots.
+
+    Patients get a dense integer slot on first sight. Each (kind, text)
+    posting stores the slots holding it as an ``array('I')``; queries OR the
+    postings whose text contains any requested term into an int bitset and
+    AND bitsets across criteria.
+    """
+
+    def __init__(
+        self,
+        max_age_seconds: int = COHORT_INDEX_MAX_AGE_SECONDS,
+        sync_interval_seconds: float = COHORT_INDEX_SYNC_INTERVAL_SECONDS,
+        lag_seconds: float = COHORT_INDEX_LAG_SECONDS,
+    ):
+        self.max_age_seconds = max_age_seconds
+        self.sync_interval_seconds = sync_interval_seconds
+        self.lag = timedelta(seconds=lag_seconds)
+        self._lock = threading.RLock()
+        # Monotonic across rebuilds, unlike everything _reset clears.
+        self.version = 0
+        self._synced_at: float | None = None
+        self._last_split: tuple[frozenset, int, tuple[bool, set[int]]] | None = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._slots: dict[str, int] = {}
+        self._patient_ids: list[str] = []
+        self._postings: dict[str, dict[str, array]] = {}
+        self._features: dict[int, set[tuple[str, str]]] = {}
+        self._category_counts: dict[int, dict[str, int]] = {}
+        self._category_totals: dict[str, int] = {}
+        self._watermark: tuple[Any, str] | None = None
+        # created_at of the records already seen within ``lag`` of the watermark.
+        self._recent: dict[str, Any] = {}
+        self._built_at: float | None = None
+
+    # ---- maintenance ----
+
+    def sync(self, db: Session, consent_scope) -> None:
+        """Build on first use or when stale, otherwise load only new rows.
+
+        ``consent_scope`` is a selectable of consented patient ids; it bounds
+        full rebuilds so revoked patients are not reloaded into memory.
+        """
+        with self._lock:
+            now = time.monotonic()
+            stale = (
+                self._built_at is None
+                or now - self._built_at > self.max_age_seconds
+            )
+            if stale:
+                self._rebuild(db, consent_scope)
+            elif now - self._synced_at >= self.sync_interval_seconds:
+                self._catch_up(db)
+            else:
+                return
+            self._synced_at = now
+
+    def refresh(self, db: Session) -> None:
+        """Load rows written since the last sync; a no-op before first build."""
+        with self._lock:
+            if self._built_at is not None:
+                self._catch_up(db)
+
+    def discard_patient(self, patient_id: str) -> None:
+        """Drop every feature of a patient, e.g. when consent is revoked."""
+        with self._lock:
+            slot = self._slots.get(str(patient_id))
+            if slot is None:
+                return
+            self.version += 1
+            for kind, text in self._features.pop(slot, ()):
+                posting = self._postings[kind][text]
+                posting.remove(slot)
+                if not posting:
+                    del self._postings[kind][text]
+            for category, count in self._category_counts.pop(slot, {}).items():
+                self._category_totals[category] -= count
+                if not self._category_totals[category]:
+                    del self._category_totals[category]
+
+    def load_patient(self, db: Session, patient_id: str) -> None:
+        """(Re)load one patient's records, e.g. after consent is re-granted."""
+        with self._lock:
+            if self._built_at is None:
+                return  # the lazy first build will include them
+            self._catch_up(db)
+            self.discard_patient(patient_id)
+            query = self._record_query(db).filter(
+                ExtractedMedicalData.patient_id == str(patient_id)
+            )
+            for row in self._up_to_watermark(query):
+                self._add(row)
+
+    def _record_query(self, db: Session):
+        return record_query(
+            db,
+            ExtractedMedicalData.id,
+            ExtractedMedicalData.patient_id,
+            ExtractedMedicalData.data_category,
+            PAYLOAD_TEXT,
+            ExtractedMedicalData.created_at,
+        )
+
+    def _up_to_watermark(self, query):
+        return query.filter(through_watermark(self._watermark))
+
+    def _rebuild(self, db: Session, consent_scope) -> None:
+        self._reset()
+        self.version += 1
+        # Pin the watermark to the newest row first, so rows committed while
+        # loading are left to the next catch-up instead of counted twice.
+        self._watermark = newest_record(db)
+        query = self._record_query(db).filter(
+            ExtractedMedicalData.patient_id.in_(consent_scope)
+        )
+        for row in self._up_to_watermark(query):
+            self._add(row)
+        if self._watermark is not None:
+            # Window rows outside the consent scope count as seen too, so
+            # the next catch-up does not load them after all.
+            keys = db.query(
+                ExtractedMedicalData.id, ExtractedMedicalData.created_at,
+            ).filter(
+                ExtractedMedicalData.created_at >= self._watermark[0] - self.lag,
+                through_watermark(self._watermark),
+            )
+            self._recent.update((str(record_id), created_at) for record_id, created_at in keys)
+        self._built_at = time.monotonic()
+
+    def _catch_up(self, db: Session) -> None:
+        """Load rows past the watermark and late rows within ``lag`` before it.
+
+        Only ids and timestamps are read for the window (from the
+        (created_at, id) index); full rows are fetched for unseen ids.
+        """
+        if self._watermark is None:
+            window = after_watermark(None)
+        else:
+            window = ExtractedMedicalData.created_at >= self._watermark[0] - self.lag
+        keys = db.query(
+            ExtractedMedicalData.id, ExtractedMedicalData.created_at,
+        ).filter(window).order_by(ExtractedMedicalData.created_at, ExtractedMedicalData.id).all()
+        unseen = [str(record_id) for record_id, _ in keys if str(record_id) not in self._recent]
+        for start in range(0, len(unseen), COHORT_INDEX_FETCH_BATCH):
+            batch = unseen[start:start + COHORT_INDEX_FETCH_BATCH]
+            for row in self._record_query(db).filter(ExtractedMedicalData.id.in_(batch)):
+                self._add(row)
+        self._recent.update((str(record_id), created_at) for record_id, created_at in keys)
+        if keys:
+            self._advance(keys[-1])
+        self._forget_before_window()
+
+    def _forget_before_window(self) -> None:
+        if self._watermark is None:
+            return
+        cutoff = self._watermark[0] - self.lag
+        self._recent = {
+            record_id: created_at for record_id, created_at in self._recent.items()
+            if created_at >= cutoff
+        }
+
+    def _add(self, row) -> None:
+        _, patient_id, data_category, payload, _ = row
+        patient_id = str(patient_id)
+        self.version += 1
+        slot = self._slots.get(patient_id)
+        if slot is None:
+            slot = len(self._patient_ids)
+            self._slots[patient_id] = slot
+            self._patient_ids.append(patient_id)
+
+        counts = self._category_counts.setdefault(slot, {})
+        counts[data_category] = counts.get(data_category, 0) + 1
+        self._category_totals[data_category] = self._category_totals.get(data_category, 0) + 1
+
+        features = self._features.setdefault(slot, set())
+        for feature in record_features(data_category, decode_payload_text(payload)):
+            if feature in features:
+                continue
+            features.add(feature)
+            kind, text = feature
+            self._postings.setdefault(kind, {}).setdefault(text, array("I")).append(slot)
+
+    def _advance(self, key) -> None:
+        record_id, created_at = key
+        if created_at is not None and (
+            self._watermark is None or (created_at, str(record_id)) > self._watermark
+        ):
+            self._watermark = (created_at, str(record_id))
+
+    # ---- queries ----
+
+    def scope(self, patient_ids: Iterable[str]) -> int:
+        """Bitset of the indexed slots among ``patient_ids``."""
+        with self._lock:
+            slots = [
+                self._slots[pid] for pid in map(str, patient_ids)
+                if pid in self._slots
+            ]
+            return _bitmap([slots], len(self._patient_ids))
+
+    def match(self, kind: str, terms: Iterable[str] | TermMatcher) -> int:
+        """Bitset of patients with a ``kind`` feature containing any term.
+
+        Each distinct normalized text is scanned once by a single automaton,
+        however many terms the criterion carries.
+        """
+        matcher = terms if isinstance(terms, TermMatcher) else TermMatcher(terms)
+        with self._lock:
+            if not matcher:
+                return 0
+            postings = self._postings.get(kind, {})
+            hits = [slots for text, slots in postings.items() if matcher.matches_any(text)]
+            return _bitmap(hits, len(self._patient_ids))
+
+    def match_terms(self, kind: str, terms: Iterable[str]) -> dict[str, int]:
+        """Bitset per lower-cased term of patients with a ``kind`` feature containing it.
+
+        One automaton pass over each distinct text serves every term, so many
+        criteria can be evaluated from a single scan of the postings.
+        """
+        matcher = TermMatcher(terms)
+        with self._lock:
+            if not matcher:
+                return {}
+            groups: dict[str, list[array]] = {}
+            for text, slots in self._postings.get(kind, {}).items():
+                for term in matcher.which(text):
+                    groups.setdefault(term, []).append(slots)
+            size = len(self._patient_ids)
+            return {term: _bitmap(slot_groups, size) for term, slot_groups in groups.items()}
+
+    def patient_ids(self, bits: int) -> list[str]:
+        with self._lock:
+            return [self._patient_ids[slot] for slot in _iter_slots(bits)]
+
+    def _split_scope(self, patient_ids: Iterable[str]) -> tuple[bool, set[int]]:
+        """Return the cheaper side of the scope: (inside?, slots).
+
+        Rollups are maintained over every indexed patient. A scope's counts
+        are either summed over its own patients or derived by subtracting
+        the indexed patients outside it, whichever set is smaller; for the
+        platform-wide consent scope the outside set is usually empty.
+
+        The split of the last frozenset scope is kept until the index
+        changes, so repeated reads over the cached consent scope skip the
+        per-patient pass.
+        """
+        last = self._last_split
+        if last is not None and last[0] is patient_ids and last[1] == self.version:
+            return last[2]
+        inside = {self._slots[pid] for pid in map(str, patient_ids) if pid in self._slots}
+        outside = self._features.keys() - inside
+        split = (True, inside) if len(inside) <= len(outside) else (False, outside)
+        if isinstance(patient_ids, frozenset):
+            self._last_split = (patient_ids, self.version, split)
+        return split
+
+    def feature_counts(self, patient_ids: Iterable[str], kinds: Iterable[str]) -> dict[str, dict[str, int]]:
+        """Distinct patients per label, for each kind, within a scope."""
+        kinds = tuple(kinds)
+        with self._lock:
+            inside, slots = self._split_scope(patient_ids)
+            if inside:
+                counts = {kind: {} for kind in kinds}
+                sign = 1
+            else:
+                counts = {
+                    kind: {text: len(posting) for text, posting in self._postings.get(kind, {}).items()}
+                    for kind in kinds
+                }
+                sign = -1
+            for slot in slots:
+                for kind, text in self._features.get(slot, ()):
+                    if kind in counts:
+                        counts[kind][text] = counts[kind].get(text, 0) + sign
+            return {
+                kind: {text: count for text, count in labels.items() if count > 0}
+                for kind, labels in counts.items()
+            }
+
+    def field_counts(self, patient_ids: Iterable[str]) -> dict[str, dict[str, int]]:
+        """Distinct patients holding each payload field, by category, within a scope."""
+        with self._lock:
+            kinds = [kind for kind in self._postings if kind.startswith(FIELD_KIND_PREFIX)]
+            counts = self.feature_counts(patient_ids, kinds)
+        return {
+            kind[len(FIELD_KIND_PREFIX):]: fields
+            for kind, fields in counts.items() if fields
+        }
+
+    def category_totals(self, patient_ids: Iterable[str]) -> dict[str, int]:
+        """Record counts by data_category, summed over a scope."""
+        with self._lock:
+            inside, slots = self._split_scope(patient_ids)
+            totals = {} if inside else dict(self._category_totals)
+            sign = 1 if inside else -1
+            for slot in slots:
+                for category, count in self._category_counts.get(slot, {}).items():
+                    totals[category] = totals.get(category, 0) + sign * count
+            return {category: count for category, count in totals.items() if count > 0}
+
+    def category_counts(self, patient_id: str) -> dict[str, int]:
+        """Record counts by data_category for one indexed patient."""
+        with self._lock:
+            slot = self._slots.get(str(patient_id))
+            if slot is None:
+                return {}
+            return dict(self._category_counts.get(slot, {}))
+
+
+cohort_index = CohortIndex()
@@ -0,0 +1,135 @@
+"""Bounded background executor for asynchronous cohort computations.
+
+Large cohort evaluations are submitted as CohortJob rows and run here rather
+than inside a request worker, so slow feasibility queries cannot tie up the
+workers that also serve patients. Each process runs at most
+``COHORT_JOB_WORKERS`` jobs at once and holds at most ``COHORT_JOB_MAX_PENDING``
+submitted-but-unfinished jobs; beyond that, submissions are refused.
+
+Cancellation is cooperative. ``cancel`` drops a job that has not started and
+flags one that has; the job function polls ``checkpoint`` between stages,
+which raises ``JobCancelled`` once cancellation was requested here or, via the
+``cancel_requested`` column, by any other worker.
+
+Jobs live in the memory of the process that accepted them, so a restart or
+crash loses them while their rows still say queued or running. A running
+job stamps ``heartbeat_at`` at every step; ``fail_stale_jobs`` marks jobs as
+failed once they have gone ``COHORT_JOB_STALE_SECONDS`` without a heartbeat
+(running) or without starting (queued). It runs at startup, and a polled job
+is checked the same way (``is_stale``), so clients never wait on a job
+nobody is running.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+import os
+import threading
+from typing import Callable
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from .models import CohortJob
+
+
+COHORT_JOB_WORKERS = int(os.environ.get("COHORT_JOB_WORKERS", "2"))
+COHORT_JOB_MAX_PENDING = int(os.environ.get("COHORT_JOB_MAX_PENDING", "16"))
+COHORT_JOB_STALE_SECONDS = int(os.environ.get("COHORT_JOB_STALE_SECONDS", "900"))
+
+STALE_JOB_MESSAGE = "Interrupted by a server restart; submit the job again"
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once its cancellation has been requested."""
+
+
+class CohortJobRunner:
+    """Thread pool with a pending-job bound and per-job cancel flags."""
+
+    def __init__(self, max_workers: int = COHORT_JOB_WORKERS, max_pending: int = COHORT_JOB_MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self._futures: dict[str, Future] = {}
+        self._cancelled: dict[str, threading.Event] = {}
+
+    def submit(self, job_id: str, run: Callable[[str], None]) -> bool:
+        """Schedule ``run(job_id)``; False if this process is at capacity."""
+        with self._lock:
+            if len(self._futures) >= self.max_pending:
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="cohort-job",
+                )
+            self._cancelled[job_id] = threading.Event()
+            future = self._executor.submit(run, job_id)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._forget(job_id))
+        return True
+
+    def _forget(self, job_id: str) -> None:
+        with self._lock:
+            self._futures.pop(job_id, None)
+            self._cancelled.pop(job_id, None)
+
+    def cancel(self, job_id: str) -> bool:
+        """Request cancellation; True if the job had not started and never will."""
+        with self._lock:
+            event = self._cancelled.get(job_id)
+            if event is not None:
+                event.set()
+            future = self._futures.get(job_id)
+        return future is not None and future.cancel()
+
+    def checkpoint(self, job_id: str, requested_elsewhere: bool = False) -> None:
+        """Raise JobCancelled if the job should stop at this point."""
+        with self._lock:
+            event = self._cancelled.get(job_id)
+        if requested_elsewhere or (event is not None and event.is_set()):
+            raise JobCancelled(job_id)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._futures)
+
+
+cohort_job_runner = CohortJobRunner()
+
+
+def is_stale(job: CohortJob, now: datetime | None = None) -> bool:
+    """Whether no process can still be working on ``job``."""
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=COHORT_JOB_STALE_SECONDS)
+    if job.status == "running":
+        last_seen = job.heartbeat_at or job.started_at
+        return last_seen is not None and last_seen < cutoff
+    if job.status == "queued":
+        return job.created_at is not None and job.created_at < cutoff
+    return False
+
+
+def fail_stale_jobs(db: Session, job_id: str | None = None) -> int:
+    """Mark stale queued or running jobs as failed and commit; returns how many."""
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=COHORT_JOB_STALE_SECONDS)
+    query = db.query(CohortJob).filter(or_(
+        and_(
+            CohortJob.status == "running",
+            func.coalesce(CohortJob.heartbeat_at, CohortJob.started_at) < cutoff,
+        ),
+        and_(CohortJob.status == "queued", CohortJob.created_at < cutoff),
+    ))
+    if job_id is not None:
+        query = query.filter(CohortJob.id == job_id)
+    failed = query.update(
+        {
+            CohortJob.status: "failed",
+            CohortJob.stage: None,
+            CohortJob.error_message: STALE_JOB_MESSAGE,
+            CohortJob.completed_at: now,
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    return failed
@@ -0,0 +1,130 @@
+"""Compile cohort criteria into one SQL statement over de-identified payloads.
+
+This is the database-side counterpart of the in-process cohort index: the
+same criteria (diagnosis/ICD text, treatment text, stage) are evaluated with
+JSON field extraction in SQL, so only patient ids and per-category record
+counts leave the database instead of every consented record's payload.
+
+Payload fields are read with SQLAlchemy's JSON index operator, which renders
+as ``->>`` on PostgreSQL and ``JSON_EXTRACT`` on SQLite. Payloads stored as a
+double-encoded JSON string (a legacy shape the Python readers tolerate) are
+unwrapped first, so they match exactly as they do in the index.
+tests/test_cohort_query.py checks both paths select the same patients.
+"""
+
+from typing import Any
+
+from sqlalchemy import JSON, and_, case, cast, false, func, literal, literal_column, or_, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ColumnElement
+
+from .cohort_index import DIAGNOSIS_TEXT_FIELDS, TREATMENT_TEXT_FIELDS
+from .models import ExtractedMedicalData
+
+
+class _Payload(ColumnElement):
+    """``deidentified_data`` as a JSON object, legacy double-encoded strings unwrapped."""
+
+    type = JSON()
+    inherit_cache = True
+
+
+@compiles(_Payload)
+def _compile_payload(element, compiler, **kw):
+    column = ExtractedMedicalData.deidentified_data
+    inner = func.json_extract(column, "$")
+    return compiler.process(case(
+        (and_(func.json_type(column) == "text", func.json_valid(inner) == 1), inner),
+        else_=column,
+    ), **kw)
+
+
+@compiles(_Payload, "postgresql")
+def _compile_payload_postgresql(element, compiler, **kw):
+    column = ExtractedMedicalData.deidentified_data
+    inner = column.op("#>>")(literal_column("'{}'"))
+    return compiler.process(case(
+        (and_(func.json_typeof(column) == "string", inner.like("{%")), cast(inner, JSON)),
+        else_=column,
+    ), **kw)
+
+
+def payload_field(name: str):
+    """A payload field as text; NULL where the record has no value for it."""
+    return _Payload()[name].as_string()
+
+
+def _field(name: str):
+    return func.coalesce(payload_field(name), "")
+
+
+def _haystack(fields: tuple[str, ...]):
+    """Lower-cased, space-joined payload fields, as the index normalizes them."""
+    text = _field(fields[0])
+    for name in fields[1:]:
+        text = text.op("||")(literal(" ")).op("||")(_field(name))
+    return func.lower(text)
+
+
+def _contains_any(haystack, terms: list[str]):
+    needles = [term.lower() for term in terms if term]
+    if not needles:
+        return false()
+    return or_(*(haystack.contains(needle, autoescape=True) for needle in needles))
+
+
+def _patients_where(*conditions):
+    return select(ExtractedMedicalData.patient_id).where(*conditions)
+
+
+def compile_cohort_query(criteria: Any, consent_scope):
+    """Return a SELECT of (patient_id, data_category, record_count) rows.
+
+    ``criteria`` is any object with the CohortCriteria list attributes;
+    ``consent_scope`` is a subquery with an ``id`` column of consented
+    patients. Every matching patient yields at least one row; patients with
+    no records yield a single row whose category is NULL.
+    """
+    scope_id = consent_scope.c.id
+    conditions = []
+
+    diagnosis_terms = list(criteria.cancer_types or []) + list(criteria.icd_codes or [])
+    if diagnosis_terms:
+        conditions.append(scope_id.in_(_patients_where(
+            ExtractedMedicalData.data_category == "diagnosis",
+            _contains_any(_haystack(DIAGNOSIS_TEXT_FIELDS), diagnosis_terms),
+        )))
+    if criteria.treatment_types:
+        conditions.append(scope_id.in_(_patients_where(
+            ExtractedMedicalData.data_category == "treatment",
+            _contains_any(_haystack(TREATMENT_TEXT_FIELDS), criteria.treatment_types),
+        )))
+    if criteria.stages:
+        conditions.append(scope_id.in_(_patients_where(
+            _contains_any(func.lower(_field("stage")), criteria.stages),
+        )))
+
+    matching = select(scope_id.label("patient_id")).where(*conditions).distinct().subquery("matching")
+    return select(
+        matching.c.patient_id,
+        ExtractedMedicalData.data_category,
+        func.count(ExtractedMedicalData.id),
+    ).select_from(
+        matching.outerjoin(
+            ExtractedMedicalData,
+            ExtractedMedicalData.patient_id == matching.c.patient_id,
+        )
+    ).group_by(matching.c.patient_id, ExtractedMedicalData.data_category)
+
+
+def run_cohort_query(db: Session, criteria: Any, consent_scope) -> dict[str, dict[str, int]]:
+    """Matching patient id -> {data_category: record count}, computed in SQL."""
+    per_patient: dict[str, dict[str, int]] = {}
+    for patient_id, category, record_count in db.execute(
+        compile_cohort_query(criteria, consent_scope)
+    ):
+        counts = per_patient.setdefault(str(patient_id), {})
+        if category is not None:
+            counts[category] = record_count
+    return per_patient
@@ -0,0 +1,185 @@
+"""Typed columnar (Parquet / Arrow IPC) extraction output.
+
+CSV exports carry each record's de-identified payload as one JSON string
+column, which analysts re-parse for every cell. Columnar exports flatten the
+payload instead: every payload field becomes its own column, named
+``<data_category>__<field>`` so fields from different categories never
+collide, and each column gets the narrowest type that holds all its values
+(bool, int64, float64, otherwise string). Nested values are kept as JSON text.
+
+The column set is only known once every record has been seen, so rows are
+first spooled, already scrubbed, to a compressed temporary file while the
+column types are inferred; the second pass writes them out in row groups of
+``COLUMNAR_ROW_GROUP_SIZE``. Memory stays bounded by one row group either way.
+
+pyarrow is an optional dependency (``pip install .[columnar]``); it is
+imported only when a columnar export is actually written.
+"""
+
+import gzip
+import importlib.util
+import itertools
+import json
+import os
+import tempfile
+from typing import Any, BinaryIO, Iterator
+
+
+COLUMNAR_ROW_GROUP_SIZE = int(os.environ.get("COLUMNAR_ROW_GROUP_SIZE", "50000"))
+
+# output_format -> (file suffix, media type)
+COLUMNAR_FORMATS = {
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file"),
+}
+
+BASE_COLUMNS = ("patient_pseudonym", "data_category", "data_type", "year", "quality_score")
+_BASE_TYPES = {
+    "patient_pseudonym": "string",
+    "data_category": "string",
+    "data_type": "string",
+    "year": "int64",
+    "quality_score": "float64",
+}
+
+
+def columnar_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _value_kind(value: Any) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int64"
+    if isinstance(value, float):
+        return "float64"
+    if isinstance(value, str):
+        return "string"
+    return "json"
+
+
+def _column_type(kinds: set[str]) -> str:
+    if len(kinds) == 1 and kinds <= {"bool", "int64", "float64"}:
+        return next(iter(kinds))
+    if kinds and kinds <= {"int64", "float64"}:
+        return "float64"
+    return "string"
+
+
+def _coerce(value: Any, column_type: str) -> Any:
+    if value is None:
+        return None
+    if column_type == "string":
+        return value if isinstance(value, str) else json.dumps(value)
+    if column_type == "float64":
+        return float(value)
+    return value
+
+
+def flatten_payload(data_category: str, payload: Any) -> dict[str, Any]:
+    """One record's scrubbed payload as ``{category}__{field}`` cells."""
+    prefix = f"{data_category or 'unknown'}__"
+    if not isinstance(payload, dict):
+        return {} if payload is None else {prefix + "value": payload}
+    return {prefix + str(field): value for field, value in payload.items()}
+
+
+class ColumnarSpool:
+    """Collects flattened rows, then writes them as Parquet or Arrow IPC."""
+
+    def __init__(self):
+        self._spool = tempfile.TemporaryFile()
+        self._lines = gzip.GzipFile(mode="wb", fileobj=self._spool, compresslevel=1)
+        self._kinds: dict[str, set[str]] = {}
+        self.row_count = 0
+
+    def append(self, base: tuple, data_category: str, payload: Any) -> None:
+        """Add a row; ``base`` holds the BASE_COLUMNS values in order."""
+        cells = flatten_payload(data_category, payload)
+        for column, value in cells.items():
+            kinds = self._kinds.setdefault(column, set())
+            kind = _value_kind(value)
+            if kind is not None:
+                kinds.add(kind)
+        self._lines.write(json.dumps([list(base), cells]).encode("utf-8") + b"\n")
+        self.row_count += 1
+
+    def schema(self) -> dict[str, str]:
+        """Column name -> type, base columns first, payload columns sorted."""
+        columns = dict(_BASE_TYPES)
+        for column in sorted(self._kinds):
+            columns[column] = _column_type(self._kinds[column])
+        return columns
+
+    def _rows(self) -> Iterator[tuple[list, dict]]:
+        self._lines.close()
+        self._spool.seek(0)
+        with gzip.GzipFile(mode="rb", fileobj=self._spool) as lines:
+            for line in lines:
+                base, cells = json.loads(line)
+                yield base, cells
+
+    def _batches(self, pa, schema: dict[str, str]):
+        types = {"bool": pa.bool_(), "int64": pa.int64(), "float64": pa.float64(), "string": pa.string()}
+        arrow_schema = pa.schema([(name, types[kind]) for name, kind in schema.items()])
+        payload_columns = list(schema)[len(BASE_COLUMNS):]
+        group: list[tuple[list, dict]] = []
+
+        def build():
+            arrays = [
+                pa.array([base[position] for base, _ in group], type=arrow_schema.field(position).type)
+                for position in range(len(BASE_COLUMNS))
+            ]
+            arrays.extend(
+                pa.array(
+                    [_coerce(cells.get(column), schema[column]) for _, cells in group],
+                    type=arrow_schema.field(column).type,
+                )
+                for column in payload_columns
+            )
+            return pa.RecordBatch.from_arrays(arrays, schema=arrow_schema)
+
+        for row in self._rows():
+            group.append(row)
+            if len(group) >= COLUMNAR_ROW_GROUP_SIZE:
+                yield build()
+                group = []
+        if group or not self.row_count:
+            yield build()
+
+    def write(self, sink: BinaryIO, output_format: str) -> None:
+        """Write every spooled row to ``sink`` in ``output_format``."""
+        import pyarrow as pa
+
+        schema = self.schema()
+        batches = self._batches(pa, schema)
+        first = next(batches)
+        # Wrapped so the writers' close() leaves the caller's sink open.
+        target = pa.PythonFile(sink, mode="w")
+        if output_format == "parquet":
+            import pyarrow.parquet as pq
+
+            writer = pq.ParquetWriter(target, first.schema, compression="zstd")
+            try:
+                for batch in itertools.chain([first], batches):
+                    writer.write_batch(batch, row_group_size=COLUMNAR_ROW_GROUP_SIZE)
+            finally:
+                writer.close()
+        else:
+            options = pa.ipc.IpcWriteOptions(compression="zstd")
+            with pa.ipc.new_file(target, first.schema, options=options) as writer:
+                for batch in itertools.chain([first], batches):
+                    writer.write_batch(batch)
+
+    def close(self) -> None:
+        self._lines.close()
+        self._spool.close()
+
+    def __enter__(self) -> "ColumnarSpool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,136 @@
+"""Consent scope: who may currently be counted or extracted.
+
+Aggregate endpoints need the set of patients with an active, unexpired
+research-data-sharing consent on every request. ``ConsentScope`` caches that
+set per process. Before using it, it reads the consent state (the number of
+research consents, how many are active, and the newest one's created_at), a
+single aggregate over the consents table. A consent signed, revoked or
+removed by any process changes that state, so other workers drop their copy
+on their next request instead of serving a revoked patient. The cache is also
+dropped when the earliest cached consent reaches its expiry, and after
+``CONSENT_SCOPE_TTL_SECONDS`` as a backstop.
+
+Queries that filter records by consent should not inline the cached ids as
+bind parameters (SQLite caps bound variables, and huge IN lists are slow on
+PostgreSQL). They join or IN against the subqueries built here instead, which
+also makes them authoritative rather than cache-dependent.
+"""
+
+from datetime import datetime, timedelta
+import os
+import threading
+
+from sqlalchemy import case, func, or_
+from sqlalchemy.orm import Session
+
+from .cohort_index import cohort_index
+from .models import Consent, PatientProfile, StudyEnrollment
+
+
+CONSENT_SCOPE_TTL_SECONDS = int(os.environ.get("CONSENT_SCOPE_TTL_SECONDS", "30"))
+
+RESEARCH_CONSENT_TYPE = "research_data_sharing"
+
+
+def consented_patient_query(db: Session):
+    """Query of patients with active, unexpired research data sharing consent."""
+    now = datetime.utcnow()
+    return db.query(PatientProfile.id).join(
+        Consent,
+        Consent.patient_id == PatientProfile.id,
+    ).filter(
+        Consent.consent_type == RESEARCH_CONSENT_TYPE,
+        Consent.status == "active",
+        or_(Consent.expires_at == None, Consent.expires_at > now),
+    ).distinct()
+
+
+def consent_state(db: Session) -> tuple:
+    """Summary of the research consents that changes whenever one is signed, revoked or removed."""
+    return tuple(db.query(
+        func.count(Consent.id),
+        func.count(case((Consent.status == "active", 1))),
+        func.max(Consent.created_at),
+    ).filter(Consent.consent_type == RESEARCH_CONSENT_TYPE).one())
+
+
+def study_participant_query(db: Session, study_id: str):
+    """Query of a study's enrolled participants who are also in consent scope."""
+    return consented_patient_query(db).join(
+        StudyEnrollment,
+        StudyEnrollment.patient_id == PatientProfile.id,
+    ).filter(
+        StudyEnrollment.study_id == study_id,
+        StudyEnrollment.status == "enrolled",
+    )
+
+
+def join_scope(query, patient_column, scope_query):
+    """Restrict ``query`` to rows whose ``patient_column`` is in the scope.
+
+    The scope is joined as a derived table, so no patient ids are bound.
+    """
+    scope = scope_query.subquery()
+    return query.join(scope, scope.c.id == patient_column)
+
+
+class ConsentScope:
+    """Process-local cache of the consented patient id set."""
+
+    def __init__(self, ttl_seconds: int = CONSENT_SCOPE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._patient_ids: frozenset[str] | None = None
+        self._valid_until: datetime | None = None
+        self._state: tuple | None = None
+        self.version = 0
+
+    def patient_ids(self, db: Session) -> frozenset[str]:
+        with self._lock:
+            now = datetime.utcnow()
+            state = consent_state(db)
+            if self._patient_ids is not None and now < self._valid_until and state == self._state:
+                return self._patient_ids
+
+            patient_ids = frozenset(
+                str(patient_id) for (patient_id,) in consented_patient_query(db).all()
+            )
+            next_expiry = db.query(func.min(Consent.expires_at)).filter(
+                Consent.consent_type == RESEARCH_CONSENT_TYPE,
+                Consent.status == "active",
+                Consent.expires_at > now,
+            ).scalar()
+            valid_until = now + timedelta(seconds=self.ttl_seconds)
+            if next_expiry is not None and next_expiry < valid_until:
+                valid_until = next_expiry
+
+            if patient_ids != self._patient_ids:
+                self.version += 1
+            self._patient_ids = patient_ids
+            self._valid_until = valid_until
+            self._state = state
+            return patient_ids
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._patient_ids = None
+            self.version += 1
+
+
+consent_scope = ConsentScope()
+
+
+def consent_granted(db: Session, patient_id: str, consent_type: str) -> None:
+    """Hook for a newly signed consent, called after it is committed."""
+    if consent_type != RESEARCH_CONSENT_TYPE:
+        return
+    consent_scope.invalidate()
+    cohort_index.load_patient(db, patient_id)
+
+
+def consent_revoked(patient_id: str, consent_type: str) -> None:
+    """Hook for a revoked consent, called after the revocation is committed."""
+    if consent_type != RESEARCH_CONSENT_TYPE:
+        return
+    consent_scope.invalidate()
+    cohort_index.discard_patient(patient_id)
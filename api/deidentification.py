@@ -11,6 +11,10 @@ import re
 from typing import Any
 
 
+# Bump whenever the rules below change what a payload scrubs to; cached
+# exports made under an older ruleset are then no longer reused.
+DEIDENTIFICATION_RULESET_VERSION = 1
+
 IDENTIFIER_KEY_TERMS = (
     "name",
     "email",
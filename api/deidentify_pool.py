@@ -0,0 +1,173 @@
+"""Parallel scrub-and-verify stage for extraction exports.
+
+``deidentify_record`` and ``find_residual_identifiers`` are regex-heavy and
+CPU-bound, and in an export they run once per record. ``DeidentifyPool``
+spreads that work over a process pool: records are cut into chunks of
+``DEIDENTIFY_CHUNK_SIZE``, each chunk's raw payloads are decoded, scrubbed
+and verified in a worker process, and results come back in input order. At
+most two chunks per worker are in flight, so memory stays bounded however
+large the export is.
+
+An export that asked for only some payload fields passes them along with
+each payload; the payload is cut down to those fields in the worker, before
+it is scrubbed.
+
+Other CPU-bound per-item stages, such as parsing FHIR Bulk Data lines
+(api/fhir_bulk.py), run on the same pool through ``map_chunks``.
+
+Consumers stop early by simply not asking for more results (an export that
+finds residual identifiers breaks out of its loop); chunks that have not
+started are then cancelled. Exports smaller than one chunk, a worker count of
+1, or a platform where a process pool cannot be created all fall back to
+scrubbing in the calling process.
+"""
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+from .deidentification import deidentify_record, find_residual_identifiers
+from .record_stream import decode_payload, load_payload_text
+
+
+# 0 means one worker per CPU. Serverless deployments scrub in-process.
+DEIDENTIFY_WORKERS = int(
+    os.environ.get("DEIDENTIFY_WORKERS", "1" if os.environ.get("VERCEL") else "0")
+) or (os.cpu_count() or 1)
+DEIDENTIFY_CHUNK_SIZE = int(os.environ.get("DEIDENTIFY_CHUNK_SIZE", "500"))
+
+logger = logging.getLogger("healthdb.deidentify")
+
+T = TypeVar("T")
+
+
+def scrub_payload(raw: Any, fields: frozenset[str] | None = None) -> tuple[Any, int]:
+    """De-identify one stored payload; return it with its residual count.
+
+    With ``fields``, only those payload fields are kept.
+    """
+    payload = load_payload_text(raw)
+    if fields is not None:
+        payload = {
+            field: value for field, value in (decode_payload(payload) or {}).items() if field in fields
+        }
+    scrubbed = deidentify_record(payload or {})
+    return scrubbed, len(find_residual_identifiers(scrubbed))
+
+
+def _scrub_chunk(arguments: list[tuple[Any, frozenset[str] | None]]) -> list[tuple[Any, int]]:
+    return [scrub_payload(raw, keep) for raw, keep in arguments]
+
+
+def _every_field(item: Any) -> None:
+    return None
+
+
+def _chunked(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+class DeidentifyPool:
+    """Lazily started process pool shared by every export in this process."""
+
+    def __init__(self, workers: int = DEIDENTIFY_WORKERS, chunk_size: int = DEIDENTIFY_CHUNK_SIZE):
+        self.workers = workers
+        self.chunk_size = max(chunk_size, 1)
+        self._lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+        self._unavailable = workers <= 1
+
+    def _pool(self) -> ProcessPoolExecutor | None:
+        with self._lock:
+            if self._executor is None and not self._unavailable:
+                try:
+                    # spawn, not fork: callers hold database connections and
+                    # heartbeat threads that must not be copied into workers.
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                except (OSError, NotImplementedError, ImportError):
+                    logger.warning("Process pool unavailable; de-identifying in-process", exc_info=True)
+                    self._unavailable = True
+            return self._executor
+
+    def _reset(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def scrub(
+        self,
+        items: Iterable[T],
+        payload: Callable[[T], Any],
+        fields: Callable[[T], frozenset[str] | None] | None = None,
+    ) -> Iterator[tuple[T, Any, int]]:
+        """Yield ``(item, scrubbed payload, residual count)`` in input order.
+
+        ``payload(item)`` gives the stored payload (JSON text or a decoded
+        value) to scrub, and ``fields(item)`` the payload fields to keep (None
+        keeps all); only these are sent to the worker processes.
+        """
+        fields = fields or _every_field
+        for item, (scrubbed, residuals) in self.map_chunks(
+            _scrub_chunk, items, lambda item: (payload(item), fields(item))
+        ):
+            yield item, scrubbed, residuals
+
+    def map_chunks(
+        self,
+        work: Callable[[list], list],
+        items: Iterable[T],
+        argument: Callable[[T], Any],
+    ) -> Iterator[tuple[T, Any]]:
+        """Yield ``(item, result)`` in input order.
+
+        ``work`` must be a module-level function: it is called in a worker
+        process with the ``argument`` of each item in a chunk and returns one
+        result per argument.
+        """
+        chunks = _chunked(items, self.chunk_size)
+        first = next(chunks, None)
+        if first is None:
+            return
+        executor = self._pool() if len(first) == self.chunk_size else None
+        if executor is None:
+            for chunk in itertools.chain([first], chunks):
+                yield from zip(chunk, work([argument(item) for item in chunk]))
+            return
+
+        in_flight: deque[tuple[list[T], Future]] = deque()
+        try:
+            for chunk in itertools.chain([first], chunks):
+                in_flight.append((chunk, executor.submit(work, [argument(item) for item in chunk])))
+                if len(in_flight) >= self.workers * 2:
+                    yield from self._collect(executor, *in_flight.popleft())
+            while in_flight:
+                yield from self._collect(executor, *in_flight.popleft())
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+
+    def _collect(
+        self, executor: ProcessPoolExecutor, chunk: list[T], future: Future
+    ) -> Iterator[tuple[T, Any]]:
+        try:
+            results = future.result()
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start fresh next time.
+            self._reset(executor)
+            raise
+        yield from zip(chunk, results)
+
+
+deidentify_pool = DeidentifyPool()
@@ -0,0 +1,159 @@
+"""Content-addressed cache of full extraction artifacts.
+
+Collaborators on a study often request the same extract minutes apart. A
+full export is determined by the study, the projected variables, the
+de-identification ruleset and level, the output format, the data watermark
+and the set of participants in scope, so ``cache_key`` digests exactly those.
+A new job whose key matches a live ExportArtifact links to its file
+(``link``) instead of exporting again; a job that did export publishes its
+artifact under the key it actually covered (``store``).
+
+Each linked job holds one reference. ``sweep`` releases the references of
+jobs whose download has expired and deletes artifacts nobody references
+once their own expiry, the latest linked download expiry, has passed.
+Linking and deleting are conditional UPDATE / DELETE statements on the same
+expiry, so a sweep can never remove an artifact a job has just linked to.
+"""
+
+from datetime import datetime
+import hashlib
+import json
+from typing import Iterable
+
+from sqlalchemy import exists
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .artifact_store import Artifact, artifact_store
+from .deidentification import DEIDENTIFICATION_RULESET_VERSION
+from .extraction_delta import job_watermark
+from .extraction_projection import Projection
+from .models import ExportArtifact, ExtractionJob, ExtractionJobPatient
+
+
+def participant_fingerprint(patient_ids: Iterable[str]) -> str:
+    """Digest of a participant set; ``patient_ids`` must come in id order."""
+    digest = hashlib.sha256()
+    for patient_id in patient_ids:
+        digest.update(str(patient_id).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def job_participant_ids(db: Session, job: ExtractionJob):
+    return (
+        patient_id
+        for (patient_id,) in db.query(ExtractionJobPatient.patient_id).filter(
+            ExtractionJobPatient.job_id == job.id
+        ).order_by(ExtractionJobPatient.patient_id)
+    )
+
+
+def cache_key(job: ExtractionJob, projection: Projection, participants: str) -> str:
+    """Key of a full export of ``job`` over the ``participants`` fingerprint."""
+    watermark = job_watermark(job)
+    inputs = {
+        "study_id": str(job.study_id),
+        "variables": projection.canonical(),
+        "ruleset": DEIDENTIFICATION_RULESET_VERSION,
+        "deidentification_level": job.deidentification_level,
+        "output_format": job.output_format,
+        "watermark": [watermark[0].isoformat(), watermark[1]] if watermark else None,
+        "participants": participants,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def link(db: Session, key: str, job: ExtractionJob, expires_at: datetime) -> tuple[Artifact, str] | None:
+    """Take a reference to the live artifact cached under ``key``, if any.
+
+    Returns the artifact and the job whose participant rows the caller
+    should copy to ``job``; ``job`` becomes the entry's source from now on.
+    Does not commit.
+    """
+    entry = db.query(ExportArtifact).filter(ExportArtifact.cache_key == key).first()
+    if entry is None or artifact_store.size(entry.artifact_path) is None:
+        return None
+    source_job_id = entry.source_job_id
+    if not db.query(exists().where(ExtractionJobPatient.job_id == source_job_id)).scalar():
+        return None
+    linked = db.query(ExportArtifact).filter(
+        ExportArtifact.cache_key == key,
+        ExportArtifact.expires_at > datetime.utcnow(),
+    ).update(
+        {
+            ExportArtifact.ref_count: ExportArtifact.ref_count + 1,
+            # Every link expires a fixed time after it is made, so the
+            # newest link always expires last.
+            ExportArtifact.expires_at: expires_at,
+            ExportArtifact.source_job_id: job.id,
+        },
+        synchronize_session=False,
+    )
+    if not linked:
+        return None
+    job.cache_key = key
+    return Artifact(entry.artifact_path, entry.artifact_sha256, entry.artifact_size), source_job_id
+
+
+def store(db: Session, key: str, job: ExtractionJob) -> None:
+    """Publish a completed job's artifact under ``key`` and commit.
+
+    If another job published the same key first, this job keeps its own
+    artifact uncached.
+    """
+    db.add(ExportArtifact(
+        cache_key=key,
+        study_id=job.study_id,
+        source_job_id=job.id,
+        artifact_path=job.artifact_path,
+        artifact_sha256=job.artifact_sha256,
+        artifact_size=job.artifact_size,
+        ref_count=1,
+        expires_at=job.download_expires_at,
+    ))
+    job.cache_key = key
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+
+
+def sweep(db: Session) -> int:
+    """Release expired jobs' references and delete dead artifacts; commits.
+
+    Returns the number of artifacts deleted.
+    """
+    now = datetime.utcnow()
+    expired = db.query(ExtractionJob.id, ExtractionJob.cache_key).filter(
+        ExtractionJob.cache_key != None,
+        ExtractionJob.download_expires_at < now,
+    ).all()
+    for job_id, key in expired:
+        released = db.query(ExtractionJob).filter(
+            ExtractionJob.id == job_id,
+            ExtractionJob.cache_key == key,
+        ).update({ExtractionJob.cache_key: None}, synchronize_session=False)
+        if released:
+            db.query(ExportArtifact).filter(ExportArtifact.cache_key == key).update(
+                {ExportArtifact.ref_count: ExportArtifact.ref_count - 1},
+                synchronize_session=False,
+            )
+    db.commit()
+
+    deleted = 0
+    dead = db.query(ExportArtifact.cache_key, ExportArtifact.artifact_path).filter(
+        ExportArtifact.ref_count <= 0,
+        ExportArtifact.expires_at < now,
+    ).all()
+    for key, artifact_path in dead:
+        removed = db.query(ExportArtifact).filter(
+            ExportArtifact.cache_key == key,
+            ExportArtifact.ref_count <= 0,
+            ExportArtifact.expires_at < now,
+        ).delete(synchronize_session=False)
+        db.commit()
+        if removed:
+            artifact_store.delete(artifact_path)
+            deleted += 1
+    return deleted
@@ -0,0 +1,133 @@
+"""Chunked, resumable progress for extraction jobs.
+
+``process_extraction_job`` walks a study's participants in patient-id order,
+``EXTRACTION_CHUNK_PATIENTS`` at a time. After each chunk it marks the gzip
+artifact (see ``ArtifactWriter.mark``) and commits an ExtractionCheckpoint
+row (last patient id, rows written so far, artifact offset) together with
+the chunk's ExtractionJobPatient rows. A worker that picks the job up after a
+crash, a deploy or a lost lease resumes from the latest checkpoint instead of
+starting over; the artifact is still renamed into place only once complete.
+
+Columnar exports (Parquet / Arrow) are written in a second pass over a
+spool, so they restart from the beginning instead.
+"""
+
+import logging
+import os
+
+from sqlalchemy.orm import Session
+
+from .artifact_store import ArtifactCorrupted, ArtifactMark, ArtifactWriter, artifact_store
+from .models import (
+    ExtractionCheckpoint, ExtractionJob, ExtractionJobPatient, ExtractionJobRecord, PatientProfile,
+)
+
+
+# Participant ids per chunk; each chunk's ids are bound in one IN list.
+EXTRACTION_CHUNK_PATIENTS = int(os.environ.get("EXTRACTION_CHUNK_PATIENTS", "500"))
+
+logger = logging.getLogger("healthdb.extraction")
+
+
+def participant_chunks(participants, after: str | None = None, size: int = EXTRACTION_CHUNK_PATIENTS):
+    """Yield lists of participant ids in id order, starting after ``after``.
+
+    Each chunk is queried when it is needed, so progress committed between
+    chunks does not disturb an open cursor.
+    """
+    while True:
+        query = participants
+        if after is not None:
+            query = query.filter(PatientProfile.id > after)
+        chunk = [str(patient_id) for (patient_id,) in query.order_by(PatientProfile.id).limit(size)]
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1]
+
+
+def latest_checkpoint(db: Session, job_id: str) -> ExtractionCheckpoint | None:
+    return db.query(ExtractionCheckpoint).filter(
+        ExtractionCheckpoint.job_id == job_id
+    ).order_by(ExtractionCheckpoint.chunk_index.desc()).first()
+
+
+def checkpoint_mark(progress: ExtractionCheckpoint) -> ArtifactMark | None:
+    if progress.artifact_partial is None:
+        return None
+    return ArtifactMark(
+        progress.artifact_partial,
+        progress.artifact_offset,
+        progress.artifact_crc32,
+        progress.artifact_length,
+    )
+
+
+def open_artifact(
+    db: Session, job: ExtractionJob, name: str, compress: bool = True
+) -> tuple[ArtifactWriter, ExtractionCheckpoint | None]:
+    """Open ``job``'s artifact writer at its latest checkpoint, if it has one.
+
+    The checkpoint is None when the job has to run from the first chunk:
+    it has none, it writes an uncompressed (columnar) artifact, or the
+    checkpoint's partial file is gone.
+    """
+    progress = latest_checkpoint(db, job.id) if compress else None
+    mark = checkpoint_mark(progress) if progress else None
+    if mark is not None:
+        try:
+            return artifact_store.writer(name, resume=mark), progress
+        except ArtifactCorrupted:
+            logger.warning("Partial artifact for extraction job %s is missing; restarting", job.id)
+    return artifact_store.writer(name, compress=compress), None
+
+
+def save_checkpoint(
+    db: Session,
+    job: ExtractionJob,
+    chunk_index: int,
+    last_patient_id: str,
+    rows_written: int,
+    mark: ArtifactMark | None,
+) -> None:
+    """Record a finished chunk; the caller commits it with the chunk's rows."""
+    db.add(ExtractionCheckpoint(
+        job_id=job.id,
+        chunk_index=chunk_index,
+        last_patient_id=last_patient_id,
+        rows_written=rows_written,
+        artifact_partial=mark.partial if mark else None,
+        artifact_offset=mark.offset if mark else None,
+        artifact_crc32=mark.crc32 if mark else None,
+        artifact_length=mark.length if mark else None,
+    ))
+
+
+def clear_progress(db: Session, job: ExtractionJob, keep_partial: str | None = None) -> None:
+    """Drop a job's checkpoints and their partial files, except ``keep_partial``.
+
+    Does not commit.
+    """
+    partials = {
+        partial
+        for (partial,) in db.query(ExtractionCheckpoint.artifact_partial).filter(
+            ExtractionCheckpoint.job_id == job.id
+        ).distinct()
+        if partial and partial != keep_partial
+    }
+    for partial in partials:
+        artifact_store.delete_partial(partial, db)
+    db.query(ExtractionCheckpoint).filter(
+        ExtractionCheckpoint.job_id == job.id
+    ).delete(synchronize_session=False)
+
+
+def restart(db: Session, job: ExtractionJob) -> None:
+    """Forget a job's progress so it runs from the first chunk; no commit."""
+    clear_progress(db, job)
+    db.query(ExtractionJobPatient).filter(
+        ExtractionJobPatient.job_id == job.id
+    ).delete(synchronize_session=False)
+    db.query(ExtractionJobRecord).filter(
+        ExtractionJobRecord.job_id == job.id
+    ).delete(synchronize_session=False)
@@ -0,0 +1,222 @@
+"""Incremental (delta) extraction.
+
+Every completed extraction job records the newest record it covered as a
+(created_at, id) watermark, and the study participants it covered as
+ExtractionJobPatient rows. A delta job continues from the study's latest
+completed job that exported the same thing per record (its base): the same
+variables, output format and de-identification level, digested as
+``delta_key``. A base over other fields never sent their history, so
+without a matching base a delta exports everything, as a full job would.
+With one:
+
+- participants the base already covered get only records written after the
+  base's watermark;
+- participants who joined (or re-consented) since get their full history;
+- participants the base covered who are no longer in the study, because
+  they withdrew or their consent lapsed, are listed in a tombstone file so
+  the recipient can drop their rows.
+
+Participant rows are written chunk by chunk as a job runs, each with the
+number of records exported for that participant, so a resumed job knows what
+it already covered. Once a job completes, the older lists of the study's jobs
+with its ``delta_key`` are dropped (except those of jobs still running, and
+those the export cache copies to jobs that reuse an artifact); the latest
+list per key is all the next delta needs.
+
+A record's created_at is stamped when it is written, not when its upload
+commits, so a record can become visible after a job whose watermark is
+already past it. The watermark alone would then hide it from every later
+delta. Each job therefore also pins a window start,
+``EXTRACTION_DELTA_LAG_SECONDS`` before its watermark, and keeps the ids of
+the records inside the window that it and the jobs it builds on exported
+(ExtractionJobRecord). A delta re-reads everything after the base's window
+start and skips those ids.
+Uploads that stay uncommitted for longer than the lag can still be missed.
+Jobs that predate window starts are continued from their watermark alone.
+
+Tombstones are per participant. Records deleted individually, such as the
+duplicates removed by the fingerprint backfill (api/record_fingerprint.py),
+are not reported to delta jobs.
+"""
+
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable
+
+from sqlalchemy import and_, exists, func, insert, literal, or_, select
+from sqlalchemy.orm import Session
+
+from .extraction_projection import Projection
+from .models import (
+    ExportArtifact, ExtractedMedicalData, ExtractionJob, ExtractionJobPatient, ExtractionJobRecord,
+)
+from .record_stream import after_watermark, through_watermark
+
+
+# Longest an upload may stay uncommitted after stamping its records.
+EXTRACTION_DELTA_LAG_SECONDS = int(os.environ.get("EXTRACTION_DELTA_LAG_SECONDS", "3600"))
+
+
+def job_watermark(job: ExtractionJob) -> tuple[Any, str] | None:
+    if job.watermark_created_at is None:
+        return None
+    return job.watermark_created_at, job.watermark_record_id
+
+
+def window_start(watermark_created_at: datetime | None) -> datetime | None:
+    """Start of the window the next delta re-reads, for a job's watermark."""
+    if watermark_created_at is None:
+        return None
+    return watermark_created_at - timedelta(seconds=EXTRACTION_DELTA_LAG_SECONDS)
+
+
+def delta_key(job: ExtractionJob, projection: Projection) -> str:
+    """Digest of what ``job`` exports per record; a delta's base must share it."""
+    inputs = {
+        "variables": projection.canonical(),
+        "output_format": job.output_format,
+        "deidentification_level": job.deidentification_level,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def latest_completed_job(
+    db: Session, study_id: str, exclude_job_id: str, key: str
+) -> ExtractionJob | None:
+    """The study's most recent completed job with ``delta_key`` ``key`` that a delta can build on."""
+    return db.query(ExtractionJob).filter(
+        ExtractionJob.study_id == study_id,
+        ExtractionJob.status == "completed",
+        ExtractionJob.id != exclude_job_id,
+        ExtractionJob.delta_key == key,
+        exists().where(ExtractionJobPatient.job_id == ExtractionJob.id),
+    ).order_by(ExtractionJob.completed_at.desc()).first()
+
+
+def _covered_by(base_job_id: str):
+    return select(ExtractionJobPatient.patient_id).where(ExtractionJobPatient.job_id == base_job_id)
+
+
+def delta_filter(base_job: ExtractionJob):
+    """Records a delta on top of ``base_job`` must include.
+
+    Combine with the study's participant scope and the new job's own
+    watermark.
+    """
+    if base_job.watermark_window_start is None:
+        newer = after_watermark(job_watermark(base_job))
+    else:
+        newer = and_(
+            ExtractedMedicalData.created_at > base_job.watermark_window_start,
+            ExtractedMedicalData.id.not_in(
+                select(ExtractionJobRecord.record_id).where(ExtractionJobRecord.job_id == base_job.id)
+            ),
+        )
+    return or_(ExtractedMedicalData.patient_id.not_in(_covered_by(base_job.id)), newer)
+
+
+def removed_participants(db: Session, base_job_id: str, participants):
+    """Patient ids ``base_job_id`` covered that are not in ``participants`` now."""
+    scope = participants.subquery()
+    return db.query(ExtractionJobPatient.patient_id).filter(
+        ExtractionJobPatient.job_id == base_job_id,
+        ExtractionJobPatient.patient_id.not_in(select(scope.c.id)),
+    ).order_by(ExtractionJobPatient.patient_id)
+
+
+def record_participants(db: Session, job: ExtractionJob, record_counts: Dict[str, int]) -> None:
+    """Add ``job``'s participants with their exported record counts; no commit."""
+    rows = [
+        {"job_id": job.id, "patient_id": str(patient_id), "record_count": count}
+        for patient_id, count in record_counts.items()
+    ]
+    if rows:
+        db.execute(insert(ExtractionJobPatient), rows)
+
+
+def record_window_records(db: Session, job: ExtractionJob, record_ids: Iterable[str]) -> None:
+    """Add records ``job`` exported from inside its window; no commit."""
+    rows = [{"job_id": job.id, "record_id": str(record_id)} for record_id in record_ids]
+    if rows:
+        db.execute(insert(ExtractionJobRecord), rows)
+
+
+def inherit_window_records(db: Session, base_job: ExtractionJob, job: ExtractionJob) -> None:
+    """Add the records in a delta ``job``'s window that ``base_job`` covered; no commit."""
+    if job.watermark_window_start is None:
+        return
+    if base_job.watermark_window_start is None:
+        covered = select(literal(job.id), ExtractedMedicalData.id).where(
+            ExtractedMedicalData.patient_id.in_(_covered_by(base_job.id)),
+            through_watermark(job_watermark(base_job)),
+            ExtractedMedicalData.created_at > job.watermark_window_start,
+        )
+    else:
+        covered = select(literal(job.id), ExtractionJobRecord.record_id).join(
+            ExtractedMedicalData, ExtractedMedicalData.id == ExtractionJobRecord.record_id
+        ).where(
+            ExtractionJobRecord.job_id == base_job.id,
+            ExtractedMedicalData.created_at > job.watermark_window_start,
+        )
+    db.execute(insert(ExtractionJobRecord).from_select(["job_id", "record_id"], covered))
+
+
+def copy_participants(db: Session, source_job_id: str, job: ExtractionJob) -> None:
+    """Give ``job`` the participant and window rows of ``source_job_id``; no commit."""
+    db.execute(insert(ExtractionJobPatient).from_select(
+        ["job_id", "patient_id", "record_count"],
+        select(
+            literal(job.id), ExtractionJobPatient.patient_id, ExtractionJobPatient.record_count
+        ).where(ExtractionJobPatient.job_id == source_job_id),
+    ))
+    db.execute(insert(ExtractionJobRecord).from_select(
+        ["job_id", "record_id"],
+        select(literal(job.id), ExtractionJobRecord.record_id).where(
+            ExtractionJobRecord.job_id == source_job_id
+        ),
+    ))
+
+
+def participant_totals(db: Session, job: ExtractionJob) -> tuple[Dict[str, int], int]:
+    """``({patient_id: record count}, participant count)`` for ``job`` so far.
+
+    Only participants with at least one exported record are in the mapping.
+    """
+    counts = {
+        patient_id: count
+        for patient_id, count in db.query(
+            ExtractionJobPatient.patient_id, ExtractionJobPatient.record_count
+        ).filter(
+            ExtractionJobPatient.job_id == job.id,
+            ExtractionJobPatient.record_count > 0,
+        )
+    }
+    participants = db.query(func.count()).select_from(ExtractionJobPatient).filter(
+        ExtractionJobPatient.job_id == job.id
+    ).scalar()
+    return counts, participants
+
+
+def drop_superseded_participants(db: Session, job: ExtractionJob) -> None:
+    """Drop participant and window lists of the study's other finished jobs; no commit.
+
+    Only jobs with ``job``'s ``delta_key``, or none (which no delta can
+    build on), are superseded.
+    """
+    superseded = select(ExtractionJob.id).where(
+        ExtractionJob.study_id == job.study_id,
+        ExtractionJob.id != job.id,
+        or_(ExtractionJob.delta_key == job.delta_key, ExtractionJob.delta_key == None),
+        ExtractionJob.status.not_in(("queued", "running")),
+        ExtractionJob.id.not_in(
+            select(ExportArtifact.source_job_id).where(ExportArtifact.source_job_id != None)
+        ),
+    )
+    db.query(ExtractionJobPatient).filter(
+        ExtractionJobPatient.job_id.in_(superseded)
+    ).delete(synchronize_session=False)
+    db.query(ExtractionJobRecord).filter(
+        ExtractionJobRecord.job_id.in_(superseded)
+    ).delete(synchronize_session=False)
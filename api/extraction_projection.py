@@ -0,0 +1,117 @@
+"""Variable projection for extraction jobs.
+
+A job's ``variables`` name the payload fields the study asked for, in the
+ids ``/api/cohort/variables`` lists:
+
+- ``<category>.<field>``: one field of one data category;
+- ``<category>.*``: every field of a data category;
+- ``<field>``: that field in whichever category holds it.
+
+Only the rows of categories that can hold a requested field are read
+(``category_filter``): the named categories, plus the categories in which the
+study's participants have records holding any ``<field>`` variable
+(``anywhere_categories``, read from the database when the job runs). Payloads are
+cut down to the requested fields (``fields``) before they are de-identified,
+so scrubbing and output shrink with the request, and a row left with no
+value for any requested field (``is_empty``) is not exported. A job with no
+variables exports every field, as before.
+"""
+
+from typing import Any, Iterable
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from .cohort_query import payload_field
+from .models import ExtractedMedicalData
+
+
+WILDCARD = "*"
+
+
+def parse_variable(variable: str) -> tuple[str | None, str]:
+    """``(category or None, field)`` for one variable id; ValueError if malformed."""
+    category, dot, field = variable.partition(".")
+    if not dot:
+        category, field = "", category
+    category, field = category.strip(), field.strip()
+    if not field or (dot and not category) or (field == WILDCARD and not category):
+        raise ValueError(f"Invalid variable: {variable!r}")
+    return category or None, field
+
+
+class Projection:
+    """The fields an extraction job keeps, by data category."""
+
+    def __init__(self, variables: Iterable[str] | None = None):
+        self.anywhere: set[str] = set()
+        self.by_category: dict[str, set[str] | None] = {}  # None: every field
+        self._fields: dict[str | None, frozenset[str] | None] = {}
+        for variable in variables or ():
+            category, field = parse_variable(variable)
+            if category is None:
+                self.anywhere.add(field)
+            elif field == WILDCARD:
+                self.by_category[category] = None
+            elif self.by_category.get(category, set()) is not None:
+                self.by_category.setdefault(category, set()).add(field)
+
+    @property
+    def everything(self) -> bool:
+        return not self.anywhere and not self.by_category
+
+    def canonical(self) -> list[str]:
+        """The variables in a normal form: equal for equivalent requests."""
+        variables = set(self.anywhere)
+        for category, fields in self.by_category.items():
+            if fields is None:
+                variables.add(f"{category}.{WILDCARD}")
+            else:
+                variables.update(f"{category}.{field}" for field in fields)
+        return sorted(variables)
+
+    def category_filter(self, anywhere_categories: Iterable[str] | None = None):
+        """Filter on ExtractedMedicalData rows worth reading, or None for all.
+
+        ``anywhere_categories`` are the categories holding any ``<field>``
+        variable; without it, such variables need every row.
+        """
+        if self.everything or (self.anywhere and anywhere_categories is None):
+            return None
+        categories = set(self.by_category).union(anywhere_categories or ())
+        return ExtractedMedicalData.data_category.in_(sorted(categories))
+
+    def fields(self, data_category: str | None) -> frozenset[str] | None:
+        """Payload fields to keep for a record of ``data_category``; None keeps all."""
+        if self.everything:
+            return None
+        if data_category not in self._fields:
+            if data_category in self.by_category and self.by_category[data_category] is None:
+                self._fields[data_category] = None
+            else:
+                self._fields[data_category] = frozenset(
+                    self.anywhere.union(self.by_category.get(data_category) or ())
+                )
+        return self._fields[data_category]
+
+
+def anywhere_categories(db: Session, fields: Iterable[str], participants) -> set[str]:
+    """Categories of the participants' records with a value for any of ``fields``.
+
+    ``participants`` is a query of patient ids.
+    """
+    fields = sorted(fields)
+    if not fields:
+        return set()
+    rows = db.query(ExtractedMedicalData.data_category).filter(
+        ExtractedMedicalData.patient_id.in_(participants),
+        or_(*(payload_field(field) != None for field in fields)),
+    ).distinct()
+    return {category for (category,) in rows}
+
+
+def is_empty(payload: Any) -> bool:
+    """Whether a projected payload has no value for any of its fields."""
+    if not isinstance(payload, dict):
+        return False
+    return all(value is None or value == "" or value == [] for value in payload.values())
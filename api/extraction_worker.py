@@ -0,0 +1,318 @@
+"""Database-backed queue and worker for extraction jobs.
+
+With ``EXTRACTION_EXECUTION=queue``, ``create_extraction_job`` only records a
+queued ExtractionJob; worker processes started with
+``python -m api.extraction_worker`` claim jobs from the table and run them
+outside any HTTP request. Deployments without a worker leave the setting at
+its default, "inline", and jobs run in the creating request (``run_inline``);
+the API then fails, at startup and whenever jobs are listed or polled, any
+job whose process died mid-run (``reap_expired_jobs``), since no worker
+will re-claim it.
+
+A claim is a lease: the worker owns the job until ``lease_expires_at`` and
+renews it from a heartbeat thread while the job runs. If a worker dies, its
+lease lapses and the next poll by any worker re-claims the job, up to
+``EXTRACTION_MAX_ATTEMPTS`` attempts in total. A job that raises is put back
+in the queue the same way; a re-claimed job continues from its last
+checkpoint (see api/extraction_checkpoint.py). Claims are conditional
+UPDATEs, so two workers can never both win the same job, on SQLite or
+PostgreSQL, without row locks.
+
+Artifacts are written to the shared artifact store (api/artifact_store.py);
+a worker will not start with a directory store the API cannot read.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from typing import Callable
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import ExtractionJob
+
+
+EXTRACTION_LEASE_SECONDS = int(os.environ.get("EXTRACTION_LEASE_SECONDS", "120"))
+EXTRACTION_MAX_ATTEMPTS = int(os.environ.get("EXTRACTION_MAX_ATTEMPTS", "3"))
+EXTRACTION_POLL_SECONDS = float(os.environ.get("EXTRACTION_POLL_SECONDS", "2"))
+EXTRACTION_WORKER_PROCESSES = int(os.environ.get("EXTRACTION_WORKER_PROCESSES", "2"))
+
+logger = logging.getLogger("healthdb.extraction")
+
+# process(db, job, checkpoint): run a claimed job; call checkpoint() before
+# writing results so a worker that lost its lease does not publish them.
+JobProcessor = Callable[[Session, ExtractionJob, Callable[[], None]], None]
+
+
+class LeaseLost(Exception):
+    """The worker no longer holds the job's lease; another worker may."""
+
+
+def _claimable(now: datetime):
+    return or_(
+        ExtractionJob.status == "queued",
+        and_(ExtractionJob.status == "running", ExtractionJob.lease_expires_at < now),
+    )
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _abandoned(now: datetime):
+    """Jobs no inline run will pick up again: expired leases and stray queued jobs."""
+    cutoff = now - timedelta(seconds=EXTRACTION_LEASE_SECONDS)
+    return or_(
+        and_(ExtractionJob.status == "running", ExtractionJob.lease_expires_at < now),
+        and_(
+            ExtractionJob.status == "queued",
+            func.coalesce(ExtractionJob.heartbeat_at, ExtractionJob.created_at) < cutoff,
+        ),
+    )
+
+
+def is_reapable(job: ExtractionJob, inline: bool, now: datetime | None = None) -> bool:
+    """Whether ``reap_expired_jobs`` would fail ``job``."""
+    now = now or datetime.utcnow()
+    if job.status == "running" and job.lease_expires_at is not None and job.lease_expires_at < now:
+        return inline or (job.attempts or 0) >= EXTRACTION_MAX_ATTEMPTS
+    if inline and job.status == "queued":
+        last_seen = job.heartbeat_at or job.created_at
+        return last_seen is not None and last_seen < now - timedelta(seconds=EXTRACTION_LEASE_SECONDS)
+    return False
+
+
+def reap_expired_jobs(db: Session, inline: bool, job_id: str | None = None) -> int:
+    """Fail jobs that nothing will run again and commit; returns how many.
+
+    Expired leases that have used every attempt are failed, not retried.
+    With inline execution there is no worker to re-claim a job whose
+    process died, so every expired lease is failed, as is a queued job
+    (new, or requeued after an error) that no request claimed within a
+    lease period.
+    """
+    now = datetime.utcnow()
+    exhausted = db.query(ExtractionJob).filter(
+        ExtractionJob.status == "running",
+        ExtractionJob.lease_expires_at < now,
+        ExtractionJob.attempts >= EXTRACTION_MAX_ATTEMPTS,
+    )
+    if job_id is not None:
+        exhausted = exhausted.filter(ExtractionJob.id == job_id)
+    reaped = exhausted.update({
+        ExtractionJob.status: "failed",
+        ExtractionJob.error_message: f"Worker stopped responding on all {EXTRACTION_MAX_ATTEMPTS} attempts",
+        ExtractionJob.leased_by: None,
+        ExtractionJob.completed_at: now,
+    }, synchronize_session=False)
+    if inline:
+        abandoned = db.query(ExtractionJob).filter(_abandoned(now))
+        if job_id is not None:
+            abandoned = abandoned.filter(ExtractionJob.id == job_id)
+        reaped += abandoned.update({
+            ExtractionJob.status: "failed",
+            ExtractionJob.error_message: "Extraction stopped before finishing; start it again",
+            ExtractionJob.leased_by: None,
+            ExtractionJob.completed_at: now,
+        }, synchronize_session=False)
+    db.commit()
+    return reaped
+
+
+def claim_next_job(db: Session, owner: str) -> ExtractionJob | None:
+    """Lease the oldest runnable job to ``owner``, or return None."""
+    now = datetime.utcnow()
+    reap_expired_jobs(db, inline=False)
+
+    candidates = db.query(ExtractionJob.id).filter(
+        _claimable(now)
+    ).order_by(ExtractionJob.created_at).limit(10).all()
+    for (job_id,) in candidates:
+        job = claim_job(db, job_id, owner)
+        if job is not None:
+            return job
+    return None
+
+
+def claim_job(db: Session, job_id: str, owner: str) -> ExtractionJob | None:
+    """Lease one job to ``owner`` if it is runnable and nobody else won it."""
+    now = datetime.utcnow()
+    claimed = db.query(ExtractionJob).filter(
+        ExtractionJob.id == job_id,
+        _claimable(now),
+    ).update({
+        ExtractionJob.status: "running",
+        ExtractionJob.leased_by: owner,
+        ExtractionJob.lease_expires_at: now + timedelta(seconds=EXTRACTION_LEASE_SECONDS),
+        ExtractionJob.heartbeat_at: now,
+        ExtractionJob.started_at: now,
+        ExtractionJob.attempts: func.coalesce(ExtractionJob.attempts, 0) + 1,
+    }, synchronize_session=False)
+    db.commit()
+    if not claimed:
+        return None
+    return db.query(ExtractionJob).filter(ExtractionJob.id == job_id).first()
+
+
+def renew_lease(db: Session, job_id: str, owner: str) -> bool:
+    now = datetime.utcnow()
+    renewed = db.query(ExtractionJob).filter(
+        ExtractionJob.id == job_id,
+        ExtractionJob.status == "running",
+        ExtractionJob.leased_by == owner,
+    ).update({
+        ExtractionJob.heartbeat_at: now,
+        ExtractionJob.lease_expires_at: now + timedelta(seconds=EXTRACTION_LEASE_SECONDS),
+    }, synchronize_session=False)
+    db.commit()
+    return bool(renewed)
+
+
+class Heartbeat:
+    """Renews a job's lease every third of the lease period while it runs."""
+
+    def __init__(self, job_id: str, owner: str):
+        self.job_id = job_id
+        self.owner = owner
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job_id}", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(EXTRACTION_LEASE_SECONDS / 3):
+            db = SessionLocal()
+            try:
+                if not renew_lease(db, self.job_id, self.owner):
+                    self.lost = True
+                    return
+            except Exception:
+                logger.exception("Heartbeat failed for extraction job %s", self.job_id)
+            finally:
+                db.close()
+
+    def __enter__(self) -> "Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def run_claimed_job(db: Session, job: ExtractionJob, owner: str, process: JobProcessor) -> None:
+    """Run a job leased to ``owner``; on error, requeue it or fail it for good."""
+    job_id = str(job.id)
+
+    with Heartbeat(job_id, owner) as heartbeat:
+        def checkpoint() -> None:
+            db.expire(job, ["leased_by", "status"])
+            if heartbeat.lost or job.leased_by != owner or job.status != "running":
+                raise LeaseLost(job_id)
+
+        try:
+            process(db, job, checkpoint)
+        except LeaseLost:
+            db.rollback()
+            logger.warning("Extraction job %s lease lost; leaving it to its new owner", job_id)
+            return
+        except Exception as exc:
+            db.rollback()
+            logger.exception("Extraction job %s failed on attempt %s", job_id, job.attempts)
+            retry = (job.attempts or 0) < EXTRACTION_MAX_ATTEMPTS
+            job.status = "queued" if retry else "failed"
+            job.error_message = f"Attempt {job.attempts} failed: {type(exc).__name__}"
+            job.leased_by = None
+            job.lease_expires_at = None
+            if not retry:
+                job.completed_at = datetime.utcnow()
+            db.commit()
+            return
+
+    job.leased_by = None
+    job.lease_expires_at = None
+    db.commit()
+
+
+def run_inline(db: Session, job_id: str, process: JobProcessor) -> None:
+    """Run one job to completion, retries included, in the calling process.
+
+    Used when EXTRACTION_EXECUTION is "inline", the default for deployments
+    without a worker.
+    """
+    owner = f"inline:{worker_id()}"
+    while (job := claim_job(db, job_id, owner)) is not None:
+        run_claimed_job(db, job, owner, process)
+
+
+def work(process: JobProcessor, stop: threading.Event | None = None, once: bool = False) -> int:
+    """Claim and run jobs until ``stop`` is set (or the queue is empty, if ``once``)."""
+    owner = worker_id()
+    stop = stop or threading.Event()
+    handled = 0
+    while not stop.is_set():
+        db = SessionLocal()
+        try:
+            job = claim_next_job(db, owner)
+            if job is not None:
+                run_claimed_job(db, job, owner, process)
+                handled += 1
+                continue
+        finally:
+            db.close()
+        if once:
+            break
+        stop.wait(EXTRACTION_POLL_SECONDS)
+    return handled
+
+
+def _worker_process(once: bool) -> None:
+    from .main import run_extraction_job
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    work(run_extraction_job, stop, once)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run HealthDB extraction workers")
+    parser.add_argument("--processes", type=int, default=EXTRACTION_WORKER_PROCESSES)
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    from .artifact_store import ARTIFACT_STORE, artifact_store
+
+    if not artifact_store.shared:
+        # The API would answer every download of this worker's jobs with 410.
+        raise SystemExit(
+            f"ARTIFACT_STORE={ARTIFACT_STORE} writes to {artifact_store.root}, which the API "
+            "cannot read; set ARTIFACT_DIR to a directory both mount, or use ARTIFACT_STORE=database"
+        )
+
+    if args.processes <= 1:
+        _worker_process(args.once)
+        return
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_worker_process, args=(args.once,), name=f"extraction-worker-{n}")
+        for n in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    # Pass shutdown on to the children; each finishes its current job first.
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: [process.terminate() for process in processes])
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""FHIR Bulk Data (``$export``) NDJSON ingestion.
+
+A Bulk Data export is one NDJSON file per resource type, one resource per
+line, and an institutional backfill runs to millions of lines: too many to
+parse and de-identify one after another in the calling process. ``import_ndjson``
+hands the lines to the shared de-identification process pool
+(``deidentify_pool.map_chunks``). Each worker parses its lines with the
+per-resource extractors of api/fhir_ingest.py, scrubs and verifies the
+records, and returns rows ready to insert. Results come back in input order
+and are written in batches by ``MedicalDataWriter`` under one
+MedicalRecordConnection.
+
+Imports are all or nothing. A line that is not a JSON resource raises
+``BulkImportError``, and a record with residual identifiers raises
+``ResidualIdentifiersFound``. Either way the caller rolls back.
+
+An import holds one patient's records. Bulk exports at system or group
+level mix patients, so every resource's patient (the Patient resource's own
+id, or its ``subject`` / ``patient`` reference) must be the same one: the
+first seen, or the one given as ``patient_reference``. A resource of any
+other patient raises ``BulkImportError`` rather than being merged into the
+connection's patient. Run an import from the command line with::
+
+    python -m api.fhir_bulk --patient-id <profile id> [--fhir-patient Patient/<id>] Condition.ndjson Observation.ndjson
+"""
+
+import argparse
+from datetime import datetime
+import json
+import logging
+import os
+from typing import IO, Iterable, Iterator
+
+from sqlalchemy.orm import Session
+
+from .deidentification import deidentify_record, find_residual_identifiers
+from .deidentify_pool import DeidentifyPool, deidentify_pool
+from .fhir_ingest import fhir_original_date, parse_fhir_resource
+from .fhir_stream import FHIR_STREAM_MAX_ENTRY_BYTES
+from .medical_data_writer import MedicalDataWriter
+from .models import Consent, MedicalRecordConnection, PatientProfile
+
+
+logger = logging.getLogger("healthdb.fhir_bulk")
+
+# Per-line outcomes reported by the workers.
+_OK, _INVALID, _RESIDUAL = "ok", "invalid", "residual"
+
+
+class BulkImportError(ValueError):
+    """An NDJSON line is not a FHIR resource."""
+
+
+class ResidualIdentifiersFound(Exception):
+    """A record still contained identifiers after de-identification."""
+
+
+def ndjson_lines(
+    stream: IO[bytes], source: str, max_line_bytes: int = FHIR_STREAM_MAX_ENTRY_BYTES
+) -> Iterator[tuple[str, int, bytes]]:
+    """``(source, line number, line)`` for each non-blank line of ``stream``."""
+    for number, line in enumerate(iter(lambda: stream.readline(max_line_bytes + 1), b""), 1):
+        if len(line) > max_line_bytes:
+            raise BulkImportError(f"{source} line {number} exceeds {max_line_bytes} bytes")
+        if line.strip():
+            yield source, number, line
+
+
+def _patient_reference(resource: dict) -> str | None:
+    """The ``Patient/<id>`` a resource belongs to, if it names one."""
+    if resource["resourceType"] == "Patient":
+        return f"Patient/{resource['id']}" if isinstance(resource.get("id"), str) else None
+    for key in ("subject", "patient"):
+        reference = resource.get(key)
+        reference = reference.get("reference") if isinstance(reference, dict) else None
+        if isinstance(reference, str) and reference:
+            # Absolute references end in the same "Patient/<id>".
+            return "/".join(reference.rstrip("/").split("/")[-2:]) if "Patient/" in reference else reference
+    return None
+
+
+def parse_ndjson_lines(lines: list[bytes]) -> list[tuple[str, str | None, list[dict]]]:
+    """Parse, scrub and verify NDJSON lines; one ``(outcome, patient, rows)`` per line.
+
+    Runs in the pool's worker processes.
+    """
+    results = []
+    for line in lines:
+        try:
+            resource = json.loads(line)
+        except ValueError:
+            results.append((_INVALID, None, []))
+            continue
+        if not isinstance(resource, dict) or not isinstance(resource.get("resourceType"), str):
+            results.append((_INVALID, None, []))
+            continue
+        patient = _patient_reference(resource)
+        rows = []
+        for record in parse_fhir_resource(resource):
+            scrubbed_data = deidentify_record(record["data"])
+            if find_residual_identifiers(scrubbed_data):
+                results.append((_RESIDUAL, patient, []))
+                break
+            rows.append({
+                "data_category": record["data_category"],
+                "data_type": record["data_type"],
+                "original_date": fhir_original_date(record.get("original_date")),
+                "deidentified_data": scrubbed_data,
+            })
+        else:
+            results.append((_OK, patient, rows))
+    return results
+
+
+def import_ndjson(
+    db: Session,
+    connection: MedicalRecordConnection,
+    lines: Iterable[tuple[str, int, bytes]],
+    pool: DeidentifyPool = deidentify_pool,
+    patient_reference: str | None = None,
+) -> tuple[int, int]:
+    """Insert the records of ``lines`` under ``connection``.
+
+    ``patient_reference`` (``Patient/<id>``) is the FHIR patient the lines
+    must belong to; by default, the first one they name. Returns the number
+    of records stored and the number skipped as already held by the patient.
+    Does not commit.
+    """
+    writer = MedicalDataWriter(db, connection.id, connection.patient_id)
+    for (source, number, _), (outcome, patient, rows) in pool.map_chunks(
+        parse_ndjson_lines, lines, lambda item: item[2]
+    ):
+        if outcome == _INVALID:
+            raise BulkImportError(f"{source} line {number} is not a FHIR resource")
+        if patient is not None:
+            if patient_reference is None:
+                patient_reference = patient
+            elif patient != patient_reference:
+                # Patient ids can be medical record numbers: not echoed back.
+                raise BulkImportError(
+                    f"{source} line {number} belongs to a different patient; "
+                    "import one patient's records at a time"
+                )
+        if outcome == _RESIDUAL:
+            raise ResidualIdentifiersFound(f"{source} line {number}")
+        for row in rows:
+            writer.add(**row)
+    writer.finish()
+    return writer.written, writer.skipped
+
+
+def main(argv: list[str] | None = None) -> None:
+    # Imported here: the pool's worker processes import this module and
+    # need no database engine.
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Import FHIR Bulk Data NDJSON files for one patient.")
+    parser.add_argument("files", nargs="+", help="NDJSON files, one FHIR resource per line")
+    parser.add_argument("--patient-id", required=True, help="PatientProfile id the records belong to")
+    parser.add_argument("--fhir-patient", help="FHIR Patient/<id> the files must belong to (default: the first named)")
+    parser.add_argument("--source-name", default="FHIR Bulk Data export")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    db = SessionLocal()
+    try:
+        if db.query(PatientProfile).filter(PatientProfile.id == args.patient_id).first() is None:
+            raise SystemExit(f"Patient profile {args.patient_id} not found")
+        if db.query(Consent).filter(
+            Consent.patient_id == args.patient_id,
+            Consent.consent_type == "research_data_sharing",
+            Consent.status == "active",
+        ).first() is None:
+            raise SystemExit("The patient has no active Research Data Sharing consent")
+
+        connection = MedicalRecordConnection(
+            patient_id=args.patient_id,
+            source_type="fhir_bulk",
+            source_name=args.source_name,
+            connection_status="connected",
+            last_sync=datetime.utcnow(),
+        )
+        db.add(connection)
+        db.commit()
+
+        def lines():
+            for path in args.files:
+                with open(path, "rb") as stream:
+                    yield from ndjson_lines(stream, os.path.basename(path))
+
+        try:
+            imported, skipped = import_ndjson(db, connection, lines(), patient_reference=args.fhir_patient)
+        except (BulkImportError, ResidualIdentifiersFound) as exc:
+            db.rollback()
+            connection.connection_status = "error"
+            connection.error_message = f"Import rejected: {exc}"
+            connection.records_synced = 0
+            db.commit()
+            raise SystemExit(f"Import rejected, nothing was stored: {exc}")
+        if imported:
+            connection.records_synced = imported
+        else:
+            db.delete(connection)  # nothing new: no empty connection for the patient
+        db.commit()
+        logger.info(
+            "Imported %d records into connection %s; %d were already on file",
+            imported, connection.id if imported else "(none)", skipped,
+        )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
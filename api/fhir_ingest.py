@@ -2,10 +2,15 @@
 
 Only the explicitly supported clinical fields are copied from the bundle. Direct
 identifiers and raw birth dates are never included in the returned data payloads.
+
+Each supported resourceType has one extractor, registered with ``_extractor``;
+``parse_fhir_resource`` dispatches to it with a single dictionary lookup, so
+supporting another type adds no cost to the existing ones.
 """
 
 from datetime import date, datetime
 import re
+from typing import Any, Callable, Iterator
 
 
 _FHIR_DATE_RE = re.compile(
@@ -77,50 +82,46 @@ def _year(date_str) -> int | None:
     return int(match.group(1)) if match else None
 
 
-def _coding_text(codeable_concept) -> str | None:
-    """Return the best available human label from a CodeableConcept."""
-    if not isinstance(codeable_concept, dict):
-        return None
-
-    text = codeable_concept.get("text")
-    if text not in (None, ""):
-        return str(text)
+def _concept(codeable_concept) -> tuple[str | None, str | None, str | None]:
+    """Return a CodeableConcept's label, first code and coding-system label.
 
-    codings = codeable_concept.get("coding")
-    if not isinstance(codings, list):
-        return None
-    for coding in codings:
-        if not isinstance(coding, dict):
-            continue
-        display = coding.get("display")
-        if display not in (None, ""):
-            return str(display)
-    for coding in codings:
-        if not isinstance(coding, dict):
-            continue
-        code = coding.get("code")
-        if code not in (None, ""):
-            return str(code)
-    return None
-
-
-def _coding_code(codeable_concept) -> tuple[str | None, str | None]:
-    """Return the first coding's code and normalized coding-system label."""
+    The label is the concept's text, else the first coding display, else the
+    first coding code; the code and system come from the first coding. All
+    three are read in one walk over ``coding``.
+    """
     if not isinstance(codeable_concept, dict):
-        return None, None
+        return None, None, None
+
+    first = display = any_code = None
     codings = codeable_concept.get("coding")
-    if not isinstance(codings, list):
-        return None, None
+    if isinstance(codings, list):
+        for coding in codings:
+            if not isinstance(coding, dict):
+                continue
+            if first is None:
+                first = coding
+            value = coding.get("display")
+            if value not in (None, ""):
+                display = str(value)
+                break
+            if any_code is None:
+                value = coding.get("code")
+                if value not in (None, ""):
+                    any_code = str(value)
 
-    first = next((item for item in codings if isinstance(item, dict)), None)
+    text = codeable_concept.get("text")
+    label = str(text) if text not in (None, "") else display or any_code
     if first is None:
-        return None, None
+        return label, None, None
     code = first.get("code")
     system = first.get("system")
     normalized_code = str(code) if code not in (None, "") else None
     normalized_system = str(system) if system not in (None, "") else None
-    system_label = _SYSTEM_LABELS.get(normalized_system, normalized_system)
-    return normalized_code, system_label
+    return label, normalized_code, _SYSTEM_LABELS.get(normalized_system, normalized_system)
+
+
+def _label(codeable_concept) -> str | None:
+    return _concept(codeable_concept)[0]
 
 
 def _dict(value):
@@ -128,11 +129,16 @@ def _dict(value):
     return value if isinstance(value, dict) else {}
 
 
+def _list(value):
+    """Return a list value or an empty list for malformed FHIR fields."""
+    return value if isinstance(value, list) else []
+
+
 def _first_interpretation(resource):
     interpretations = resource.get("interpretation")
     if not isinstance(interpretations, list) or not interpretations:
         return None
-    return _coding_text(interpretations[0])
+    return _label(interpretations[0])
 
 
 def _extension_display(resource, extension_name):
@@ -162,6 +168,23 @@ def _extension_display(resource, extension_name):
     return None
 
 
+def fhir_original_date(value) -> date | None:
+    """Convert a FHIR date/dateTime to a Date, padding partial dates safely."""
+    if not isinstance(value, str):
+        return None
+    match = _FHIR_DATE_RE.match(value.strip())
+    if not match:
+        return None
+    try:
+        return date(
+            int(match.group("year")),
+            int(match.group("month") or 1),
+            int(match.group("day") or 1),
+        )
+    except ValueError:
+        return None
+
+
 def _record(data_category, data_type, original_date, data):
     return {
         "data_category": data_category,
@@ -171,6 +194,210 @@ def _record(data_category, data_type, original_date, data):
     }
 
 
+# resourceType -> extractor yielding that resource's records.
+_EXTRACTORS: dict[str, Callable[[dict, Any], Iterator[dict]]] = {}
+
+
+def _extractor(*resource_types: str):
+    """Register a record extractor for ``resource_types``."""
+    def register(extract):
+        for resource_type in resource_types:
+            _EXTRACTORS[resource_type] = extract
+        return extract
+    return register
+
+
+@_extractor("Patient")
+def _patient(resource, ref_date):
+    data = {
+        "age_band": _age_band(resource.get("birthDate"), ref_date),
+        "sex": resource.get("gender"),
+        "race": _extension_display(resource, "us-core-race"),
+        "ethnicity": _extension_display(resource, "us-core-ethnicity"),
+        "deceased": bool(resource.get("deceasedBoolean"))
+        if resource.get("deceasedBoolean")
+        else None,
+    }
+    yield _record("demographics", "patient", None, data)
+
+    # Vital status as a de-identified outcome (death year only, never
+    # a full death date). Emitted only when the bundle states it.
+    deceased_datetime = resource.get("deceasedDateTime")
+    if isinstance(deceased_datetime, str) and deceased_datetime.strip():
+        yield _record("outcome", "vital_status", deceased_datetime, {
+            "vital_status": "Deceased",
+            "death_year": _year(deceased_datetime),
+        })
+    elif resource.get("deceasedBoolean") is True:
+        yield _record("outcome", "vital_status", None, {
+            "vital_status": "Deceased",
+            "death_year": None,
+        })
+    elif resource.get("deceasedBoolean") is False:
+        yield _record("outcome", "vital_status", None, {
+            "vital_status": "Alive",
+            "death_year": None,
+        })
+
+
+@_extractor("Condition")
+def _condition(resource, ref_date):
+    display, code, code_system = _concept(resource.get("code"))
+    onset_period = _dict(resource.get("onsetPeriod"))
+    onset = (
+        resource.get("onsetDateTime")
+        or onset_period.get("start")
+        or resource.get("recordedDate")
+    )
+    data = {
+        "code": code,
+        "code_system": code_system,
+        "display": display,
+        "clinical_status": _label(resource.get("clinicalStatus")),
+        "diagnosis_year": _year(onset),
+    }
+    yield _record("diagnosis", "condition", onset, data)
+
+
+@_extractor("Observation")
+def _observation(resource, ref_date):
+    test, code, code_system = _concept(resource.get("code"))
+    effective_period = _dict(resource.get("effectivePeriod"))
+    effective = (
+        resource.get("effectiveDateTime")
+        or effective_period.get("start")
+        or resource.get("issued")
+    )
+    value_quantity = _dict(resource.get("valueQuantity"))
+    data = {
+        "code": code,
+        "code_system": code_system,
+        "test": test,
+        "value": value_quantity.get("value"),
+        "unit": value_quantity.get("unit"),
+        "value_string": resource.get("valueString"),
+        "interpretation": _first_interpretation(resource),
+        "year": _year(effective),
+    }
+    yield _record("lab_results", test or "observation", effective, data)
+
+
+@_extractor("MedicationRequest", "MedicationStatement")
+def _medication(resource, ref_date):
+    medication, code, code_system = _concept(resource.get("medicationCodeableConcept"))
+    effective_period = _dict(resource.get("effectivePeriod"))
+    start = (
+        resource.get("authoredOn")
+        or resource.get("effectiveDateTime")
+        or effective_period.get("start")
+    )
+    data = {
+        "medication": medication,
+        "code": code,
+        "code_system": code_system,
+        "status": resource.get("status"),
+        "start_year": _year(start),
+    }
+    yield _record("treatment", "medication", start, data)
+
+
+@_extractor("Procedure")
+def _procedure(resource, ref_date):
+    procedure, code, code_system = _concept(resource.get("code"))
+    performed_period = _dict(resource.get("performedPeriod"))
+    performed = (
+        resource.get("performedDateTime")
+        or performed_period.get("start")
+    )
+    data = {
+        "procedure": procedure,
+        "code": code,
+        "code_system": code_system,
+        "status": resource.get("status"),
+        "year": _year(performed),
+    }
+    yield _record("treatment", "procedure", performed, data)
+
+
+@_extractor("DiagnosticReport")
+def _diagnostic_report(resource, ref_date):
+    report, code, code_system = _concept(resource.get("code"))
+    categories = [_concept(item) for item in _list(resource.get("category"))]
+    effective_period = _dict(resource.get("effectivePeriod"))
+    effective = (
+        resource.get("effectiveDateTime")
+        or effective_period.get("start")
+        or resource.get("issued")
+    )
+    # Only coded conclusions: the free-text ``conclusion`` and attached report
+    # documents are narrative and are never copied.
+    data = {
+        "report": report,
+        "code": code,
+        "code_system": code_system,
+        "category": categories[0][0] if categories else None,
+        "status": resource.get("status"),
+        "conclusions": [
+            label for label in (_label(item) for item in _list(resource.get("conclusionCode")))
+            if label is not None
+        ],
+        "year": _year(effective),
+    }
+    is_imaging = any(category_code == "RAD" for _, category_code, _ in categories)
+    yield _record("imaging" if is_imaging else "lab_results", "diagnostic_report", effective, data)
+
+
+@_extractor("AllergyIntolerance")
+def _allergy_intolerance(resource, ref_date):
+    substance, code, code_system = _concept(resource.get("code"))
+    onset_period = _dict(resource.get("onsetPeriod"))
+    onset = (
+        resource.get("onsetDateTime")
+        or onset_period.get("start")
+        or resource.get("recordedDate")
+    )
+    manifestations = []
+    for reaction in _list(resource.get("reaction")):
+        for manifestation in _list(_dict(reaction).get("manifestation")):
+            label = _label(manifestation)
+            if label is not None and label not in manifestations:
+                manifestations.append(label)
+    allergy_type = resource.get("type") if resource.get("type") in ("allergy", "intolerance") else None
+    data = {
+        "substance": substance,
+        "code": code,
+        "code_system": code_system,
+        "type": allergy_type,
+        "categories": [item for item in _list(resource.get("category")) if isinstance(item, str)],
+        "criticality": resource.get("criticality"),
+        "clinical_status": _label(resource.get("clinicalStatus")),
+        "reactions": manifestations,
+        "onset_year": _year(onset),
+    }
+    yield _record("allergy", allergy_type or "allergy", onset, data)
+
+
+def parse_fhir_resource(resource: dict, ref_date=None) -> list[dict]:
+    """Records for one FHIR resource; empty if it is unsupported or malformed.
+
+    A malformed field ends the resource's extraction but keeps the records
+    already extracted from it.
+    """
+    if not isinstance(resource, dict):
+        return []
+    resource_type = resource.get("resourceType")
+    extract = _EXTRACTORS.get(resource_type) if isinstance(resource_type, str) else None
+    if extract is None:
+        return []
+    records = []
+    try:
+        for record in extract(resource, ref_date):
+            records.append(record)
+    except Exception:
+        pass
+    return records
+
+
 def parse_fhir_bundle(bundle: dict, ref_date=None) -> list[dict]:
     """Parse supported FHIR R4 resources into minimal clinical record dicts.
 
@@ -184,134 +411,8 @@ def parse_fhir_bundle(bundle: dict, ref_date=None) -> list[dict]:
     if not isinstance(entries, list):
         return []
 
-    patients = {}
-    for entry in entries:
-        if not isinstance(entry, dict):
-            continue
-        resource = entry.get("resource")
-        if not isinstance(resource, dict) or resource.get("resourceType") != "Patient":
-            continue
-        patient_id = resource.get("id")
-        if isinstance(patient_id, str):
-            patients[patient_id] = resource
-
     records = []
     for entry in entries:
-        try:
-            if not isinstance(entry, dict):
-                continue
-            resource = entry.get("resource")
-            if not isinstance(resource, dict):
-                continue
-            resource_type = resource.get("resourceType")
-
-            if resource_type == "Patient":
-                data = {
-                    "age_band": _age_band(resource.get("birthDate"), ref_date),
-                    "sex": resource.get("gender"),
-                    "race": _extension_display(resource, "us-core-race"),
-                    "ethnicity": _extension_display(resource, "us-core-ethnicity"),
-                    "deceased": bool(resource.get("deceasedBoolean"))
-                    if resource.get("deceasedBoolean")
-                    else None,
-                }
-                records.append(_record("demographics", "patient", None, data))
-
-                # Vital status as a de-identified outcome (death year only, never
-                # a full death date). Emitted only when the bundle states it.
-                deceased_datetime = resource.get("deceasedDateTime")
-                if isinstance(deceased_datetime, str) and deceased_datetime.strip():
-                    records.append(_record("outcome", "vital_status", deceased_datetime, {
-                        "vital_status": "Deceased",
-                        "death_year": _year(deceased_datetime),
-                    }))
-                elif resource.get("deceasedBoolean") is True:
-                    records.append(_record("outcome", "vital_status", None, {
-                        "vital_status": "Deceased",
-                        "death_year": None,
-                    }))
-                elif resource.get("deceasedBoolean") is False:
-                    records.append(_record("outcome", "vital_status", None, {
-                        "vital_status": "Alive",
-                        "death_year": None,
-                    }))
-
-            elif resource_type == "Condition":
-                code_concept = resource.get("code")
-                code, code_system = _coding_code(code_concept)
-                onset_period = _dict(resource.get("onsetPeriod"))
-                onset = (
-                    resource.get("onsetDateTime")
-                    or onset_period.get("start")
-                    or resource.get("recordedDate")
-                )
-                data = {
-                    "code": code,
-                    "code_system": code_system,
-                    "display": _coding_text(code_concept),
-                    "clinical_status": _coding_text(resource.get("clinicalStatus")),
-                    "diagnosis_year": _year(onset),
-                }
-                records.append(_record("diagnosis", "condition", onset, data))
-
-            elif resource_type == "Observation":
-                code_concept = resource.get("code")
-                code, code_system = _coding_code(code_concept)
-                effective_period = _dict(resource.get("effectivePeriod"))
-                effective = (
-                    resource.get("effectiveDateTime")
-                    or effective_period.get("start")
-                    or resource.get("issued")
-                )
-                value_quantity = _dict(resource.get("valueQuantity"))
-                data_type = _coding_text(code_concept) or "observation"
-                data = {
-                    "code": code,
-                    "code_system": code_system,
-                    "test": _coding_text(code_concept),
-                    "value": value_quantity.get("value"),
-                    "unit": value_quantity.get("unit"),
-                    "value_string": resource.get("valueString"),
-                    "interpretation": _first_interpretation(resource),
-                    "year": _year(effective),
-                }
-                records.append(_record("lab_results", data_type, effective, data))
-
-            elif resource_type in ("MedicationRequest", "MedicationStatement"):
-                medication = resource.get("medicationCodeableConcept")
-                code, code_system = _coding_code(medication)
-                effective_period = _dict(resource.get("effectivePeriod"))
-                start = (
-                    resource.get("authoredOn")
-                    or resource.get("effectiveDateTime")
-                    or effective_period.get("start")
-                )
-                data = {
-                    "medication": _coding_text(medication),
-                    "code": code,
-                    "code_system": code_system,
-                    "status": resource.get("status"),
-                    "start_year": _year(start),
-                }
-                records.append(_record("treatment", "medication", start, data))
-
-            elif resource_type == "Procedure":
-                code_concept = resource.get("code")
-                code, code_system = _coding_code(code_concept)
-                performed_period = _dict(resource.get("performedPeriod"))
-                performed = (
-                    resource.get("performedDateTime")
-                    or performed_period.get("start")
-                )
-                data = {
-                    "procedure": _coding_text(code_concept),
-                    "code": code,
-                    "code_system": code_system,
-                    "status": resource.get("status"),
-                    "year": _year(performed),
-                }
-                records.append(_record("treatment", "procedure", performed, data))
-        except Exception:
-            continue
-
+        if isinstance(entry, dict):
+            records.extend(parse_fhir_resource(entry.get("resource"), ref_date))
     return records
@@ -0,0 +1,191 @@
+"""Incremental parsing of FHIR Bundles from a request body.
+
+Patient portal exports can run to hundreds of megabytes, too large to decode
+as one JSON document. ``BundleEntryStream`` is fed the raw body chunk by
+chunk and returns each ``entry[].resource`` as soon as its closing brace
+has arrived, so only one entry (plus one read chunk) is held at a time. It uses
+the standard library decoder (``json.JSONDecoder.raw_decode``) one value at
+a time rather than a character-level tokenizer.
+
+Top-level members other than ``entry`` are decoded and dropped, except
+``resourceType``, which must be ``"Bundle"``. An entry (or any other
+top-level value) larger than ``FHIR_STREAM_MAX_ENTRY_BYTES`` is rejected,
+which also bounds what a malformed body can make the parser buffer.
+"""
+
+import codecs
+import json
+import os
+import re
+from typing import Any, Iterator
+
+
+FHIR_STREAM_MAX_ENTRY_BYTES = int(os.environ.get("FHIR_STREAM_MAX_ENTRY_BYTES", str(16 * 1024 * 1024)))
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+# Characters that can follow a complete JSON number inside a longer one.
+_NUMBER_CONTINUATIONS = frozenset(".eE+-")
+
+# Parser states: what the next token should be.
+_OBJECT_START, _KEY, _COLON, _VALUE, _MEMBER_END, _ENTRIES, _ENTRY, _ENTRY_END, _DONE = range(9)
+
+
+class BundleStreamError(ValueError):
+    """The body is not a well-formed FHIR Bundle."""
+
+
+class _Incomplete(Exception):
+    """More input is needed before the next token can be decoded."""
+
+
+class BundleEntryStream:
+    """Push parser: ``feed`` body chunks, then ``close``; both return resources."""
+
+    def __init__(self, max_entry_bytes: int = FHIR_STREAM_MAX_ENTRY_BYTES):
+        self.max_entry_bytes = max_entry_bytes
+        self.resource_type: str | None = None
+        self.entry_count = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._state = _OBJECT_START
+        self._key: str | None = None
+        self._final = False
+        # Unparsed characters a pending value needs before it is decoded
+        # again; doubling on every miss keeps large entries linear to parse.
+        self._retry_at = 0
+
+    def feed(self, data: bytes) -> list[dict]:
+        """Resources of the entries completed by ``data``."""
+        self._append(data)
+        return list(self._drain())
+
+    def close(self) -> list[dict]:
+        """Resources of the last entries; checks that the Bundle ended properly."""
+        self._final = True
+        self._retry_at = 0
+        self._append(b"")
+        resources = list(self._drain())
+        if self._state != _DONE:
+            raise BundleStreamError("Bundle JSON ended unexpectedly")
+        if self.resource_type != "Bundle":
+            raise BundleStreamError("Not a valid FHIR Bundle")
+        return resources
+
+    def _append(self, data: bytes) -> None:
+        try:
+            text = self._decoder.decode(data, final=self._final)
+        except UnicodeDecodeError as exc:
+            raise BundleStreamError("Body is not UTF-8 encoded JSON") from exc
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+
+    def _drain(self) -> Iterator[dict]:
+        if len(self._buffer) - self._pos < self._retry_at:
+            return
+        while self._state != _DONE:
+            try:
+                resource = self._step()
+            except _Incomplete:
+                if self._final:
+                    raise BundleStreamError("Bundle JSON ended unexpectedly")
+                pending = len(self._buffer) - self._pos
+                if pending > self.max_entry_bytes:
+                    raise BundleStreamError(
+                        f"Bundle entry exceeds {self.max_entry_bytes} bytes or is malformed"
+                    )
+                self._retry_at = 2 * pending + 1
+                return
+            self._retry_at = 0
+            if resource is not None:
+                yield resource
+        if self._buffer[self._pos:].strip():
+            raise BundleStreamError("Unexpected data after the Bundle")
+
+    def _skip_whitespace(self) -> str:
+        self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+        if self._pos >= len(self._buffer):
+            raise _Incomplete
+        return self._buffer[self._pos]
+
+    def _expect(self, char: str) -> None:
+        if self._skip_whitespace() != char:
+            raise BundleStreamError(f"Malformed Bundle JSON: expected {char!r}")
+        self._pos += 1
+
+    def _value(self) -> Any:
+        self._skip_whitespace()
+        try:
+            value, end = _DECODER.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError as exc:
+            if self._final:
+                raise BundleStreamError(f"Malformed Bundle JSON: {exc.msg}") from exc
+            raise _Incomplete
+        # A number may continue in the next chunk, including when what has
+        # arrived is a shorter number ("12" of "12.5", "1" of "1e-3").
+        if not self._final and isinstance(value, (int, float)) and (
+            end == len(self._buffer) or self._buffer[end] in _NUMBER_CONTINUATIONS
+        ):
+            raise _Incomplete
+        self._pos = end
+        return value
+
+    def _step(self) -> dict | None:
+        """Consume one token; return a resource when an entry completes."""
+        state = self._state
+        if state == _OBJECT_START:
+            self._expect("{")
+            self._state = _KEY
+        elif state == _KEY:
+            if self._skip_whitespace() == "}":
+                self._pos += 1
+                self._state = _DONE
+                return None
+            key = self._value()
+            if not isinstance(key, str):
+                raise BundleStreamError("Malformed Bundle JSON: expected a member name")
+            self._key = key
+            self._state = _COLON
+        elif state == _COLON:
+            self._expect(":")
+            self._state = _ENTRIES if self._key == "entry" else _VALUE
+        elif state == _VALUE:
+            value = self._value()
+            if self._key == "resourceType":
+                if value != "Bundle":
+                    raise BundleStreamError("Not a valid FHIR Bundle")
+                self.resource_type = value
+            self._state = _MEMBER_END
+        elif state == _MEMBER_END:
+            char = self._skip_whitespace()
+            self._pos += 1
+            if char == ",":
+                self._state = _KEY
+            elif char == "}":
+                self._state = _DONE
+            else:
+                raise BundleStreamError("Malformed Bundle JSON: expected ',' or a closing bracket")
+        elif state == _ENTRIES:
+            self._expect("[")
+            self._state = _ENTRY
+        elif state == _ENTRY:
+            if self._skip_whitespace() == "]":
+                self._pos += 1
+                self._state = _MEMBER_END
+                return None
+            entry = self._value()
+            self._state = _ENTRY_END
+            self.entry_count += 1
+            resource = entry.get("resource") if isinstance(entry, dict) else None
+            return resource if isinstance(resource, dict) else None
+        elif state == _ENTRY_END:
+            char = self._skip_whitespace()
+            self._pos += 1
+            if char == ",":
+                self._state = _ENTRY
+            elif char == "]":
+                self._state = _MEMBER_END
+            else:
+                raise BundleStreamError("Malformed Bundle JSON: expected ',' or a closing bracket")
+        return None
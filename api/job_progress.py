@@ -0,0 +1,125 @@
+"""Live progress for extraction jobs, pushed to clients as Server-Sent Events.
+
+``process_extraction_job`` commits a job's stage, progress and rows written
+after every participant chunk and ``publish``es the same snapshot to
+``extraction_progress``, an in-process hub. ``event_stream`` turns one
+job's snapshots into an SSE stream: events published in this process (inline
+execution) are forwarded as they happen; for jobs run by a separate worker
+process, the stream re-reads that single job row by primary key every
+``EXTRACTION_PROGRESS_POLL_SECONDS`` instead. Either way clients stop
+re-running the jobs listing, which joins across owned and collaborator
+studies, just to watch one job.
+
+Subscribers only keep the latest snapshot, so a slow client skips
+intermediate events instead of buffering them. The stream ends once the job
+reaches a final status.
+"""
+
+import asyncio
+from contextlib import contextmanager
+import json
+import os
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Iterator
+
+
+EXTRACTION_PROGRESS_POLL_SECONDS = float(os.environ.get("EXTRACTION_PROGRESS_POLL_SECONDS", "2"))
+# Comment lines keep idle connections open through proxies.
+EXTRACTION_PROGRESS_KEEPALIVE_SECONDS = 15.0
+
+FINAL_STATUSES = frozenset({"completed", "failed", "cancelled"})
+
+
+class _Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._latest: dict | None = None
+        self._ready = asyncio.Event()
+
+    def _push(self, snapshot: dict) -> None:
+        self._latest = snapshot
+        self._ready.set()
+
+    def deliver(self, snapshot: dict) -> None:
+        """Thread-safe: hand ``snapshot`` to the subscriber's event loop."""
+        try:
+            self._loop.call_soon_threadsafe(self._push, snapshot)
+        except RuntimeError:
+            pass  # loop closed; the stream is gone
+
+    async def next(self, timeout: float) -> dict | None:
+        """The newest snapshot published since the last call, or None on timeout."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._ready.clear()
+        return self._latest
+
+
+class ProgressHub:
+    """Per-job fan-out of progress snapshots to the streams of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: dict[str, set[_Subscription]] = {}
+
+    @contextmanager
+    def subscribe(self, job_id: str) -> Iterator[_Subscription]:
+        subscription = _Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(job_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[job_id]
+
+    def publish(self, job_id: str, snapshot: dict) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(job_id, ()))
+        for subscription in subscribers:
+            subscription.deliver(snapshot)
+
+
+extraction_progress = ProgressHub()
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def event_stream(
+    job_id: str,
+    load: Callable[[], Awaitable[dict | None]],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    hub: ProgressHub = extraction_progress,
+) -> AsyncIterator[str]:
+    """SSE ``progress`` events for one job until it finishes.
+
+    ``load`` reads the job's current snapshot from the database (None once
+    the job is gone).
+    """
+    with hub.subscribe(job_id) as subscription:
+        snapshot = await load()
+        last = None
+        idle = 0.0
+        while snapshot is not None:
+            if snapshot != last:
+                yield _sse("progress", snapshot)
+                last = snapshot
+                idle = 0.0
+            if snapshot.get("status") in FINAL_STATUSES or await is_disconnected():
+                return
+            published = await subscription.next(EXTRACTION_PROGRESS_POLL_SECONDS)
+            if published is None:
+                idle += EXTRACTION_PROGRESS_POLL_SECONDS
+                if idle >= EXTRACTION_PROGRESS_KEEPALIVE_SECONDS:
+                    yield ": keepalive\n\n"
+                    idle = 0.0
+                published = await load()
+            snapshot = published
@@ -4,10 +4,13 @@ Main application entry point with real database integration
 """
 from fastapi import FastAPI, HTTPException, Depends, status, Query, BackgroundTasks, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Collection, Tuple
+from contextlib import nullcontext
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 from uuid import UUID
@@ -16,9 +19,9 @@ import os
 import csv
 import hashlib
 import hmac
-import io
 import json
 import secrets
+import tempfile
 from jose import jwt
 from jose.exceptions import ExpiredSignatureError, JWTError
 import re
@@ -36,10 +39,10 @@ PBKDF2_ITERATIONS = 600_000
 from sqlalchemy.orm import Session
 
 from sqlalchemy import text, func, or_
-from .database import get_db, init_db, engine
+from .database import get_db, get_db_session, init_db, engine
 from .models import (
     Base, User, PatientProfile, Consent, ConsentTemplate,
-    CancerDiagnosis, Treatment, DataProduct, DataAccessLog, ResearchCohort,
+    CancerDiagnosis, Treatment, DataProduct, ResearchCohort, CohortJob,
     MedicalRecordConnection, ExtractedMedicalData, RewardsTransaction,
     Study, RegulatorySubmission, ExtractionJob, EMRConnection, Institution,
     StudyCollaborator, StudyDocument, StudyComment, DiseaseVariableSet,
@@ -50,7 +53,34 @@ from .repositories import (
     CohortRepository, DataProductRepository, DataAccessLogRepository
 )
 from .deidentification import deidentify_record, find_residual_identifiers
-from .fhir_ingest import parse_fhir_bundle
+from .fhir_ingest import fhir_original_date, parse_fhir_bundle, parse_fhir_resource
+from .fhir_stream import BundleEntryStream, BundleStreamError
+from .fhir_bulk import BulkImportError, ResidualIdentifiersFound, import_ndjson, ndjson_lines
+from .medical_data_writer import MedicalDataWriter
+from .artifact_store import Artifact, artifact_store, parse_byte_range
+from .cohort_index import ANALYTICS_KINDS, cohort_index, newest_record
+from .cohort_jobs import JobCancelled, cohort_job_runner, fail_stale_jobs, is_stale
+from .deidentify_pool import deidentify_pool
+from .extraction_delta import (
+    copy_participants, delta_filter, delta_key, drop_superseded_participants, inherit_window_records,
+    job_watermark, latest_completed_job, participant_totals, record_participants, record_window_records,
+    removed_participants, window_start,
+)
+from .extraction_checkpoint import (
+    clear_progress, open_artifact, participant_chunks, restart, save_checkpoint,
+)
+from .extraction_projection import Projection, anywhere_categories, is_empty
+from . import export_cache
+from .columnar_export import COLUMNAR_FORMATS, ColumnarSpool, columnar_available
+from .extraction_worker import is_reapable, reap_expired_jobs, run_inline
+from .cohort_query import run_cohort_query
+from .consent_scope import (
+    consent_granted, consent_revoked, consent_scope, consented_patient_query,
+    study_participant_query,
+)
+from .record_stream import PAYLOAD_TEXT, record_query, through_watermark
+from .result_cache import cohort_result_cache, criteria_key
+from .job_progress import event_stream, extraction_progress
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -74,7 +104,8 @@ app.add_middleware(
     allow_origins=allowed_origins,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH"],
-    allow_headers=["Authorization", "Content-Type"],
+    allow_headers=["Authorization", "Content-Type", "Cache-Control", "Range", "If-Range"],
+    expose_headers=["X-Cache", "Content-Range", "ETag", "Digest", "X-Checksum-SHA256"],
 )
 
 
@@ -120,6 +151,25 @@ JWT_ALGORITHM = "HS256"
 # hidden to prevent re-identification. Lower via env for demos/small datasets.
 MIN_AGGREGATE_CELL_SIZE = int(os.environ.get("MIN_AGGREGATE_CELL_SIZE", "11"))
 
+# Where cohort criteria are evaluated: "index" (the in-process cohort index) or
+# "sql" (one compiled query over the JSON payloads, no warm index needed).
+COHORT_QUERY_ENGINE = os.environ.get("COHORT_QUERY_ENGINE", "index")
+
+# Where extraction jobs run: "inline" (inside the creating request) unless a
+# deployment runs `python -m api.extraction_worker` and sets "queue"; a queued
+# job with no worker would never start.
+EXTRACTION_EXECUTION = os.environ.get("EXTRACTION_EXECUTION", "inline")
+
+# Upper bound on criteria sets evaluated by one /api/cohort/build-batch call.
+COHORT_BATCH_MAX_CRITERIA = int(os.environ.get("COHORT_BATCH_MAX_CRITERIA", "200"))
+
+# Lifetime of the ?token= an EventSource (which cannot send an Authorization
+# header) opens a job's progress stream with; only checked on connect.
+EXTRACTION_EVENTS_TOKEN_SECONDS = int(os.environ.get("EXTRACTION_EVENTS_TOKEN_SECONDS", "60"))
+
+# NDJSON uploads larger than this are spooled to disk before they are parsed.
+FHIR_BULK_SPOOL_BYTES = int(os.environ.get("FHIR_BULK_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
 # Validate JWT secret at import time - must be set in production
 if not JWT_SECRET:
     if os.environ.get("ENVIRONMENT", "development") == "production":
@@ -139,6 +189,41 @@ SCHEMA_SYNC_STATEMENTS = [
     "ALTER TABLE studies ADD COLUMN eligibility_summary TEXT",
     "ALTER TABLE regulatory_submissions ALTER COLUMN study_id DROP NOT NULL",
     "ALTER TABLE extraction_jobs ADD COLUMN result_csv TEXT",
+    "CREATE INDEX IF NOT EXISTS ix_extracted_medical_data_created_id "
+    "ON extracted_medical_data (created_at, id)",
+    "ALTER TABLE extraction_jobs ADD COLUMN requested_by VARCHAR(36)",
+    "ALTER TABLE extraction_jobs ADD COLUMN attempts INTEGER DEFAULT 0",
+    "ALTER TABLE extraction_jobs ADD COLUMN leased_by VARCHAR(255)",
+    "ALTER TABLE extraction_jobs ADD COLUMN lease_expires_at TIMESTAMP",
+    "ALTER TABLE extraction_jobs ADD COLUMN heartbeat_at TIMESTAMP",
+    "ALTER TABLE extraction_jobs ADD COLUMN started_at TIMESTAMP",
+    "ALTER TABLE extraction_jobs ADD COLUMN artifact_path VARCHAR(500)",
+    "ALTER TABLE extraction_jobs ADD COLUMN artifact_sha256 VARCHAR(64)",
+    "ALTER TABLE extraction_jobs ADD COLUMN artifact_size BIGINT",
+    "ALTER TABLE extraction_jobs ADD COLUMN extraction_mode VARCHAR(20) DEFAULT 'full'",
+    "ALTER TABLE extraction_jobs ADD COLUMN base_job_id VARCHAR(36)",
+    "ALTER TABLE extraction_jobs ADD COLUMN delta_key VARCHAR(64)",
+    "ALTER TABLE extraction_jobs ADD COLUMN watermark_created_at TIMESTAMP",
+    "ALTER TABLE extraction_jobs ADD COLUMN watermark_record_id VARCHAR(36)",
+    "ALTER TABLE extraction_jobs ADD COLUMN watermark_window_start TIMESTAMP",
+    "ALTER TABLE extraction_jobs ADD COLUMN tombstone_path VARCHAR(500)",
+    "ALTER TABLE extraction_jobs ADD COLUMN tombstone_sha256 VARCHAR(64)",
+    "ALTER TABLE extraction_jobs ADD COLUMN tombstone_size BIGINT",
+    "ALTER TABLE extraction_job_patients ADD COLUMN record_count INTEGER DEFAULT 0",
+    "ALTER TABLE extraction_jobs ADD COLUMN variables JSON",
+    "ALTER TABLE extraction_jobs ADD COLUMN cache_key VARCHAR(64)",
+    "ALTER TABLE extraction_jobs ADD COLUMN stage VARCHAR(50)",
+    "ALTER TABLE extraction_jobs ADD COLUMN progress FLOAT DEFAULT 0",
+    "ALTER TABLE extraction_jobs ADD COLUMN rows_processed BIGINT DEFAULT 0",
+    "ALTER TABLE extraction_jobs ADD COLUMN progress_updated_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS ix_extracted_medical_data_patient_category "
+    "ON extracted_medical_data (patient_id, data_category)",
+    "CREATE INDEX IF NOT EXISTS ix_extraction_jobs_status_created "
+    "ON extraction_jobs (status, created_at)",
+    "ALTER TABLE extracted_medical_data ADD COLUMN record_fingerprint VARCHAR(64)",
+    "ALTER TABLE cohort_jobs ADD COLUMN heartbeat_at TIMESTAMP",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_extracted_medical_data_patient_fingerprint "
+    "ON extracted_medical_data (patient_id, record_fingerprint)",
 ]
 
 DEFAULT_INSTITUTIONS = [
@@ -194,6 +279,11 @@ except Exception as e:
 async def startup_event():
     """Initialize database on startup"""
     initialize_database()
+    # Cohort jobs held by processes that have since exited.
+    with get_db_session() as db:
+        fail_stale_jobs(db)
+        # Extraction jobs whose lease lapsed with nothing left to re-claim them.
+        reap_expired_jobs(db, inline=EXTRACTION_EXECUTION == "inline")
 
 
 # ============== Pydantic Models ==============
@@ -294,6 +384,17 @@ class CohortResult(BaseModel):
     min_cell_size: int = 0
     suppressed: bool = False
 
+class BatchCohortRequest(BaseModel):
+    criteria: List[CohortCriteria]
+
+class BatchCohortResult(BaseModel):
+    results: List[CohortResult]
+    min_cell_size: int = 0
+
+class CohortJobRequest(BaseModel):
+    criteria: Optional[CohortCriteria] = None
+    cohort_id: Optional[str] = None  # summarize a saved cohort instead
+
 class SaveCohortRequest(BaseModel):
     name: str
     description: Optional[str] = None
@@ -396,9 +497,10 @@ class CollaborationResponse(BaseModel):
 
 class ExtractionJobRequest(BaseModel):
     study_id: str
-    variables: List[str]
+    variables: List[str]  # "<category>.<field>", "<category>.*" or "<field>"; empty for every field
     output_format: str = "csv"
     deidentification_level: str = "limited_dataset"
+    extraction_mode: str = "full"  # full, or delta: only what changed since the last completed job
 
 class ExtractionJobResponse(BaseModel):
     id: str
@@ -487,7 +589,6 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
         return None
     try:
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except JWTError:
@@ -495,6 +596,30 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
         # bad claims). Without this an invalid token raised an unhandled 500,
         # which also stripped CORS headers and surfaced as a browser CORS error.
         raise HTTPException(status_code=401, detail="Invalid token")
+    if "scope" in payload:
+        # Scoped tokens (create_scoped_token) open one resource, not the API.
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
+
+
+def create_scoped_token(user_id: str, scope: str, seconds: int) -> str:
+    """Short-lived JWT good only where ``scope`` is checked (verify_scoped_token)"""
+    now = datetime.utcnow()
+    payload = {"sub": str(user_id), "scope": scope, "exp": now + timedelta(seconds=seconds), "iat": now}
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+
+def verify_scoped_token(token: str, scope: str) -> Dict:
+    """Payload of a scoped token issued for exactly ``scope``"""
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("scope") != scope:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
 
 
 def require_auth(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
@@ -573,98 +698,291 @@ def scrub_deidentified_data(value: Any) -> Any:
     return deidentify_record(value)
 
 
-def process_extraction_job(db: Session, job: ExtractionJob, study: Study, requester_user_id: str) -> None:
-    """Build a consent-gated limited dataset CSV for an extraction job"""
-    now = datetime.utcnow()
-    eligible_patients = db.query(PatientProfile).join(
-        StudyEnrollment,
-        StudyEnrollment.patient_id == PatientProfile.id,
-    ).join(
-        Consent,
-        Consent.patient_id == PatientProfile.id,
-    ).filter(
-        StudyEnrollment.study_id == study.id,
-        StudyEnrollment.status == "enrolled",
-        Consent.consent_type == "research_data_sharing",
-        Consent.status == "active",
-        or_(Consent.expires_at == None, Consent.expires_at > now),
-    ).distinct().all()
-    patient_ids = [str(patient.id) for patient in eligible_patients]
-
-    records = []
-    if patient_ids:
-        records = db.query(ExtractedMedicalData).filter(
-            ExtractedMedicalData.patient_id.in_(patient_ids)
-        ).order_by(
-            ExtractedMedicalData.patient_id,
-            ExtractedMedicalData.original_date,
-            ExtractedMedicalData.created_at,
-        ).all()
+def study_pseudonym(study_id: str, patient_id: str) -> str:
+    """Stable per-study pseudonym, the same in every export of the study."""
+    return "P-" + hashlib.sha256(f"{study_id}:{patient_id}".encode()).hexdigest()[:12]
 
-    rows_by_patient: Dict[str, int] = {}
-    export_rows = []
-    scrubbed_records = []
-    for record in records:
-        patient_id = str(record.patient_id)
-        rows_by_patient[patient_id] = rows_by_patient.get(patient_id, 0) + 1
-        patient_pseudonym = "P-" + hashlib.sha256(f"{study.id}:{patient_id}".encode()).hexdigest()[:12]
-        scrubbed = deidentify_record(record.deidentified_data or {})
-        scrubbed_records.append(scrubbed)
-        export_rows.append([
-            patient_pseudonym,
-            record.data_category,
-            record.data_type or "",
-            record.original_date.year if record.original_date else "",
-            record.data_quality_score if record.data_quality_score is not None else "",
-            json.dumps(scrubbed),
-        ])
-
-    residual_count = sum(
-        len(find_residual_identifiers(scrubbed))
-        for scrubbed in scrubbed_records
-    )
-    if residual_count:
-        job.status = "failed"
-        job.error_message = (
-            "De-identification verification failed: "
-            f"{residual_count} potential identifier(s) detected; export blocked"
-        )
-        job.result_csv = None
-        job.completed_at = now
-        db.commit()
-        return
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["patient_pseudonym", "data_category", "data_type", "year", "quality_score", "data_json"])
-    writer.writerows(export_rows)
+def process_extraction_job(
+    db: Session,
+    job: ExtractionJob,
+    study: Study,
+    requester_user_id: str,
+    checkpoint: Optional[Callable[[], None]] = None,
+) -> None:
+    """Build a consent-gated limited dataset for an extraction job.
 
-    job.result_csv = output.getvalue()
+    Streams the requested variables of consented participants, chunk by
+    chunk, into a CSV or columnar artifact, scrubbing payloads on the
+    de-identification pool; the first residual identifier blocks the export.
+    Delta mode, checkpoints, projection, artifact reuse and progress events
+    are described in api/extraction_delta.py, api/extraction_checkpoint.py,
+    api/extraction_projection.py, api/export_cache.py and api/job_progress.py.
+
+    ``checkpoint`` runs before any progress or result is committed; the
+    extraction worker uses it to stop if the job's lease has passed to
+    another worker.
+    """
+    now = datetime.utcnow()
+    participants = study_participant_query(db, study.id)
+    columnar = job.output_format in COLUMNAR_FORMATS
+    suffix = COLUMNAR_FORMATS[job.output_format][0] if columnar else ".csv.gz"
+    artifact, resumed = open_artifact(db, job, f"{job.id}{suffix}", compress=not columnar)
+    projection = Projection(job.variables)
+    if resumed is None:
+        restart(db, job)
+        # Pinned first, so records written during the export go to the next delta.
+        job.watermark_created_at, job.watermark_record_id = newest_record(db) or (None, None)
+        job.watermark_window_start = window_start(job.watermark_created_at)
+        job.delta_key = delta_key(job, projection)
+        base_job = None
+        if job.extraction_mode == "delta":
+            base_job = latest_completed_job(db, study.id, job.id, job.delta_key)
+        job.base_job_id = base_job.id if base_job else None
+        if base_job is not None:
+            inherit_window_records(db, base_job, job)
+        job.stage = "preparing"
+        job.progress = 0.0
+        job.rows_processed = 0
+        job.progress_updated_at = now
+        db.commit()
+        _report_extraction_progress(job)
+    else:
+        base_job = db.query(ExtractionJob).filter(ExtractionJob.id == job.base_job_id).first()
+    watermark = job_watermark(job)
+    patients_total = participants.count()
+    patients_done = participant_totals(db, job)[1] if resumed else 0
+    category_filter = projection.category_filter(
+        anywhere_categories(db, projection.anywhere, participants) if projection.anywhere else None
+    )
+
+    if resumed is None:
+        export_cache.sweep(db)
+    if resumed is None and base_job is None:
+        key = export_cache.cache_key(job, projection, export_cache.participant_fingerprint(
+            patient_id for (patient_id,) in participants.order_by(PatientProfile.id)
+        ))
+        if checkpoint is not None:
+            checkpoint()
+        cached = export_cache.link(db, key, job, now + timedelta(days=7))
+        if cached is not None:
+            artifact.discard()
+            stored, source_job_id = cached
+            copy_participants(db, source_job_id, job)
+            _publish_extraction_job(db, job, study, requester_user_id, stored, now)
+            return
+
+    # Records exported from after this are listed for the next delta.
+    window = job.watermark_window_start
+    residual_count = 0
+    rows_written = resumed.rows_written if resumed else 0
+    chunk_index = resumed.chunk_index + 1 if resumed else 0
+    with artifact, (ColumnarSpool() if columnar else nullcontext()) as table:
+        if not columnar:
+            writer = csv.writer(artifact)
+            if resumed is None:
+                writer.writerow(["patient_pseudonym", "data_category", "data_type", "year", "quality_score", "data_json"])
+        for chunk in participant_chunks(participants, resumed.last_patient_id if resumed else None):
+            records = record_query(
+                db,
+                ExtractedMedicalData.id,
+                ExtractedMedicalData.created_at,
+                ExtractedMedicalData.patient_id,
+                ExtractedMedicalData.data_category,
+                ExtractedMedicalData.data_type,
+                ExtractedMedicalData.original_date,
+                ExtractedMedicalData.data_quality_score,
+                PAYLOAD_TEXT,
+            ).filter(
+                ExtractedMedicalData.patient_id.in_(chunk),
+                through_watermark(watermark),
+            )
+            if category_filter is not None:
+                records = records.filter(category_filter)
+            if base_job is not None:
+                records = records.filter(delta_filter(base_job))
+            records = records.order_by(
+                ExtractedMedicalData.patient_id,
+                ExtractedMedicalData.original_date,
+                ExtractedMedicalData.created_at,
+            )
+            rows_by_patient = dict.fromkeys(chunk, 0)
+            window_records = []
+            for record, scrubbed, residuals in deidentify_pool.scrub(
+                records,
+                lambda record: record.deidentified_data,
+                lambda record: projection.fields(record.data_category),
+            ):
+                residual_count += residuals
+                if residual_count:
+                    # The export is blocked either way; stop scrubbing.
+                    break
+                record_id, created_at, patient_id, data_category, data_type, original_date, quality_score, _ = record
+                if projection.fields(data_category) is not None and is_empty(scrubbed):
+                    continue
+                patient_id = str(patient_id)
+                if window is not None and created_at is not None and created_at > window:
+                    window_records.append(record_id)
+                rows_by_patient[patient_id] += 1
+                patient_pseudonym = study_pseudonym(study.id, patient_id)
+                if columnar:
+                    table.append(
+                        (patient_pseudonym, data_category, data_type,
+                         original_date.year if original_date else None, quality_score),
+                        data_category,
+                        scrubbed,
+                    )
+                    continue
+                writer.writerow([
+                    patient_pseudonym,
+                    data_category,
+                    data_type or "",
+                    original_date.year if original_date else "",
+                    quality_score if quality_score is not None else "",
+                    json.dumps(scrubbed),
+                ])
+            if residual_count:
+                break
+
+            rows_written += sum(rows_by_patient.values())
+            patients_done += len(chunk)
+            mark = None if columnar else artifact.mark()
+            if checkpoint is not None:
+                checkpoint()
+            record_participants(db, job, rows_by_patient)
+            record_window_records(db, job, window_records)
+            if mark is not None:
+                save_checkpoint(db, job, chunk_index, chunk[-1], rows_written, mark)
+            job.stage = "exporting"
+            # Participants who joined mid-export can push the count past the total.
+            job.progress = round(min(patients_done / patients_total, 0.99), 3) if patients_total else 0.99
+            job.rows_processed = rows_written
+            job.progress_updated_at = datetime.utcnow()
+            db.commit()
+            _report_extraction_progress(job)
+            chunk_index += 1
+
+        if checkpoint is not None:
+            checkpoint()
+        if residual_count:
+            artifact.discard()
+            restart(db, job)
+            job.status = "failed"
+            job.stage = None
+            job.error_message = (
+                "De-identification verification failed: "
+                f"{residual_count} potential identifier(s) detected; export blocked"
+            )
+            job.result_csv = None
+            job.completed_at = now
+            db.commit()
+            _report_extraction_progress(job)
+            return
+
+        job.stage = "finalizing"
+        _report_extraction_progress(job)
+        if columnar:
+            table.write(artifact.binary, job.output_format)
+        if base_job is not None:
+            with artifact_store.writer(f"{job.id}.tombstones.csv.gz") as tombstones:
+                tombstone_writer = csv.writer(tombstones)
+                tombstone_writer.writerow(["patient_pseudonym"])
+                for (patient_id,) in removed_participants(db, base_job.id, participants):
+                    tombstone_writer.writerow([study_pseudonym(study.id, patient_id)])
+                removed = tombstones.commit()
+            job.tombstone_path = removed.name
+            job.tombstone_sha256 = removed.sha256
+            job.tombstone_size = removed.size
+        stored = artifact.commit()
+
+    _publish_extraction_job(db, job, study, requester_user_id, stored, now)
+    if base_job is None:
+        export_cache.store(db, export_cache.cache_key(
+            job, projection, export_cache.participant_fingerprint(export_cache.job_participant_ids(db, job))
+        ), job)
+
+
+def _publish_extraction_job(
+    db: Session,
+    job: ExtractionJob,
+    study: Study,
+    requester_user_id: str,
+    stored: Artifact,
+    now: datetime,
+) -> None:
+    """Complete a job whose artifact and participant rows are in place"""
+    rows_by_patient, patient_count = participant_totals(db, job)
+    job.result_csv = None
+    job.artifact_path = stored.name
+    job.artifact_sha256 = stored.sha256
+    job.artifact_size = stored.size
     job.status = "completed"
+    job.stage = None
+    job.progress = 1.0
+    job.rows_processed = sum(rows_by_patient.values())
+    job.progress_updated_at = datetime.utcnow()
     job.completed_at = now
-    job.patient_count = len(patient_ids)
+    job.patient_count = patient_count
     job.download_url = f"/api/extraction/jobs/{job.id}/download"
     job.download_expires_at = now + timedelta(days=7)
 
-    patient_repo = PatientRepository(db)
-    for patient_id, record_count in rows_by_patient.items():
-        db.add(DataAccessLog(
-            user_id=requester_user_id,
-            patient_id=patient_id,
-            access_type="research_extraction",
-            data_type="extracted_medical_data",
-            purpose=f"Data extract for study: {study.name}",
-            record_count=record_count,
-        ))
-        patient_repo.add_points(
-            patient_id,
-            10,
-            f"Data used in research: {study.name}",
-            "extraction",
-            str(job.id),
-        )
+    drop_superseded_participants(db, job)
+    clear_progress(db, job)
+    # Completion, audit trail and rewards are committed together.
+    DataAccessLogRepository(db).log_bulk_access(
+        requester_user_id,
+        rows_by_patient,
+        access_type="research_extraction",
+        data_type="extracted_medical_data",
+        purpose=f"Data extract for study: {study.name}",
+        points=10,
+        reward_description=f"Data used in research: {study.name}",
+        reference_type="extraction",
+        reference_id=str(job.id),
+    )
+    _report_extraction_progress(job)
+
+
+def _extraction_progress_payload(job: ExtractionJob) -> Dict[str, Any]:
+    """Progress snapshot of an extraction job, with throughput and ETA"""
+    elapsed = None
+    if job.started_at and job.progress_updated_at and job.progress_updated_at > job.started_at:
+        elapsed = (job.progress_updated_at - job.started_at).total_seconds()
+    progress = job.progress or 0.0
+    return {
+        "job_id": str(job.id),
+        "status": job.status,
+        "stage": job.stage,
+        "progress": progress,
+        "rows_processed": job.rows_processed or 0,
+        "rows_per_second": round((job.rows_processed or 0) / elapsed, 1) if elapsed else None,
+        "eta_seconds": round(elapsed * (1 - progress) / progress) if elapsed and 0 < progress < 1 else None,
+        "error_message": job.error_message,
+        "updated_at": job.progress_updated_at.isoformat() if job.progress_updated_at else None,
+    }
 
-    db.commit()
+
+def _report_extraction_progress(job: ExtractionJob) -> None:
+    extraction_progress.publish(str(job.id), _extraction_progress_payload(job))
+
+
+def run_extraction_job(db: Session, job: ExtractionJob, checkpoint: Callable[[], None]) -> None:
+    """Job processor for the extraction worker (see api/extraction_worker.py)"""
+    study = db.query(Study).filter(Study.id == job.study_id).first()
+    if not study:
+        job.status = "failed"
+        job.error_message = "Study no longer exists"
+        job.completed_at = datetime.utcnow()
+        db.commit()
+        return
+    if job.output_format in COLUMNAR_FORMATS and not columnar_available():
+        # Retrying on this worker cannot help.
+        job.status = "failed"
+        job.error_message = f"{job.output_format} output needs pyarrow on the extraction worker (requirements-worker.txt)"
+        job.completed_at = datetime.utcnow()
+        db.commit()
+        return
+    process_extraction_job(db, job, study, job.requested_by or study.user_id, checkpoint)
 
 
 def hash_password(password: str) -> str:
@@ -738,18 +1056,15 @@ def has_active_consent(db: Session, patient_id: str, consent_type: str) -> bool:
     ).first() is not None
 
 
-def _consented_patient_ids(db: Session) -> List[str]:
+def _consented_patient_ids(db: Session) -> Collection[str]:
     """Return patients with active, unexpired research data sharing consent."""
-    now = datetime.utcnow()
-    patient_ids = db.query(PatientProfile.id).join(
-        Consent,
-        Consent.patient_id == PatientProfile.id,
-    ).filter(
-        Consent.consent_type == "research_data_sharing",
-        Consent.status == "active",
-        or_(Consent.expires_at == None, Consent.expires_at > now),
-    ).distinct().all()
-    return [str(patient_id) for (patient_id,) in patient_ids]
+    return consent_scope.patient_ids(db)
+
+
+def _synced_cohort_index(db: Session):
+    """Return the process-wide cohort index, caught up with the database."""
+    cohort_index.sync(db, consented_patient_query(db))
+    return cohort_index
 
 
 def get_enrolled_count(db: Session, study_id: str) -> int:
@@ -1198,6 +1513,7 @@ async def sign_consent_template(
     profile.total_points_earned += points_earned
     
     db.commit()
+    consent_granted(db, profile.id, new_consent.consent_type)
     
     return {
         "success": True,
@@ -1237,6 +1553,7 @@ async def revoke_consent(
     consent.status = "revoked"
     consent.revoked_at = datetime.utcnow()
     db.commit()
+    consent_revoked(profile.id, consent.consent_type)
     
     return {
         "success": True,
@@ -1276,22 +1593,62 @@ async def get_medical_connections(
     ]
 
 
-def _parse_fhir_original_date(value: Any) -> Optional[date]:
-    """Convert a FHIR date/dateTime to a Date, padding partial dates safely."""
-    if not isinstance(value, str):
-        return None
-    match = re.match(
-        r"^((?:19|20)\d{2})(?:-(0[1-9]|1[0-2])"
-        r"(?:-(0[1-9]|[12]\d|3[01])(?:T.*)?)?)?$",
-        value.strip(),
-    )
-    if not match:
-        return None
-    year, month, day = match.groups()
-    try:
-        return date.fromisoformat(f"{year}-{month or '01'}-{day or '01'}")
-    except ValueError:
-        return None
+def _finish_record_import(
+    db: Session,
+    patient_repo: PatientRepository,
+    connection: MedicalRecordConnection,
+    records_imported: int,
+    records_skipped: int,
+    empty_message: str,
+) -> Dict[str, Any]:
+    """Record an upload's outcome on its connection, commit, and build the response.
+
+    Records the patient already had (``records_skipped``) are not imported
+    again and earn no points. An upload made up entirely of such records adds
+    no connection: the new one is dropped, and the patient's latest connection
+    to the same source, if any, is marked synced and returned instead. An
+    upload with no supported records at all keeps its connection.
+    """
+    connection_id = str(connection.id)
+    connection.records_synced = records_imported
+    if records_imported:
+        patient_repo.add_points(
+            connection.patient_id,
+            100,
+            f"Uploaded health records ({connection.source_name})",
+            "connection",
+            str(connection.id),
+        )
+    elif records_skipped:
+        existing = db.query(MedicalRecordConnection).filter(
+            MedicalRecordConnection.patient_id == connection.patient_id,
+            MedicalRecordConnection.source_type == connection.source_type,
+            MedicalRecordConnection.source_name == connection.source_name,
+            MedicalRecordConnection.connection_status == "connected",
+            MedicalRecordConnection.id != connection.id,
+        ).order_by(MedicalRecordConnection.created_at.desc()).first()
+        connection_id = str(existing.id) if existing else None
+        if existing:
+            existing.last_sync = connection.last_sync
+        db.delete(connection)
+    db.commit()
+    cohort_index.refresh(db)
+
+    if records_imported:
+        message = f"Successfully imported {records_imported} de-identified health records."
+        if records_skipped:
+            message += f" {records_skipped} records were already on file and were skipped."
+    elif records_skipped:
+        message = f"All {records_skipped} records in this upload were already on file."
+    else:
+        message = empty_message
+    return {
+        "success": True,
+        "connection_id": connection_id,
+        "records_imported": records_imported,
+        "records_skipped": records_skipped,
+        "message": message,
+    }
 
 
 @app.post("/api/patient/connections/fhir")
@@ -1353,41 +1710,188 @@ async def connect_fhir_records(
             detail="Uploaded records could not be fully de-identified and were rejected",
         )
 
+    writer = MedicalDataWriter(db, connection.id, profile.id)
     for record, scrubbed_data in prepared_records:
-        db.add(ExtractedMedicalData(
-            connection_id=connection.id,
-            patient_id=profile.id,
-            data_category=record["data_category"],
-            data_type=record["data_type"],
-            original_date=_parse_fhir_original_date(record.get("original_date")),
-            deidentified_data=scrubbed_data,
-            data_quality_score=100.0,
-            is_verified=True,
-            verification_date=datetime.utcnow(),
-        ))
+        writer.add(
+            record["data_category"],
+            record["data_type"],
+            fhir_original_date(record.get("original_date")),
+            scrubbed_data,
+        )
+    writer.finish()
 
-    records_imported = len(prepared_records)
-    connection.records_synced = records_imported
-    if records_imported:
-        patient_repo.add_points(
-            profile.id,
-            100,
-            f"Uploaded health records ({connection.source_name})",
-            "connection",
-            str(connection.id),
+    return _finish_record_import(
+        db, patient_repo, connection, writer.written, writer.skipped,
+        "No supported clinical resources were found in the FHIR Bundle.",
+    )
+
+
+@app.post("/api/patient/connections/fhir/stream")
+async def stream_fhir_records(
+    request: Request,
+    source_name: str = Query("Uploaded FHIR Records", max_length=255),
+    token_data: Dict = Depends(require_auth),
+    db: Session = Depends(get_db),
+):
+    """Import a FHIR R4 Bundle sent as the raw request body, entry by entry.
+
+    For bundles too large to upload as JSON: entries are parsed as the body
+    arrives, de-identified and verified one at a time, and written in batches
+    through ``MedicalDataWriter``. The upload is still all or nothing.
+    """
+    patient_repo = PatientRepository(db)
+    profile = patient_repo.get_profile(UUID(token_data["sub"]))
+
+    if not profile:
+        raise HTTPException(status_code=404, detail="Patient profile not found")
+
+    active_consent = db.query(Consent).filter(
+        Consent.patient_id == profile.id,
+        Consent.consent_type == "research_data_sharing",
+        Consent.status == "active"
+    ).first()
+
+    if not active_consent:
+        raise HTTPException(
+            status_code=400,
+            detail="You must sign the Research Data Sharing consent before connecting medical records"
         )
+
+    connection = MedicalRecordConnection(
+        patient_id=profile.id,
+        source_type="fhir_bundle",
+        source_name=source_name,
+        connection_status="connected",
+        last_sync=datetime.utcnow(),
+    )
+    db.add(connection)
     db.commit()
+    db.refresh(connection)
 
-    if records_imported:
-        message = f"Successfully imported {records_imported} de-identified health records."
-    else:
-        message = "No supported clinical resources were found in the FHIR Bundle."
-    return {
-        "success": True,
-        "connection_id": str(connection.id),
-        "records_imported": records_imported,
-        "message": message,
-    }
+    def reject(status_code: int, message: str, detail: str):
+        db.rollback()
+        connection.connection_status = "error"
+        connection.error_message = message
+        connection.records_synced = 0
+        db.commit()
+        return HTTPException(status_code=status_code, detail=detail)
+
+    parser = BundleEntryStream()
+    writer = MedicalDataWriter(db, connection.id, profile.id)
+
+    def import_resources(resources):
+        for resource in resources:
+            for record in parse_fhir_resource(resource):
+                scrubbed_data = deidentify_record(record["data"])
+                if find_residual_identifiers(scrubbed_data):
+                    raise reject(
+                        422,
+                        "De-identification check failed; upload rejected",
+                        "Uploaded records could not be fully de-identified and were rejected",
+                    )
+                writer.add(
+                    record["data_category"],
+                    record["data_type"],
+                    fhir_original_date(record.get("original_date")),
+                    scrubbed_data,
+                )
+
+    def finish():
+        import_resources(parser.close())
+        writer.finish()
+
+    # Parsing, scrubbing and writes are CPU and database work: keep them off
+    # the event loop, which only receives the body.
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(lambda: import_resources(parser.feed(chunk)))
+        await run_in_threadpool(finish)
+    except HTTPException:
+        raise
+    except BundleStreamError as exc:
+        raise reject(400, "Upload is not a valid FHIR Bundle", str(exc))
+    except ClientDisconnect:
+        raise reject(400, "Upload interrupted; nothing was imported", "Upload interrupted")
+    except Exception as exc:
+        audit_logger.error(f"FHIR Bundle upload {connection.id} failed", exc_info=exc)
+        raise reject(500, "Upload failed; nothing was imported", "Upload failed")
+
+    return await run_in_threadpool(
+        _finish_record_import,
+        db, patient_repo, connection, writer.written, writer.skipped,
+        "No supported clinical resources were found in the FHIR Bundle.",
+    )
+
+
+@app.post("/api/patient/connections/fhir/ndjson")
+async def import_fhir_ndjson(
+    request: Request,
+    source_name: str = Query("FHIR Bulk Data export", max_length=255),
+    token_data: Dict = Depends(require_auth),
+    db: Session = Depends(get_db),
+):
+    """Import FHIR Bulk Data ``$export`` NDJSON sent as the raw request body.
+
+    Files of several resource types can be concatenated into one body. Lines
+    are parsed and de-identified in parallel (see api/fhir_bulk.py); the
+    import is all or nothing.
+    """
+    patient_repo = PatientRepository(db)
+    profile = patient_repo.get_profile(UUID(token_data["sub"]))
+
+    if not profile:
+        raise HTTPException(status_code=404, detail="Patient profile not found")
+
+    active_consent = db.query(Consent).filter(
+        Consent.patient_id == profile.id,
+        Consent.consent_type == "research_data_sharing",
+        Consent.status == "active"
+    ).first()
+
+    if not active_consent:
+        raise HTTPException(
+            status_code=400,
+            detail="You must sign the Research Data Sharing consent before connecting medical records"
+        )
+
+    connection = MedicalRecordConnection(
+        patient_id=profile.id,
+        source_type="fhir_bulk",
+        source_name=source_name,
+        connection_status="connected",
+        last_sync=datetime.utcnow(),
+    )
+    db.add(connection)
+    db.commit()
+    db.refresh(connection)
+
+    with tempfile.SpooledTemporaryFile(max_size=FHIR_BULK_SPOOL_BYTES) as body:
+        async for chunk in request.stream():
+            body.write(chunk)
+        body.seek(0)
+        try:
+            records_imported, records_skipped = await run_in_threadpool(
+                import_ndjson, db, connection, ndjson_lines(body, "upload")
+            )
+        except (BulkImportError, ResidualIdentifiersFound) as exc:
+            db.rollback()
+            connection.connection_status = "error"
+            connection.records_synced = 0
+            if isinstance(exc, ResidualIdentifiersFound):
+                connection.error_message = "De-identification check failed; upload rejected"
+                db.commit()
+                raise HTTPException(
+                    status_code=422,
+                    detail="Uploaded records could not be fully de-identified and were rejected",
+                )
+            connection.error_message = f"Upload rejected: {exc}"
+            db.commit()
+            raise HTTPException(status_code=400, detail=str(exc))
+
+    return _finish_record_import(
+        db, patient_repo, connection, records_imported, records_skipped,
+        "No supported clinical resources were found in the NDJSON upload.",
+    )
 
 
 @app.get("/api/patient/extracted-data", response_model=List[ExtractedDataResponse])
@@ -1438,13 +1942,14 @@ async def get_patient_data_summary(
     ).all()
     
     # Get extracted data counts by category
-    extracted = db.query(ExtractedMedicalData).filter(
-        ExtractedMedicalData.patient_id == profile.id
-    ).all()
-    
-    categories = {}
-    for e in extracted:
-        categories[e.data_category] = categories.get(e.data_category, 0) + 1
+    categories = dict(
+        db.query(
+            ExtractedMedicalData.data_category,
+            func.count(ExtractedMedicalData.id),
+        ).filter(
+            ExtractedMedicalData.patient_id == profile.id
+        ).group_by(ExtractedMedicalData.data_category).all()
+    )
     
     # Calculate completeness
     expected_categories = ["demographics", "diagnosis", "treatment", "lab_results", "molecular"]
@@ -1457,7 +1962,7 @@ async def get_patient_data_summary(
             last_sync = c.last_sync
     
     return PatientDataSummary(
-        total_records=len(extracted),
+        total_records=sum(categories.values()),
         categories=categories,
         last_sync=last_sync,
         completeness_score=min(completeness, 100),
@@ -1608,127 +2113,282 @@ async def submit_inquiry(
 
 # ============== Cohort Builder Endpoints ==============
 
-@app.post("/api/cohort/build", response_model=CohortResult)
-async def build_cohort(
-    criteria: CohortCriteria,
-    token_data: Dict = Depends(require_auth),
-    db: Session = Depends(get_db)
-):
-    """Count patients matching the criteria, over consented, de-identified records.
+CohortProgress = Callable[[str, float, Optional[int]], None]
 
-    Feasibility is answered from the records patients have actually contributed
-    under an active research-data-sharing consent. Below the aggregate cell-size
-    floor the count is reported as 0 rather than as a small exact number, so a
-    query cannot be narrowed until it isolates one person.
-    """
-    patient_ids = _consented_patient_ids(db)
-    if not patient_ids:
-        return CohortResult(
-            patient_count=0, data_points=0, diagnosis_count=0,
-            treatment_count=0, molecular_count=0,
-            available_institutions=[], data_completeness=0.0,
-            min_cell_size=MIN_AGGREGATE_CELL_SIZE, suppressed=False,
-        )
 
-    records = db.query(ExtractedMedicalData).filter(
-        ExtractedMedicalData.patient_id.in_(patient_ids)
-    ).all()
-
-    def _payload(record):
-        data = record.deidentified_data
-        if isinstance(data, str):
-            try:
-                data = json.loads(data)
-            except (TypeError, ValueError, json.JSONDecodeError):
-                return {}
-        return data if isinstance(data, dict) else {}
+def _index_cohort_counts(
+    db: Session,
+    criteria: CohortCriteria,
+    patient_ids: Collection[str],
+    progress: Optional[CohortProgress] = None,
+) -> Dict[str, Dict[str, int]]:
+    """Matching patient id -> record counts by category, via the cohort index.
+
+    Each criterion is a bitset of patients holding a matching term; the cohort
+    is their intersection with the consent scope. ``progress`` is called with
+    (stage, fraction done, patients still matching) after each step.
+    """
+    def _report(stage: str, fraction: float, matching_count: Optional[int] = None) -> None:
+        if progress is not None:
+            progress(stage, fraction, matching_count)
 
-    def _matches_any(text: str, terms: List[str]) -> bool:
-        lowered = (text or "").lower()
-        return any(term.lower() in lowered for term in terms if term)
+    index = _synced_cohort_index(db)
+    matching = patient_ids
+    steps = []
+    if criteria.cancer_types or criteria.icd_codes:
+        steps.append(("diagnosis", list(criteria.cancer_types or []) + list(criteria.icd_codes or [])))
+    if criteria.treatment_types:
+        steps.append(("treatment", criteria.treatment_types))
+    if criteria.stages:
+        steps.append(("stage", criteria.stages))
+    if steps:
+        bits = index.scope(patient_ids)
+        _report("scope", 1 / (len(steps) + 2), bits.bit_count())
+        for done, (kind, terms) in enumerate(steps, start=2):
+            bits &= index.match(kind, terms)
+            _report(kind, done / (len(steps) + 2), bits.bit_count())
+        matching = index.patient_ids(bits)
+    counts = {pid: index.category_counts(pid) for pid in matching}
+    _report("counts", 1.0, len(counts))
+    return counts
+
+
+def _index_batch_cohort_counts(
+    db: Session, criteria_list: List[CohortCriteria], patient_ids: Collection[str]
+) -> List[Dict[str, Dict[str, int]]]:
+    """``_index_cohort_counts`` for many criteria sharing one scan of the index.
+
+    Every term of every criterion is matched in a single automaton pass per
+    feature kind; each criterion then ORs its terms' bitsets and ANDs across
+    its criteria.
+    """
+    index = _synced_cohort_index(db)
 
-    # Narrow to the patients whose records satisfy every supplied criterion.
-    matching = set(patient_ids)
+    def _terms(criteria: CohortCriteria) -> Dict[str, List[str]]:
+        return {
+            "diagnosis": list(criteria.cancer_types or []) + list(criteria.icd_codes or []),
+            "treatment": list(criteria.treatment_types or []),
+            "stage": list(criteria.stages or []),
+        }
 
-    if criteria.cancer_types or criteria.icd_codes:
-        wanted = set()
-        terms = list(criteria.cancer_types or []) + list(criteria.icd_codes or [])
-        for record in records:
-            if record.data_category != "diagnosis":
-                continue
-            data = _payload(record)
-            haystack = " ".join(str(data.get(k, "")) for k in ("display", "cancer_type", "code", "icd_code"))
-            if _matches_any(haystack, terms):
-                wanted.add(str(record.patient_id))
-        matching &= wanted
+    wanted = [_terms(criteria) for criteria in criteria_list]
+    matched = {
+        kind: index.match_terms(kind, [term for terms in wanted for term in terms[kind]])
+        for kind in ("diagnosis", "treatment", "stage")
+    }
 
-    if criteria.treatment_types:
-        wanted = set()
-        for record in records:
-            if record.data_category != "treatment":
-                continue
-            data = _payload(record)
-            haystack = " ".join(str(data.get(k, "")) for k in ("medication", "procedure", "regimen", "display"))
-            if _matches_any(haystack, criteria.treatment_types):
-                wanted.add(str(record.patient_id))
-        matching &= wanted
+    scope = None
+    results = []
+    for terms in wanted:
+        matching = patient_ids
+        if any(terms.values()):
+            if scope is None:
+                scope = index.scope(patient_ids)
+            bits = scope
+            for kind, kind_terms in terms.items():
+                if kind_terms:
+                    any_term = 0
+                    for term in {term.lower() for term in kind_terms}:
+                        any_term |= matched[kind].get(term, 0)
+                    bits &= any_term
+            matching = index.patient_ids(bits)
+        results.append({pid: index.category_counts(pid) for pid in matching})
+    return results
+
+
+def _empty_cohort_result(suppressed: bool = False) -> CohortResult:
+    return CohortResult(
+        patient_count=0, data_points=0, diagnosis_count=0,
+        treatment_count=0, molecular_count=0,
+        available_institutions=[], data_completeness=0.0,
+        min_cell_size=MIN_AGGREGATE_CELL_SIZE, suppressed=suppressed,
+    )
 
-    if criteria.stages:
-        wanted = set()
-        for record in records:
-            data = _payload(record)
-            if _matches_any(str(data.get("stage", "")), criteria.stages):
-                wanted.add(str(record.patient_id))
-        matching &= wanted
 
-    matched_records = [r for r in records if str(r.patient_id) in matching]
-    patient_count = len(matching)
+def _cohort_statistics(per_patient_counts: Dict[str, Dict[str, int]]) -> CohortResult:
+    """Cohort statistics from matching patients' per-category record counts."""
+    patient_count = len(per_patient_counts)
 
     # Small-cell suppression: never report a non-zero count below the floor.
-    suppressed = 0 < patient_count < MIN_AGGREGATE_CELL_SIZE
-    if suppressed:
-        return CohortResult(
-            patient_count=0, data_points=0, diagnosis_count=0,
-            treatment_count=0, molecular_count=0,
-            available_institutions=[], data_completeness=0.0,
-            min_cell_size=MIN_AGGREGATE_CELL_SIZE, suppressed=True,
-        )
+    if 0 < patient_count < MIN_AGGREGATE_CELL_SIZE:
+        return _empty_cohort_result(suppressed=True)
 
-    diagnosis_count = sum(1 for r in matched_records if r.data_category == "diagnosis")
-    treatment_count = sum(1 for r in matched_records if r.data_category == "treatment")
-    molecular_count = sum(1 for r in matched_records if r.data_category == "molecular")
+    def _total(category: str) -> int:
+        return sum(counts.get(category, 0) for counts in per_patient_counts.values())
 
     # Measured completeness: the share of core categories each matching patient
     # actually has, averaged across the cohort.
-    core = ("demographics", "diagnosis", "treatment", "lab_results", "outcome")
-    per_patient: Dict[str, set] = {pid: set() for pid in matching}
-    for record in matched_records:
-        per_patient[str(record.patient_id)].add(record.data_category)
+    core = {"demographics", "diagnosis", "treatment", "lab_results", "outcome"}
     completeness = (
-        sum(len(cats & set(core)) / len(core) for cats in per_patient.values()) / patient_count
+        sum(len(counts.keys() & core) / len(core) for counts in per_patient_counts.values()) / patient_count
         if patient_count else 0.0
     )
 
-    # Records arrive patient-mediated, so we cannot attribute a cohort to source
-    # institutions. Report the directory of sites a study can be filed with, and
-    # let the caller label it as such rather than as contributors.
-    institution_names = [
-        name for (name,) in db.query(Institution.name).filter(Institution.is_active == True).all()
-    ]
-
     return CohortResult(
         patient_count=patient_count,
-        data_points=len(matched_records),
-        diagnosis_count=diagnosis_count,
-        treatment_count=treatment_count,
-        molecular_count=molecular_count,
-        available_institutions=institution_names,
+        data_points=sum(sum(counts.values()) for counts in per_patient_counts.values()),
+        diagnosis_count=_total("diagnosis"),
+        treatment_count=_total("treatment"),
+        molecular_count=_total("molecular"),
+        available_institutions=[],
         data_completeness=round(completeness, 3),
         min_cell_size=MIN_AGGREGATE_CELL_SIZE,
         suppressed=False,
     )
 
 
+def _evaluate_cohorts(
+    db: Session,
+    criteria_list: List[CohortCriteria],
+    patient_ids: Collection[str],
+    progress: Optional[CohortProgress] = None,
+) -> List[CohortResult]:
+    """Cohort statistics over consented records, before institutions are attached."""
+    if not patient_ids:
+        return [_empty_cohort_result() for _ in criteria_list]
+
+    # Narrow to the patients whose records satisfy every supplied criterion.
+    if COHORT_QUERY_ENGINE == "sql":
+        scope = consented_patient_query(db).subquery()
+        per_patient_counts = []
+        for done, criteria in enumerate(criteria_list, start=1):
+            per_patient_counts.append(run_cohort_query(db, criteria, scope))
+            if progress is not None:
+                progress("query", done / len(criteria_list), None)
+    elif len(criteria_list) == 1:
+        per_patient_counts = [_index_cohort_counts(db, criteria_list[0], patient_ids, progress)]
+    else:
+        per_patient_counts = _index_batch_cohort_counts(db, criteria_list, patient_ids)
+    return [_cohort_statistics(counts) for counts in per_patient_counts]
+
+
+def _cohort_data_version(db: Session) -> tuple:
+    """Everything a cached cohort result depends on besides its criteria."""
+    if COHORT_QUERY_ENGINE == "sql":
+        records = newest_record(db)
+    else:
+        records = _synced_cohort_index(db).version
+    return (records, consent_scope.version, MIN_AGGREGATE_CELL_SIZE, COHORT_QUERY_ENGINE)
+
+
+def _cache_bypassed(request: Request) -> bool:
+    directives = request.headers.get("cache-control", "").lower()
+    return "no-cache" in directives or "no-store" in directives
+
+
+def _cohort_results(
+    db: Session,
+    criteria_list: List[CohortCriteria],
+    bypass_cache: bool = False,
+    progress: Optional[CohortProgress] = None,
+) -> Tuple[List[CohortResult], str]:
+    """Evaluate criteria through the per-process feasibility result cache.
+
+    Cache misses are evaluated together; a bypass re-evaluates everything and
+    replaces the cached entries. Returns the results and the cache outcome:
+    HIT when every result was cached, else MISS or BYPASS.
+    """
+    patient_ids = _consented_patient_ids(db)
+    version = _cohort_data_version(db)
+    keys = [criteria_key(criteria) for criteria in criteria_list]
+
+    if bypass_cache:
+        results = [None] * len(keys)
+        cache_status = "BYPASS"
+    else:
+        results = [cohort_result_cache.get(key, version) for key in keys]
+        cache_status = "MISS" if None in results else "HIT"
+
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        computed = _evaluate_cohorts(db, [criteria_list[i] for i in misses], patient_ids, progress)
+        for i, result in zip(misses, computed):
+            cohort_result_cache.put(keys[i], version, result)
+            results[i] = result
+
+    # Records arrive patient-mediated, so we cannot attribute a cohort to source
+    # institutions. Report the directory of sites a study can be filed with, and
+    # let the caller label it as such rather than as contributors. The directory
+    # is read fresh; only the record-derived statistics are cached.
+    institution_names = None
+    attached = []
+    for result in results:
+        if not patient_ids or result.suppressed:
+            attached.append(result.model_copy())
+            continue
+        if institution_names is None:
+            institution_names = [
+                name for (name,) in db.query(Institution.name).filter(Institution.is_active == True).all()
+            ]
+        attached.append(result.model_copy(update={"available_institutions": institution_names}))
+    return attached, cache_status
+
+
+def _cached_cohort_results(
+    db: Session, criteria_list: List[CohortCriteria], request: Request, response: Response
+) -> List[CohortResult]:
+    """``_cohort_results`` honouring ``Cache-Control: no-cache``, reported in ``X-Cache``."""
+    results, cache_status = _cohort_results(db, criteria_list, bypass_cache=_cache_bypassed(request))
+    response.headers["X-Cache"] = cache_status
+    return results
+
+
+def _cohort_result(
+    db: Session, criteria: CohortCriteria, request: Request, response: Response
+) -> CohortResult:
+    return _cached_cohort_results(db, [criteria], request, response)[0]
+
+
+@app.post("/api/cohort/build", response_model=CohortResult)
+async def build_cohort(
+    criteria: CohortCriteria,
+    request: Request,
+    response: Response,
+    token_data: Dict = Depends(require_auth),
+    db: Session = Depends(get_db)
+):
+    """Count patients matching the criteria, over consented, de-identified records.
+
+    Feasibility is answered from the records patients have actually contributed
+    under an active research-data-sharing consent. Below the aggregate cell-size
+    floor the count is reported as 0 rather than as a small exact number, so a
+    query cannot be narrowed until it isolates one person.
+    """
+    return _cohort_result(db, criteria, request, response)
+
+
+@app.post("/api/cohort/build-batch", response_model=BatchCohortResult)
+async def build_cohort_batch(
+    batch: BatchCohortRequest,
+    request: Request,
+    response: Response,
+    token_data: Dict = Depends(require_auth),
+    db: Session = Depends(get_db)
+):
+    """Evaluate many criteria sets in one pass over the cohort index.
+
+    Results come back in request order; small-cell suppression applies to
+    each result on its own, exactly as for /api/cohort/build.
+    """
+    if len(batch.criteria) > COHORT_BATCH_MAX_CRITERIA:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {COHORT_BATCH_MAX_CRITERIA} criteria sets per batch",
+        )
+    return BatchCohortResult(
+        results=_cached_cohort_results(db, batch.criteria, request, response),
+        min_cell_size=MIN_AGGREGATE_CELL_SIZE,
+    )
+
+
+@app.get("/api/cohort/cache/stats")
+async def get_cohort_cache_stats(
+    token_data: Dict = Depends(require_role("admin")),
+):
+    """Hit/miss counters of this worker's cohort result cache"""
+    return cohort_result_cache.stats()
+
+
 @app.get("/api/cohort/variables")
 async def get_cohort_variables(
     token_data: Dict = Depends(require_auth),
@@ -1746,29 +2406,16 @@ async def get_cohort_variables(
     if total_patients == 0:
         return {"total_patients": 0, "categories": [], "min_cell_size": MIN_AGGREGATE_CELL_SIZE}
 
-    rows = db.query(
-        ExtractedMedicalData.data_category,
-        ExtractedMedicalData.patient_id,
-        ExtractedMedicalData.deidentified_data,
-    ).filter(ExtractedMedicalData.patient_id.in_(patient_ids)).all()
-
-    # category -> field -> set of patients carrying a value for that field
-    holders: Dict[str, Dict[str, set]] = {}
-    for category, patient_id, payload in rows:
-        if not isinstance(payload, dict):
-            continue
-        fields = holders.setdefault(category, {})
-        for field, value in payload.items():
-            if value is None or value == "" or value == []:
-                continue
-            fields.setdefault(field, set()).add(str(patient_id))
+    # category -> field -> patients carrying a value for that field, maintained
+    # by the cohort index as records are ingested and consents revoked.
+    holders = _synced_cohort_index(db).field_counts(patient_ids)
 
     categories = []
     suppressed = 0
     for category in sorted(holders):
         variables = []
         for field in sorted(holders[category]):
-            count = len(holders[category][field])
+            count = holders[category][field]
             if count < MIN_AGGREGATE_CELL_SIZE:
                 suppressed += 1
                 continue
@@ -1792,23 +2439,24 @@ async def get_cohort_variables(
 @app.post("/api/cohort/save")
 async def save_cohort(
     request: SaveCohortRequest,
+    http_request: Request,
+    response: Response,
     token_data: Dict = Depends(require_auth),
     db: Session = Depends(get_db)
 ):
     """Save a cohort for later use"""
     cohort_repo = CohortRepository(db)
 
-    # Build cohort first to get count
-    criteria_dict = request.criteria.dict()
-    result = cohort_repo.build_cohort(criteria_dict)
+    # Build cohort first to get count (suppressed counts are saved as 0)
+    result = _cohort_result(db, request.criteria, http_request, response)
 
     # Save cohort
     cohort = cohort_repo.save_cohort(
         user_id=UUID(token_data["sub"]),
         name=request.name,
         description=request.description,
-        criteria=criteria_dict,
-        patient_count=result["patient_count"],
+        criteria=request.criteria.dict(),
+        patient_count=result.patient_count,
     )
 
     return {
@@ -1842,17 +2490,181 @@ async def get_saved_cohorts(
 @app.get("/api/cohort/{cohort_id}/summary")
 async def get_cohort_summary(
     cohort_id: str,
+    request: Request,
+    response: Response,
     token_data: Dict = Depends(require_auth),
     db: Session = Depends(get_db)
 ):
-    """Get summary statistics for a cohort"""
-    cohort_repo = CohortRepository(db)
-    summary = cohort_repo.get_cohort_summary(UUID(cohort_id))
-
-    if not summary:
+    """Get summary statistics for a cohort, re-evaluated against current data"""
+    cohort = db.query(ResearchCohort).filter(ResearchCohort.id == cohort_id).first()
+    if not cohort:
         raise HTTPException(status_code=404, detail="Cohort not found")
 
-    return summary
+    result = _cohort_result(db, CohortCriteria(**(cohort.criteria or {})), request, response)
+    return {
+        **result.model_dump(),
+        "cohort_id": str(cohort.id),
+        "name": cohort.name,
+    }
+
+
+def _cohort_job_payload(job: CohortJob) -> Dict[str, Any]:
+    return {
+        "job_id": str(job.id),
+        "cohort_id": job.cohort_id,
+        "status": job.status,
+        "stage": job.stage,
+        "progress": job.progress or 0.0,
+        "partial_result": job.partial_result,
+        "result": job.result,
+        "error_message": job.error_message,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+    }
+
+
+def _run_cohort_job(job_id: str) -> None:
+    """Evaluate a queued CohortJob on the background executor.
+
+    Progress, and the number of patients still matching after each criterion,
+    is committed between steps; that is also where cancellation is honoured.
+    Running counts below the cell-size floor are withheld like final ones.
+    """
+    with get_db_session() as db:
+        job = db.query(CohortJob).filter(CohortJob.id == job_id).first()
+        if job is None or job.status != "queued":
+            return
+        job.status = "running"
+        job.started_at = job.heartbeat_at = datetime.utcnow()
+        db.commit()
+
+        def _progress(stage: str, fraction: float, matching_count: Optional[int]) -> None:
+            job.stage = stage
+            job.progress = round(fraction, 3)
+            job.heartbeat_at = datetime.utcnow()
+            if matching_count is not None:
+                suppressed = 0 < matching_count < MIN_AGGREGATE_CELL_SIZE
+                job.partial_result = {
+                    "matching_patients": 0 if suppressed else matching_count,
+                    "suppressed": suppressed,
+                    "min_cell_size": MIN_AGGREGATE_CELL_SIZE,
+                }
+            db.commit()
+            cohort_job_runner.checkpoint(job_id, requested_elsewhere=job.cancel_requested)
+
+        try:
+            cohort_job_runner.checkpoint(job_id, requested_elsewhere=job.cancel_requested)
+            criteria = CohortCriteria(**(job.criteria or {}))
+            (result,), _ = _cohort_results(db, [criteria], progress=_progress)
+        except JobCancelled:
+            db.rollback()
+            job.status = "cancelled"
+            job.completed_at = datetime.utcnow()
+            return
+        except Exception as exc:
+            db.rollback()
+            audit_logger.error(f"Cohort job {job_id} failed", exc_info=exc)
+            job.status = "failed"
+            job.error_message = type(exc).__name__
+            job.completed_at = datetime.utcnow()
+            return
+
+        job.status = "completed"
+        job.stage = None
+        job.progress = 1.0
+        job.result = result.model_dump()
+        job.completed_at = datetime.utcnow()
+        if job.cohort and job.cohort.user_id == job.user_id:
+            job.cohort.patient_count = result.patient_count
+
+
+@app.post("/api/cohort/jobs")
+async def create_cohort_job(
+    request: CohortJobRequest,
+    token_data: Dict = Depends(require_auth),
+    db: Session = Depends(get_db)
+):
+    """Queue a cohort computation and return a job id to poll.
+
+    Pass ``criteria`` for an ad-hoc build, or ``cohort_id`` to recompute a
+    saved cohort's summary (its patient count is updated on completion).
+    """
+    criteria = request.criteria
+    if request.cohort_id:
+        # Completion writes the cohort's patient count: only its owner may.
+        cohort = db.query(ResearchCohort).filter(
+            ResearchCohort.id == request.cohort_id,
+            ResearchCohort.user_id == token_data["sub"],
+        ).first()
+        if not cohort:
+            raise HTTPException(status_code=404, detail="Cohort not found")
+        criteria = CohortCriteria(**(cohort.criteria or {}))
+    if criteria is None:
+        raise HTTPException(status_code=400, detail="Provide criteria or a cohort_id")
+
+    job = CohortJob(
+        user_id=token_data["sub"],
+        cohort_id=request.cohort_id,
+        criteria=criteria.model_dump(),
+        status="queued",
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    if not cohort_job_runner.submit(str(job.id), _run_cohort_job):
+        db.delete(job)
+        db.commit()
+        raise HTTPException(status_code=429, detail="Too many cohort jobs in progress; retry shortly")
+
+    return _cohort_job_payload(job)
+
+
+@app.get("/api/cohort/jobs/{job_id}")
+async def get_cohort_job(
+    job_id: str,
+    token_data: Dict = Depends(require_auth),
+    db: Session = Depends(get_db)
+):
+    """Poll a cohort job's status, progress, running counts and result"""
+    job = db.query(CohortJob).filter(
+        CohortJob.id == job_id,
+        CohortJob.user_id == token_data["sub"],
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Cohort job not found")
+    if is_stale(job) and fail_stale_jobs(db, job.id):
+        db.refresh(job)
+    return _cohort_job_payload(job)
+
+
+@app.post("/api/cohort/jobs/{job_id}/cancel")
+async def cancel_cohort_job(
+    job_id: str,
+    token_data: Dict = Depends(require_auth),
+    db: Session = Depends(get_db)
+):
+    """Cancel a queued or running cohort job"""
+    job = db.query(CohortJob).filter(
+        CohortJob.id == job_id,
+        CohortJob.user_id == token_data["sub"],
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Cohort job not found")
+    if job.status not in ("queued", "running"):
+        raise HTTPException(status_code=400, detail=f"Cohort job is already {job.status}")
+
+    # Seen by whichever worker runs the job at its next checkpoint; a job
+    # that has not started yet is cancelled outright.
+    job.cancel_requested = True
+    if job.status == "queued":
+        job.status = "cancelled"
+        job.completed_at = datetime.utcnow()
+    db.commit()
+    cohort_job_runner.cancel(str(job.id))
+
+    return _cohort_job_payload(job)
 
 
 # ============== Study & Regulatory Endpoints ==============
@@ -1912,7 +2724,7 @@ async def get_research_analytics(
     return _compute_analytics(db, _consented_patient_ids(db))
 
 
-def _compute_analytics(db: Session, patient_ids: List[str]) -> Dict[str, Any]:
+def _compute_analytics(db: Session, patient_ids: Collection[str]) -> Dict[str, Any]:
     """Build consent-gated, small-cell-suppressed aggregates for a patient set."""
     empty_payload = {
         "total_patients": 0,
@@ -1930,55 +2742,13 @@ def _compute_analytics(db: Session, patient_ids: List[str]) -> Dict[str, Any]:
     if not patient_ids:
         return empty_payload
 
-    records = db.query(ExtractedMedicalData).filter(
-        ExtractedMedicalData.patient_id.in_(patient_ids)
-    ).all()
-
-    records_by_category: Dict[str, int] = {}
-    diagnoses: Dict[str, set] = {}
-    treatments: Dict[str, set] = {}
-    age_bands: Dict[str, set] = {}
-    sex: Dict[str, set] = {}
-    responses: Dict[str, set] = {}
-    vital_status: Dict[str, set] = {}
+    # Label -> patient rollups are maintained by the cohort index as records
+    # arrive and consent changes; only the scope's counts are read here.
+    index = _synced_cohort_index(db)
+    groups = index.feature_counts(patient_ids, ANALYTICS_KINDS)
+    records_by_category = index.category_totals(patient_ids)
 
-    for record in records:
-        category = record.data_category
-        records_by_category[category] = records_by_category.get(category, 0) + 1
-
-        data = record.deidentified_data
-        if isinstance(data, str):
-            try:
-                data = json.loads(data)
-            except (TypeError, ValueError, json.JSONDecodeError):
-                continue
-        if not isinstance(data, dict):
-            continue
-
-        patient_id = str(record.patient_id)
-        if category == "diagnosis":
-            label = data.get("display") or data.get("cancer_type") or "Unknown"
-            diagnoses.setdefault(str(label), set()).add(patient_id)
-        elif category == "treatment":
-            label = data.get("medication") or data.get("procedure") or data.get("regimen") or "Unknown"
-            treatments.setdefault(str(label), set()).add(patient_id)
-        elif category == "demographics":
-            age_band = data.get("age_band") or data.get("age_range")
-            if age_band:
-                age_bands.setdefault(str(age_band), set()).add(patient_id)
-            sex_value = data.get("sex")
-            if sex_value:
-                sex.setdefault(str(sex_value), set()).add(patient_id)
-        elif category == "outcome":
-            response = data.get("response")
-            if response:
-                responses.setdefault(str(response), set()).add(patient_id)
-            status = data.get("vital_status")
-            if status:
-                vital_status.setdefault(str(status), set()).add(patient_id)
-
-    def suppress(groups: Dict[str, set]) -> tuple[Dict[str, int], int]:
-        counts = {label: len(patient_set) for label, patient_set in groups.items()}
+    def suppress(counts: Dict[str, int]) -> tuple[Dict[str, int], int]:
         visible = {
             label: count
             for label, count in counts.items()
@@ -1986,12 +2756,12 @@ def _compute_analytics(db: Session, patient_ids: List[str]) -> Dict[str, Any]:
         }
         return visible, len(counts) - len(visible)
 
-    visible_diagnoses, suppressed_diagnoses = suppress(diagnoses)
-    visible_treatments, suppressed_treatments = suppress(treatments)
-    visible_age_bands, suppressed_age_bands = suppress(age_bands)
-    visible_sex, suppressed_sex = suppress(sex)
-    visible_responses, suppressed_responses = suppress(responses)
-    visible_vital_status, suppressed_vital_status = suppress(vital_status)
+    visible_diagnoses, suppressed_diagnoses = suppress(groups["diagnosis_label"])
+    visible_treatments, suppressed_treatments = suppress(groups["treatment_label"])
+    visible_age_bands, suppressed_age_bands = suppress(groups["age_band"])
+    visible_sex, suppressed_sex = suppress(groups["sex"])
+    visible_responses, suppressed_responses = suppress(groups["response"])
+    visible_vital_status, suppressed_vital_status = suppress(groups["vital_status"])
 
     def ranked_groups(groups: Dict[str, int]) -> List[Dict[str, Any]]:
         return [
@@ -2001,7 +2771,7 @@ def _compute_analytics(db: Session, patient_ids: List[str]) -> Dict[str, Any]:
 
     return {
         "total_patients": len(patient_ids),
-        "total_records": len(records),
+        "total_records": sum(records_by_category.values()),
         "records_by_category": dict(sorted(records_by_category.items())),
         "diagnoses": ranked_groups(visible_diagnoses),
         "treatments": ranked_groups(visible_treatments),
@@ -2031,18 +2801,7 @@ async def get_study_analytics(
     Restricted to the study PI and accepted collaborators."""
     require_study_access(db, study_id, token_data["sub"])
 
-    now = datetime.utcnow()
-    rows = db.query(PatientProfile.id).join(
-        StudyEnrollment, StudyEnrollment.patient_id == PatientProfile.id,
-    ).join(
-        Consent, Consent.patient_id == PatientProfile.id,
-    ).filter(
-        StudyEnrollment.study_id == study_id,
-        StudyEnrollment.status == "enrolled",
-        Consent.consent_type == "research_data_sharing",
-        Consent.status == "active",
-        or_(Consent.expires_at == None, Consent.expires_at > now),
-    ).distinct().all()
+    rows = study_participant_query(db, study_id).all()
     patient_ids = [str(pid) for (pid,) in rows]
 
     return _compute_analytics(db, patient_ids)
@@ -2134,8 +2893,11 @@ async def get_study_detail(
             "patient_count": job.patient_count,
             "variable_count": job.variable_count,
             "output_format": job.output_format,
+            "extraction_mode": job.extraction_mode or "full",
+            "base_job_id": job.base_job_id,
             "estimated_completion": job.estimated_completion.isoformat() if job.estimated_completion else None,
             "download_url": job.download_url,
+            "tombstones_url": f"/api/extraction/jobs/{job.id}/tombstones" if job.tombstone_path else None,
             "created_at": job.created_at.isoformat(),
         }
         for job in jobs
@@ -2466,6 +3228,18 @@ async def create_extraction_job(
             status_code=400,
             detail="Cannot extract data without IRB approval and signed DUA"
         )
+
+    if request.extraction_mode not in ("full", "delta"):
+        raise HTTPException(status_code=400, detail="extraction_mode must be 'full' or 'delta'")
+    try:
+        Projection(request.variables)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if request.output_format in COLUMNAR_FORMATS and not columnar_available():
+        raise HTTPException(
+            status_code=400,
+            detail=f"{request.output_format} output is not available on this server; request csv instead"
+        )
     
     # Create extraction job
     job_name = f"extract_{study.name.lower().replace(' ', '_')}_{datetime.utcnow().strftime('%Y%m%d')}"
@@ -2473,12 +3247,15 @@ async def create_extraction_job(
     
     job = ExtractionJob(
         study_id=request.study_id,
+        requested_by=token_data["sub"],
         job_name=job_name,
         status="queued",
         patient_count=study.patient_count,
         variable_count=len(request.variables),
+        variables=request.variables,
         output_format=request.output_format,
         deidentification_level=request.deidentification_level,
+        extraction_mode=request.extraction_mode,
         estimated_completion=estimated_completion,
     )
     db.add(job)
@@ -2488,10 +3265,17 @@ async def create_extraction_job(
     
     db.commit()
     db.refresh(job)
-    process_extraction_job(db, job, study, token_data["sub"])
-    db.refresh(job)
+    if EXTRACTION_EXECUTION == "inline":
+        await run_in_threadpool(run_inline, db, str(job.id), run_extraction_job)
+        db.refresh(job)
 
     failed = job.status == "failed"
+    if failed:
+        message = job.error_message
+    elif job.status == "completed":
+        message = "Extraction job completed. Data is ready for download."
+    else:
+        message = "Extraction job queued. Track its status under your extraction jobs."
     return {
         "success": not failed,
         "job_id": str(job.id),
@@ -2501,11 +3285,17 @@ async def create_extraction_job(
         "variable_count": job.variable_count,
         "estimated_completion": estimated_completion.isoformat(),
         "download_url": job.download_url,
-        "message": (
-            job.error_message
-            if failed
-            else "Extraction job completed. Data is ready for download."
-        ),
+        "message": message,
+    }
+
+
+@app.get("/api/extraction/formats")
+async def get_extraction_formats(token_data: Dict = Depends(require_auth)):
+    """Output formats this server can produce; Parquet and Arrow need pyarrow"""
+    available = columnar_available()
+    return {
+        "columnar_available": available,
+        "unavailable_formats": [] if available else list(COLUMNAR_FORMATS),
     }
 
 
@@ -2535,6 +3325,10 @@ async def get_extraction_jobs(
     jobs = db.query(ExtractionJob).filter(
         ExtractionJob.study_id.in_(study_ids)
     ).order_by(ExtractionJob.created_at.desc()).all()
+    inline = EXTRACTION_EXECUTION == "inline"
+    if any(is_reapable(job, inline) for job in jobs) and reap_expired_jobs(db, inline):
+        for job in jobs:
+            db.refresh(job)
     
     return [
         {
@@ -2544,39 +3338,210 @@ async def get_extraction_jobs(
             "patient_count": job.patient_count,
             "variable_count": job.variable_count,
             "output_format": job.output_format,
+            "extraction_mode": job.extraction_mode or "full",
+            "base_job_id": job.base_job_id,
             "estimated_completion": job.estimated_completion.isoformat() if job.estimated_completion else None,
+            "started_at": job.started_at.isoformat() if job.started_at else None,
             "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+            "attempts": job.attempts or 0,
+            "stage": job.stage,
+            "progress": job.progress or 0.0,
+            "events_url": f"/api/extraction/jobs/{job.id}/events",
+            "error_message": job.error_message,
             "download_url": job.download_url,
+            "tombstones_url": f"/api/extraction/jobs/{job.id}/tombstones" if job.tombstone_path else None,
             "created_at": job.created_at.isoformat(),
         }
         for job in jobs
     ]
 
 
-@app.get("/api/extraction/jobs/{job_id}/download")
-async def download_extraction_job(
+def _artifact_response(
+    request: Request, artifact: Artifact, media_type: str, headers: Dict[str, str]
+) -> Response:
+    """Stream an artifact, honouring single byte ranges.
+
+    The stored bytes are sent as-is, which makes the file resumable with
+    ``Range``/``If-Range`` and lets the ``ETag``, ``Digest`` and
+    ``X-Checksum-SHA256`` headers describe exactly the bytes sent. Full
+    downloads are verified against the checksum as they stream. gzip
+    artifacts go out with ``Content-Encoding: gzip`` (browsers decode
+    transparently); clients that do not accept gzip get the decompressed
+    content instead, without range support.
+    """
+    if artifact_store.size(artifact.name) != artifact.size:
+        audit_logger.error(f"Artifact {artifact.name} is missing or has the wrong size")
+        raise HTTPException(status_code=410, detail="Extraction output is no longer available")
+
+    gzipped = artifact.name.endswith(".gz")
+    if gzipped and "gzip" not in request.headers.get("accept-encoding", "").lower():
+        return StreamingResponse(
+            artifact_store.iter_decompressed(artifact),
+            media_type=media_type,
+            headers={**headers, "Accept-Ranges": "none"},
+        )
+
+    etag = f'"{artifact.sha256}"'
+    if gzipped:
+        headers = {**headers, "Content-Encoding": "gzip"}
+    headers = {
+        **headers,
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Digest": artifact.digest_header,
+        "X-Checksum-SHA256": artifact.sha256,
+    }
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_byte_range(range_header, artifact.size)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{artifact.size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            return StreamingResponse(
+                artifact_store.iter_bytes(artifact, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers={
+                    **headers,
+                    "Content-Range": f"bytes {start}-{end}/{artifact.size}",
+                    "Content-Length": str(end - start + 1),
+                },
+            )
+
+    return StreamingResponse(
+        artifact_store.iter_bytes(artifact, verify=True),
+        media_type=media_type,
+        headers={**headers, "Content-Length": str(artifact.size)},
+    )
+
+
+def _extraction_events_scope(job_id: str) -> str:
+    return f"extraction-events:{job_id}"
+
+
+@app.post("/api/extraction/jobs/{job_id}/events/token")
+async def create_extraction_events_token(
     job_id: str,
     token_data: Dict = Depends(require_auth),
     db: Session = Depends(get_db)
 ):
-    """Download a completed extraction job CSV"""
+    """Short-lived token for opening the job's event stream as ``?token=``"""
     job = db.query(ExtractionJob).filter(ExtractionJob.id == job_id).first()
     if not job:
         raise HTTPException(status_code=404, detail="Extraction job not found")
+    require_study_access(db, job.study_id, token_data["sub"])
+    return {
+        "token": create_scoped_token(
+            token_data["sub"], _extraction_events_scope(job_id), EXTRACTION_EVENTS_TOKEN_SECONDS
+        ),
+        "expires_in": EXTRACTION_EVENTS_TOKEN_SECONDS,
+    }
 
-    require_export_access(db, job.study_id, token_data["sub"])
 
-    if job.status != "completed" or job.result_csv is None:
+@app.get("/api/extraction/jobs/{job_id}/events")
+async def stream_extraction_job_events(
+    job_id: str,
+    request: Request,
+    token: Optional[str] = Query(None),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    """Server-Sent Events stream of an extraction job's progress.
+
+    A ``progress`` event (status, stage, share done, rows processed,
+    throughput and ETA) is sent on connect and whenever it changes; the
+    stream ends once the job completes, fails or is cancelled.
+
+    Authenticates with a Bearer header or, for EventSource clients, with
+    ``?token=`` from POST /api/extraction/jobs/{job_id}/events/token.
+    Access is checked in a session of its own, closed before streaming, so
+    an open stream does not hold a pooled connection; each poll opens its own.
+    """
+    if token is not None:
+        token_data = verify_scoped_token(token, _extraction_events_scope(job_id))
+    else:
+        token_data = require_auth(credentials)
+    with get_db_session() as db:
+        job = db.query(ExtractionJob).filter(ExtractionJob.id == job_id).first()
+        if not job:
+            raise HTTPException(status_code=404, detail="Extraction job not found")
+        require_study_access(db, job.study_id, token_data["sub"])
+
+    def _load() -> Optional[Dict[str, Any]]:
+        with get_db_session() as session:
+            current = session.query(ExtractionJob).filter(ExtractionJob.id == job_id).first()
+            inline = EXTRACTION_EXECUTION == "inline"
+            if current and is_reapable(current, inline) and reap_expired_jobs(session, inline, job_id):
+                session.refresh(current)
+            return _extraction_progress_payload(current) if current else None
+
+    return StreamingResponse(
+        event_stream(job_id, lambda: run_in_threadpool(_load), request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _downloadable_job(db: Session, job_id: str, user_id: str) -> ExtractionJob:
+    """A completed, unexpired extraction job the user may download from."""
+    job = db.query(ExtractionJob).filter(ExtractionJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Extraction job not found")
+
+    require_export_access(db, job.study_id, user_id)
+
+    if job.status != "completed" or (job.artifact_path is None and job.result_csv is None):
         raise HTTPException(status_code=400, detail="Extraction job is not ready for download")
     if job.download_expires_at and job.download_expires_at < datetime.utcnow():
         raise HTTPException(status_code=410, detail="Extraction job download has expired")
+    return job
 
-    filename = re.sub(r'[^A-Za-z0-9._-]', '_', job.job_name or "extract") + ".csv"
-    return Response(
-        content=job.result_csv,
-        media_type="text/csv",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-    )
+
+@app.get("/api/extraction/jobs/{job_id}/download")
+async def download_extraction_job(
+    job_id: str,
+    request: Request,
+    token_data: Dict = Depends(require_auth),
+):
+    """Download a completed extraction job's dataset"""
+    # The session is closed before streaming: a slow download must not hold
+    # a pooled connection (the artifact store reads on connections of its own).
+    with get_db_session() as db:
+        job = _downloadable_job(db, job_id, token_data["sub"])
+
+        extension, media_type = ".csv", "text/csv"
+        if job.output_format in COLUMNAR_FORMATS and (job.artifact_path or "").endswith(
+            COLUMNAR_FORMATS[job.output_format][0]
+        ):
+            extension, media_type = COLUMNAR_FORMATS[job.output_format]
+        filename = re.sub(r'[^A-Za-z0-9._-]', '_', job.job_name or "extract") + extension
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+        if job.artifact_path is None:
+            # Exported before artifacts were written to the artifact store.
+            return Response(content=job.result_csv, media_type=media_type, headers=headers)
+
+        artifact = Artifact(job.artifact_path, job.artifact_sha256, job.artifact_size)
+    return _artifact_response(request, artifact, media_type, headers)
+
+
+@app.get("/api/extraction/jobs/{job_id}/tombstones")
+async def download_extraction_tombstones(
+    job_id: str,
+    request: Request,
+    token_data: Dict = Depends(require_auth),
+):
+    """Download a delta job's tombstones: pseudonyms to drop from earlier extracts"""
+    with get_db_session() as db:
+        job = _downloadable_job(db, job_id, token_data["sub"])
+        if job.tombstone_path is None:
+            raise HTTPException(status_code=404, detail="Only delta extraction jobs have tombstones")
+
+        filename = re.sub(r'[^A-Za-z0-9._-]', '_', job.job_name or "extract") + "_tombstones.csv"
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+        artifact = Artifact(job.tombstone_path, job.tombstone_sha256, job.tombstone_size)
+    return _artifact_response(request, artifact, "text/csv", headers)
 
 
 @app.get("/api/emr/connections")
@@ -0,0 +1,177 @@
+"""Batched writes of ExtractedMedicalData rows.
+
+Uploads add thousands of records at a time. Adding each one as an ORM object
+costs an identity-map entry, change tracking and a flush per object, and
+that dominates large imports. ``MedicalDataWriter`` instead buffers plain
+rows for one connection and writes ``MEDICAL_DATA_WRITE_BATCH_SIZE`` at a
+time: as one ``COPY ... FROM STDIN`` on PostgreSQL (psycopg2), or as a
+multi-row INSERT through ``executemany`` elsewhere. Ids and timestamps are
+generated client-side, so nothing needs to be read back.
+
+Every row gets its ``record_fingerprint`` (api/record_fingerprint.py), and
+records the patient already holds are skipped: the INSERT is ``ON CONFLICT
+DO NOTHING`` on the fingerprint index, and on PostgreSQL the COPY goes to a
+temporary staging table that is then inserted the same way. ``written``
+counts the rows actually stored and ``skipped`` the duplicates.
+
+The writer never commits: it writes inside the caller's transaction, which
+decides whether the whole import stands. ``finish`` re-dates the rows to the
+end of the import just before that commit, so readers that follow the
+(created_at, id) watermark, such as the cohort index, see a long import's
+rows as new rather than older than imports that committed while it ran.
+"""
+
+from datetime import date, datetime
+import io
+import json
+import os
+from typing import Any
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .models import ExtractedMedicalData, generate_uuid
+from .record_fingerprint import record_fingerprint
+
+
+MEDICAL_DATA_WRITE_BATCH_SIZE = int(os.environ.get("MEDICAL_DATA_WRITE_BATCH_SIZE", "1000"))
+
+_TABLE = ExtractedMedicalData.__table__
+_COLUMNS = (
+    "id", "connection_id", "patient_id", "data_category", "data_type",
+    "extracted_date", "original_date", "deidentified_data", "data_quality_score",
+    "is_verified", "verification_date", "created_at", "record_fingerprint",
+)
+_UNIQUE = ("patient_id", "record_fingerprint")
+_STAGE = f"{_TABLE.name}_stage"
+_COLUMN_LIST = ", ".join(_COLUMNS)
+_CREATE_STAGE_SQL = (
+    f"CREATE TEMPORARY TABLE IF NOT EXISTS {_STAGE} "
+    f"(LIKE {_TABLE.name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+)
+_COPY_SQL = f"COPY {_STAGE} ({_COLUMN_LIST}) FROM STDIN"
+_MERGE_STAGE_SQL = (
+    f"INSERT INTO {_TABLE.name} ({_COLUMN_LIST}) SELECT {_COLUMN_LIST} FROM {_STAGE} "
+    f"ON CONFLICT ({', '.join(_UNIQUE)}) DO NOTHING"
+)
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_field(column: str, value: Any) -> str:
+    """One value in PostgreSQL's COPY text format."""
+    if value is None:
+        return "\\N"
+    if column == "deidentified_data":
+        value = json.dumps(value)
+    elif isinstance(value, bool):
+        return "t" if value else "f"
+    elif isinstance(value, datetime):
+        value = value.isoformat(sep=" ")
+    elif isinstance(value, date):
+        value = value.isoformat()
+    return str(value).translate(_COPY_ESCAPES)
+
+
+class MedicalDataWriter:
+    """Buffers verified records of one connection and writes them in batches."""
+
+    def __init__(
+        self,
+        db: Session,
+        connection_id: str,
+        patient_id: str,
+        batch_size: int = MEDICAL_DATA_WRITE_BATCH_SIZE,
+    ):
+        self.db = db
+        self.connection_id = connection_id
+        self.patient_id = patient_id
+        self.batch_size = max(batch_size, 1)
+        self.written = 0
+        self.skipped = 0
+        self._rows: list[dict] = []
+
+    def add(
+        self,
+        data_category: str,
+        data_type: str | None,
+        original_date: date | None,
+        deidentified_data: Any,
+        data_quality_score: float | None = 100.0,
+        is_verified: bool = True,
+    ) -> None:
+        """Queue one record; writes a batch once ``batch_size`` are queued."""
+        self._rows.append({
+            "data_category": data_category,
+            "data_type": data_type,
+            "original_date": original_date,
+            "deidentified_data": deidentified_data,
+            "data_quality_score": data_quality_score,
+            "is_verified": is_verified,
+            "record_fingerprint": record_fingerprint(
+                data_category, data_type, original_date, deidentified_data
+            ),
+        })
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write the queued records; return how many were new."""
+        if not self._rows:
+            return 0
+        now = datetime.utcnow()
+        rows = [
+            {
+                **row,
+                "id": generate_uuid(),
+                "connection_id": self.connection_id,
+                "patient_id": self.patient_id,
+                "extracted_date": now,
+                "verification_date": now if row["is_verified"] else None,
+                "created_at": now,
+            }
+            for row in self._rows
+        ]
+        self._rows = []
+        written = self._copy(rows)
+        if written is None:
+            dialect = postgresql if self.db.get_bind().dialect.name == "postgresql" else sqlite
+            statement = dialect.insert(_TABLE).on_conflict_do_nothing(index_elements=list(_UNIQUE))
+            written = self.db.execute(statement, rows).rowcount
+        self.written += written
+        self.skipped += len(rows) - written
+        return written
+
+    def finish(self) -> None:
+        """Write what is still queued and give every stored row the current time.
+
+        Call just before committing the import.
+        """
+        self.flush()
+        if not self.written:
+            return
+        self.db.query(ExtractedMedicalData).filter(
+            ExtractedMedicalData.patient_id == self.patient_id,
+            ExtractedMedicalData.connection_id == self.connection_id,
+        ).update({ExtractedMedicalData.created_at: datetime.utcnow()}, synchronize_session=False)
+
+    def _copy(self, rows: list[dict]) -> int | None:
+        """COPY ``rows`` in on PostgreSQL; the number new, or None if this database can't."""
+        if self.db.get_bind().dialect.name != "postgresql":
+            return None
+        cursor = self.db.connection().connection.cursor()
+        try:
+            if not hasattr(cursor, "copy_expert"):
+                return None  # not psycopg2
+            buffer = io.StringIO()
+            for row in rows:
+                buffer.write("\t".join(_copy_field(column, row[column]) for column in _COLUMNS))
+                buffer.write("\n")
+            buffer.seek(0)
+            cursor.execute(_CREATE_STAGE_SQL)
+            cursor.copy_expert(_COPY_SQL, buffer)
+            cursor.execute(_MERGE_STAGE_SQL)
+            written = cursor.rowcount
+            cursor.execute(f"TRUNCATE {_STAGE}")
+        finally:
+            cursor.close()
+        return written
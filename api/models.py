@@ -4,8 +4,8 @@ Database models for all platform entities
 Compatible with both PostgreSQL and SQLite
 """
 from sqlalchemy import (
-    Column, String, Integer, Float, Boolean, Text, DateTime, Date,
-    ForeignKey, Numeric, Enum as SQLEnum, UniqueConstraint, Index, JSON
+    Column, String, Integer, BigInteger, Float, Boolean, Text, DateTime, Date,
+    ForeignKey, Numeric, Enum as SQLEnum, UniqueConstraint, Index, JSON, LargeBinary
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -357,6 +357,17 @@ class MedicalRecordConnection(Base):
 class ExtractedMedicalData(Base):
     """De-identified medical data extracted from connected records"""
     __tablename__ = "extracted_medical_data"
+    __table_args__ = (
+        # Keyset watermark for incremental readers such as the cohort index.
+        Index("ix_extracted_medical_data_created_id", "created_at", "id"),
+        # Extraction reads a chunk of patients' records, optionally by category.
+        Index("ix_extracted_medical_data_patient_category", "patient_id", "data_category"),
+        # A patient holds each distinct record once; re-uploads are skipped.
+        Index(
+            "uq_extracted_medical_data_patient_fingerprint",
+            "patient_id", "record_fingerprint", unique=True,
+        ),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     connection_id = Column(String(36), ForeignKey("medical_record_connections.id"), nullable=False)
@@ -370,6 +381,7 @@ class ExtractedMedicalData(Base):
     is_verified = Column(Boolean, default=False)
     verification_date = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
+    record_fingerprint = Column(String(64))  # see api/record_fingerprint.py
 
     # Relationships
     connection = relationship("MedicalRecordConnection", back_populates="extracted_data")
@@ -411,6 +423,31 @@ class ResearchCohort(Base):
     # Relationships
     user = relationship("User", back_populates="cohorts")
     studies = relationship("Study", back_populates="cohort")
+    jobs = relationship("CohortJob", back_populates="cohort")
+
+
+class CohortJob(Base):
+    """Asynchronous cohort feasibility computation"""
+    __tablename__ = "cohort_jobs"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    user_id = Column(String(36), ForeignKey("users.id"), nullable=False)
+    cohort_id = Column(String(36), ForeignKey("research_cohorts.id"))  # set when summarizing a saved cohort
+    criteria = Column(JSON, nullable=False)
+    status = Column(String(50), default="queued")  # queued, running, completed, failed, cancelled
+    stage = Column(String(50))  # current evaluation step while running
+    progress = Column(Float, default=0.0)  # 0-1
+    partial_result = Column(JSON)  # running, suppression-safe counts
+    result = Column(JSON)  # CohortResult once completed
+    cancel_requested = Column(Boolean, default=False)
+    error_message = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)  # last step committed by the running process
+    completed_at = Column(DateTime)
+
+    # Relationships
+    cohort = relationship("ResearchCohort", back_populates="jobs")
 
 
 class Study(Base):
@@ -468,20 +505,48 @@ class RegulatorySubmission(Base):
 class ExtractionJob(Base):
     """Data extraction job tracking"""
     __tablename__ = "extraction_jobs"
+    __table_args__ = (
+        # Queue polling by extraction workers.
+        Index("ix_extraction_jobs_status_created", "status", "created_at"),
+    )
 
     id = Column(String(36), primary_key=True, default=generate_uuid)
     study_id = Column(String(36), ForeignKey("studies.id"), nullable=False)
+    requested_by = Column(String(36), ForeignKey("users.id"))
     job_name = Column(String(255))
     status = Column(String(50), default="queued")  # queued, running, completed, failed, cancelled
+    attempts = Column(Integer, default=0)
+    leased_by = Column(String(255))  # worker holding the job while running
+    lease_expires_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    started_at = Column(DateTime)
+    stage = Column(String(50))  # current step while running
+    progress = Column(Float, default=0.0)  # 0-1, share of participants processed
+    rows_processed = Column(BigInteger, default=0)
+    progress_updated_at = Column(DateTime)
     patient_count = Column(Integer)
     variable_count = Column(Integer)
+    variables = Column(JSON)  # requested variable ids; empty exports every field
     output_format = Column(String(50), default="csv")  # csv, redcap, fhir
     deidentification_level = Column(String(50), default="limited_dataset")  # limited_dataset, safe_harbor, expert_determination
     estimated_completion = Column(DateTime)
     completed_at = Column(DateTime)
     download_url = Column(Text)
     download_expires_at = Column(DateTime)
-    result_csv = Column(Text)
+    result_csv = Column(Text)  # legacy in-row export; new jobs write an artifact
+    artifact_path = Column(String(500))  # name in the artifact store (gzip CSV)
+    artifact_sha256 = Column(String(64))  # of the stored, compressed bytes
+    artifact_size = Column(BigInteger)
+    extraction_mode = Column(String(20), default="full")  # full, delta
+    base_job_id = Column(String(36))  # the completed job a delta continues from
+    delta_key = Column(String(64))  # digest of variables, format and level; a base must match
+    watermark_created_at = Column(DateTime)  # newest record (created_at, id) covered
+    watermark_record_id = Column(String(36))
+    watermark_window_start = Column(DateTime)  # the next delta re-reads records after this
+    tombstone_path = Column(String(500))  # delta only: pseudonyms no longer in the study
+    tombstone_sha256 = Column(String(64))
+    tombstone_size = Column(BigInteger)
+    cache_key = Column(String(64))  # ExportArtifact this job holds a reference to
     error_message = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -489,6 +554,84 @@ class ExtractionJob(Base):
     study = relationship("Study", back_populates="extraction_jobs")
 
 
+class ExtractionJobPatient(Base):
+    """Participants covered by an extraction job.
+
+    Written chunk by chunk while the job runs, and kept afterwards for a
+    study's latest completed job only; the next delta extraction compares it
+    with the current participants.
+    """
+    __tablename__ = "extraction_job_patients"
+
+    job_id = Column(String(36), ForeignKey("extraction_jobs.id"), primary_key=True)
+    patient_id = Column(String(36), primary_key=True)
+    record_count = Column(Integer, default=0)  # rows exported for the patient
+
+
+class ExtractionJobRecord(Base):
+    """Records an extraction job exported from just before its watermark.
+
+    The next delta re-reads that window and skips these records.
+    """
+    __tablename__ = "extraction_job_records"
+
+    job_id = Column(String(36), ForeignKey("extraction_jobs.id"), primary_key=True)
+    record_id = Column(String(36), primary_key=True)
+
+
+class ExportArtifact(Base):
+    """A full extraction artifact shared by every job with the same inputs.
+
+    Keyed by a digest of the study, variables, de-identification ruleset,
+    output format, data watermark and participant set. ``ref_count`` counts
+    the jobs linked to it; it is deleted once that reaches zero and
+    ``expires_at`` (the latest linked download expiry) has passed.
+    """
+    __tablename__ = "export_artifacts"
+
+    cache_key = Column(String(64), primary_key=True)
+    study_id = Column(String(36), ForeignKey("studies.id"), nullable=False, index=True)
+    source_job_id = Column(String(36))  # latest linked job, whose participant rows are kept
+    artifact_path = Column(String(500), nullable=False)
+    artifact_sha256 = Column(String(64))
+    artifact_size = Column(BigInteger)
+    ref_count = Column(Integer, default=0)
+    expires_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ArtifactChunk(Base):
+    """One piece of an artifact held in the database (api/artifact_store.py).
+
+    Every API and worker process reads the same rows, unlike a local file.
+    """
+    __tablename__ = "artifact_chunks"
+
+    name = Column(String(255), primary_key=True)  # artifact or partial file name
+    seq = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+
+
+class ExtractionCheckpoint(Base):
+    """Progress of a running extraction job, one row per finished chunk.
+
+    A worker that picks the job up again resumes after the latest row's
+    patient, from that point in the partial artifact.
+    """
+    __tablename__ = "extraction_checkpoints"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    job_id = Column(String(36), ForeignKey("extraction_jobs.id"), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    last_patient_id = Column(String(36), nullable=False)
+    rows_written = Column(BigInteger, default=0)
+    artifact_partial = Column(String(255))  # partial file name in the artifact store
+    artifact_offset = Column(BigInteger)  # stored bytes up to the checkpoint
+    artifact_crc32 = Column(BigInteger)  # gzip CRC of the content so far
+    artifact_length = Column(BigInteger)  # uncompressed bytes so far
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class EMRConnection(Base):
     """Institution-level EMR connection configuration"""
     __tablename__ = "emr_connections"
@@ -0,0 +1,171 @@
+"""Content fingerprints for de-identified records, and the duplicate backfill.
+
+Patients re-upload the same portal export, and every upload used to add the
+same records again, inflating every count and analytics scan. Each
+ExtractedMedicalData row now carries ``record_fingerprint``: a digest of its
+category, type, original date and canonical de-identified payload. A unique
+index on (patient_id, record_fingerprint) makes writes skip records the
+patient already has (see api/medical_data_writer.py).
+
+Rows written before fingerprints existed have none. ``backfill`` fingerprints
+them in batches, oldest first, and deletes each one whose fingerprint the
+patient already holds. Among legacy copies the earliest is kept; when an
+upload has already stored the record with a fingerprint, that copy is kept
+and every legacy one is deleted, however old::
+
+    python -m api.record_fingerprint
+
+API processes drop the deleted rows from their cohort index at its next full
+rebuild (``COHORT_INDEX_MAX_AGE_SECONDS``).
+
+Extracts taken before a backfill that deleted rows still hold those
+duplicates, and no delta job reports the deletions: delta tombstones list
+participants, not records, and extract rows carry no record id. Each deleted
+row is identical to the copy that was kept, so a recipient corrects an
+earlier extract by dropping repeated rows (same pseudonym, category, type,
+year and payload), or by requesting a new full extract. ``backfill`` logs a
+warning whenever it deletes rows.
+"""
+
+import argparse
+from datetime import date
+import hashlib
+import json
+import logging
+import os
+from typing import Any
+
+from sqlalchemy import bindparam, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .models import ExtractedMedicalData
+from .record_stream import PAYLOAD_TEXT, load_payload_text
+
+
+RECORD_FINGERPRINT_BACKFILL_BATCH = int(os.environ.get("RECORD_FINGERPRINT_BACKFILL_BATCH", "1000"))
+
+logger = logging.getLogger("healthdb.record_fingerprint")
+
+_TABLE = ExtractedMedicalData.__table__
+_SET_FINGERPRINT = update(_TABLE).where(
+    _TABLE.c.id == bindparam("record_id")
+).values(record_fingerprint=bindparam("fingerprint"))
+
+
+def payload_digest(payload: Any) -> str:
+    """Digest of a payload that is equal for equal JSON content."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def record_fingerprint(
+    data_category: str, data_type: str | None, original_date: date | None, payload: Any
+) -> str:
+    """Fingerprint of one de-identified record."""
+    key = [
+        data_category,
+        data_type,
+        original_date.isoformat() if original_date is not None else None,
+        payload_digest(payload),
+    ]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+def _backfill_batch(db: Session, batch_size: int) -> tuple[int, int]:
+    """Fingerprint or delete one batch of legacy rows; returns (kept, deleted)."""
+    rows = db.query(
+        ExtractedMedicalData.id,
+        ExtractedMedicalData.patient_id,
+        ExtractedMedicalData.data_category,
+        ExtractedMedicalData.data_type,
+        ExtractedMedicalData.original_date,
+        PAYLOAD_TEXT,
+    ).filter(
+        ExtractedMedicalData.record_fingerprint == None
+    ).order_by(
+        ExtractedMedicalData.created_at, ExtractedMedicalData.id
+    ).limit(batch_size).all()
+    if not rows:
+        return 0, 0
+
+    fingerprints = {
+        row.id: record_fingerprint(
+            row.data_category, row.data_type, row.original_date, load_payload_text(row.deidentified_data)
+        )
+        for row in rows
+    }
+    held = set(db.query(
+        ExtractedMedicalData.patient_id, ExtractedMedicalData.record_fingerprint
+    ).filter(
+        tuple_(ExtractedMedicalData.patient_id, ExtractedMedicalData.record_fingerprint).in_(
+            {(row.patient_id, fingerprints[row.id]) for row in rows}
+        )
+    ).all())
+
+    keep, duplicates = {}, []
+    for row in rows:
+        key = (row.patient_id, fingerprints[row.id])
+        if key in held:
+            duplicates.append(row.id)
+        else:
+            held.add(key)
+            keep[row.id] = key[1]
+
+    if keep:
+        db.execute(
+            _SET_FINGERPRINT,
+            [{"record_id": record_id, "fingerprint": fingerprint} for record_id, fingerprint in keep.items()],
+        )
+    if duplicates:
+        db.query(ExtractedMedicalData).filter(ExtractedMedicalData.id.in_(duplicates)).delete(
+            synchronize_session=False
+        )
+    db.commit()
+    return len(keep), len(duplicates)
+
+
+def backfill(db: Session, batch_size: int = RECORD_FINGERPRINT_BACKFILL_BATCH) -> tuple[int, int]:
+    """Fingerprint every legacy row, collapsing duplicates; returns (kept, deleted).
+
+    Commits per batch, so it can be stopped and rerun at any time.
+    """
+    kept = deleted = 0
+    while True:
+        try:
+            batch_kept, batch_deleted = _backfill_batch(db, batch_size)
+        except IntegrityError:
+            # An upload stored one of these fingerprints meanwhile; redo the
+            # batch, which now sees it as held.
+            db.rollback()
+            continue
+        if not batch_kept and not batch_deleted:
+            return kept, deleted
+        kept += batch_kept
+        deleted += batch_deleted
+        logger.info("Fingerprinted %d records, removed %d duplicates so far", kept, deleted)
+
+
+def main(argv: list[str] | None = None) -> None:
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Fingerprint legacy records and remove duplicates.")
+    parser.add_argument("--batch-size", type=int, default=RECORD_FINGERPRINT_BACKFILL_BATCH)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    db = SessionLocal()
+    try:
+        kept, deleted = backfill(db, args.batch_size)
+    finally:
+        db.close()
+    logger.info("Done: %d records fingerprinted, %d duplicates removed", kept, deleted)
+    if deleted:
+        logger.warning(
+            "Removed duplicates are not reported to delta extraction jobs; extracts taken "
+            "before now may repeat rows. Request full extracts, or drop repeated rows."
+        )
+
+
+if __name__ == "__main__":
+    main()
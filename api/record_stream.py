@@ -0,0 +1,94 @@
+"""Bounded-memory iteration over ExtractedMedicalData.
+
+Aggregate paths should not ``.all()`` full ORM objects: that materializes
+every consented record, payload included, before the first one is used.
+``record_query`` selects only the columns a caller names and streams them in
+``RECORD_STREAM_BATCH_SIZE`` batches (``yield_per``, which uses a server-side
+cursor on PostgreSQL). Payloads selected as ``PAYLOAD_TEXT`` arrive as the
+stored JSON text and are decoded by ``decode_payload_text`` only for rows a
+caller actually inspects. Only the read is bounded: what a caller keeps is
+its own, and the cohort index, for one, grows with the features it retains.
+"""
+
+import json
+import os
+from typing import Any
+
+from sqlalchemy import Text, and_, cast, or_
+from sqlalchemy.orm import Session
+
+from .models import ExtractedMedicalData
+
+
+RECORD_STREAM_BATCH_SIZE = int(os.environ.get("RECORD_STREAM_BATCH_SIZE", "1000"))
+
+# The payload as stored, skipping the JSON type's per-row decode.
+PAYLOAD_TEXT = cast(ExtractedMedicalData.deidentified_data, Text).label("deidentified_data")
+
+
+def record_query(db: Session, *columns, batch_size: int = RECORD_STREAM_BATCH_SIZE):
+    """Query of just ``columns`` over ExtractedMedicalData, fetched in batches."""
+    return db.query(*columns).select_from(ExtractedMedicalData).execution_options(
+        yield_per=batch_size
+    )
+
+
+def through_watermark(watermark: tuple[Any, str] | None):
+    """Filter for records at or before a (created_at, id) watermark.
+
+    Records without a created_at always qualify.
+    """
+    if watermark is None:
+        return ExtractedMedicalData.created_at == None
+    created_at, record_id = watermark
+    return or_(
+        ExtractedMedicalData.created_at == None,
+        ExtractedMedicalData.created_at < created_at,
+        and_(
+            ExtractedMedicalData.created_at == created_at,
+            ExtractedMedicalData.id <= record_id,
+        ),
+    )
+
+
+def after_watermark(watermark: tuple[Any, str] | None):
+    """Filter for records written after a (created_at, id) watermark."""
+    if watermark is None:
+        return ExtractedMedicalData.created_at != None
+    created_at, record_id = watermark
+    return or_(
+        ExtractedMedicalData.created_at > created_at,
+        and_(
+            ExtractedMedicalData.created_at == created_at,
+            ExtractedMedicalData.id > record_id,
+        ),
+    )
+
+
+def decode_payload(value: Any) -> dict | None:
+    """Return a record's de-identified payload as a mapping, None if unusable."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except (TypeError, ValueError):
+            return None
+    return value if isinstance(value, dict) else None
+
+
+def load_payload_text(raw: Any) -> Any:
+    """A ``PAYLOAD_TEXT`` value as the JSON column would have returned it.
+
+    Drivers that already parse JSON (psycopg2 does) hand back the object,
+    which is returned as is. Unparseable text yields None.
+    """
+    if isinstance(raw, str):
+        try:
+            return json.loads(raw)
+        except (TypeError, ValueError):
+            return None
+    return raw
+
+
+def decode_payload_text(raw: Any) -> dict | None:
+    """Decode a ``PAYLOAD_TEXT`` value, tolerating legacy double-encoded JSON."""
+    return decode_payload(load_payload_text(raw))
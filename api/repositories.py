@@ -3,7 +3,7 @@ HealthDB Repositories
 Database access layer for all entities
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_, text
+from sqlalchemy import func, and_, or_, text, insert
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 import hashlib
@@ -14,6 +14,12 @@ from .models import (
     MolecularData, Outcome, DataProduct, DataPurchase, DataAccessLog,
     ResearchCohort, StudyEnrollment
 )
+from .consent_scope import consent_granted, consent_revoked
+
+
+# Patients per balance UPDATE in bulk ledger writes; keeps each IN list under
+# SQLite's bind-parameter limit.
+LEDGER_BATCH_SIZE = 5000
 
 
 # ============== User Repository ==============
@@ -105,6 +111,7 @@ class PatientRepository:
         self.db.add(consent)
         self.db.commit()
         self.db.refresh(consent)
+        consent_granted(self.db, patient_id, consent_type)
 
         # Award points for signing consent
         profile = self.db.query(PatientProfile).filter(
@@ -134,6 +141,7 @@ class PatientRepository:
         )
         self.db.add(revocation_log)
         self.db.commit()
+        consent_revoked(consent.patient_id, consent.consent_type)
 
     def get_rewards_history(self, patient_id: str, limit: int = 50) -> List[RewardsTransaction]:
         return self.db.query(RewardsTransaction).filter(
@@ -152,6 +160,41 @@ class PatientRepository:
         self.add_reward_transaction(patient_id, "earn", points, description, reference_type, reference_id)
         self.db.commit()
 
+    def add_points_bulk(self, awards: Dict[str, int], description: str,
+                        reference_type: Optional[str] = None,
+                        reference_id: Optional[str] = None) -> None:
+        """Credit many patients at once, without committing.
+
+        One multi-row insert into the rewards ledger, then one set-based
+        balance UPDATE per distinct amount (and per LEDGER_BATCH_SIZE
+        patients), instead of an UPDATE, insert and commit per patient.
+        """
+        if not awards:
+            return
+        self.db.execute(insert(RewardsTransaction), [
+            {
+                "patient_id": str(patient_id),
+                "transaction_type": "earn",
+                "points": points,
+                "description": description,
+                "reference_type": reference_type,
+                "reference_id": reference_id,
+            }
+            for patient_id, points in awards.items()
+        ])
+
+        patients_by_amount: Dict[int, List[str]] = {}
+        for patient_id, points in awards.items():
+            patients_by_amount.setdefault(points, []).append(str(patient_id))
+        for points, patient_ids in patients_by_amount.items():
+            for start in range(0, len(patient_ids), LEDGER_BATCH_SIZE):
+                self.db.query(PatientProfile).filter(
+                    PatientProfile.id.in_(patient_ids[start:start + LEDGER_BATCH_SIZE])
+                ).update({
+                    "points_balance": PatientProfile.points_balance + points,
+                    "total_points_earned": PatientProfile.total_points_earned + points,
+                })
+
     def add_reward_transaction(self, patient_id: str, transaction_type: str,
                                 points: int, description: str,
                                 reference_type: Optional[str] = None,
@@ -475,3 +518,33 @@ class DataAccessLogRepository:
 
         return log
 
+    def log_bulk_access(self, user_id: str, record_counts: Dict[str, int],
+                        access_type: str, data_type: str, purpose: str,
+                        points: int, reward_description: str,
+                        reference_type: Optional[str] = None,
+                        reference_id: Optional[str] = None) -> None:
+        """Log one access per patient and credit each of them ``points``.
+
+        ``record_counts`` maps patient id to the number of records accessed.
+        The access logs go in as one multi-row insert, the rewards through
+        ``PatientRepository.add_points_bulk``, and everything (including any
+        pending changes in the session) is committed together.
+        """
+        if record_counts:
+            self.db.execute(insert(DataAccessLog), [
+                {
+                    "user_id": str(user_id) if user_id else None,
+                    "patient_id": str(patient_id),
+                    "access_type": access_type,
+                    "data_type": data_type,
+                    "purpose": purpose,
+                    "record_count": record_count,
+                }
+                for patient_id, record_count in record_counts.items()
+            ])
+            PatientRepository(self.db).add_points_bulk(
+                {patient_id: points for patient_id in record_counts},
+                reward_description, reference_type, reference_id,
+            )
+        self.db.commit()
+
@@ -0,0 +1,98 @@
+"""Versioned LRU cache for cohort feasibility results.
+
+Researchers re-run the same criteria while iterating in the cohort builder.
+Results are cached per process under a canonical criteria key and tagged with
+the data version they were computed at (record watermark, consent scope
+version, cell-size floor, query engine). A lookup whose version differs from
+the entry's is a miss, so ingest and consent changes invalidate without any
+explicit purge; stale entries simply age out of the LRU.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Hashable
+
+
+COHORT_RESULT_CACHE_SIZE = int(os.environ.get("COHORT_RESULT_CACHE_SIZE", "512"))
+
+# Criteria matched case-insensitively as substrings (after pooling cancer
+# types and ICD codes); the case of their terms does not change the result.
+_TEXT_CRITERIA = ("diagnosis_terms", "treatment_types", "stages")
+
+
+def criteria_key(criteria: Any) -> str:
+    """Stable hash of a CohortCriteria, equal for equivalent criteria.
+
+    Term lists are treated as sets, text terms are lower-cased, and diagnosis
+    terms are pooled because cancer types and ICD codes are matched against
+    the same text. Empty lists are the same as an omitted criterion.
+    """
+    fields = criteria.model_dump()
+    diagnosis = list(fields.pop("cancer_types") or []) + list(fields.pop("icd_codes") or [])
+    fields["diagnosis_terms"] = diagnosis
+    canonical = {}
+    for name, value in fields.items():
+        if isinstance(value, list):
+            if not value:
+                continue
+            lower = name in _TEXT_CRITERIA
+            value = sorted({str(v).lower() if lower else str(v) for v in value})
+        elif value is None:
+            continue
+        canonical[name] = value
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU of results, each stored with the version it is valid for."""
+
+    def __init__(self, max_entries: int = COHORT_RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[Hashable, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, version: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, version: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+cohort_result_cache = ResultCache()
@@ -0,0 +1,119 @@
+"""Throughput benchmark: FHIR resource extraction, in resources per second.
+
+Builds a synthetic corpus of every supported resource type (plus an
+unsupported one, which should cost next to nothing) and times
+parse_fhir_bundle over the mixed corpus and over each type on its own.
+
+Run from the repository root:  python scripts/bench_fhir_extract.py [N]
+"""
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from api.fhir_ingest import parse_fhir_bundle  # noqa: E402
+
+
+def concept(rng, system, codes):
+    code, display = rng.choice(codes)
+    codings = [{"system": system, "code": code, "display": display}]
+    if rng.random() < 0.5:
+        codings.insert(0, {"system": "urn:oid:1.2.3", "code": str(rng.randint(1000, 9999))})
+    return {"coding": codings}
+
+
+def day(rng):
+    return f"{rng.randint(1990, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+
+def patient(rng):
+    return {
+        "resourceType": "Patient", "id": str(rng.random()), "gender": rng.choice(["male", "female"]),
+        "birthDate": day(rng), "deceasedBoolean": rng.random() < 0.1,
+        "extension": [{"url": "http://hl7.org/fhir/us/core/StructureDefinition/us-core-race",
+                       "extension": [{"url": "ombCategory", "valueCoding": {"display": "White"}}]}],
+    }
+
+
+def condition(rng):
+    return {
+        "resourceType": "Condition",
+        "code": concept(rng, "http://hl7.org/fhir/sid/icd-10-cm", [("C90.0", "Multiple myeloma"), ("C50.9", "Breast cancer")]),
+        "clinicalStatus": {"coding": [{"code": "active"}]}, "onsetDateTime": day(rng),
+    }
+
+
+def observation(rng):
+    return {
+        "resourceType": "Observation",
+        "code": concept(rng, "http://loinc.org", [("718-7", "Hemoglobin"), ("2160-0", "Creatinine")]),
+        "valueQuantity": {"value": round(rng.uniform(1, 20), 1), "unit": "g/dL"},
+        "interpretation": [{"coding": [{"code": "L", "display": "Low"}]}], "effectiveDateTime": day(rng),
+    }
+
+
+def medication(rng):
+    return {
+        "resourceType": "MedicationRequest", "status": "active", "authoredOn": day(rng),
+        "medicationCodeableConcept": concept(rng, "http://www.nlm.nih.gov/research/umls/rxnorm", [("342369", "Lenalidomide"), ("121191", "Rituximab")]),
+    }
+
+
+def procedure(rng):
+    return {
+        "resourceType": "Procedure", "status": "completed", "performedPeriod": {"start": day(rng)},
+        "code": concept(rng, "http://snomed.info/sct", [("234336002", "Bone marrow biopsy")]),
+    }
+
+
+def diagnostic_report(rng):
+    return {
+        "resourceType": "DiagnosticReport", "status": "final", "effectiveDateTime": day(rng),
+        "category": [{"coding": [{"code": rng.choice(["LAB", "RAD"]), "display": "Category"}]}],
+        "code": concept(rng, "http://loinc.org", [("58410-2", "CBC panel"), ("24627-2", "CT Chest")]),
+        "conclusionCode": [concept(rng, "http://snomed.info/sct", [("1", "Normal"), ("2", "Mass")])],
+    }
+
+
+def allergy(rng):
+    return {
+        "resourceType": "AllergyIntolerance", "type": "allergy", "category": ["medication"],
+        "criticality": "high", "clinicalStatus": {"coding": [{"code": "active"}]}, "recordedDate": day(rng),
+        "code": concept(rng, "http://www.nlm.nih.gov/research/umls/rxnorm", [("7980", "Penicillin G")]),
+        "reaction": [{"manifestation": [{"text": "Hives"}]}],
+    }
+
+
+def encounter(rng):
+    return {"resourceType": "Encounter", "status": "finished", "period": {"start": day(rng)}}
+
+
+BUILDERS = (patient, condition, observation, medication, procedure, diagnostic_report, allergy, encounter)
+
+
+def bundle(resources):
+    return {"resourceType": "Bundle", "entry": [{"resource": resource} for resource in resources]}
+
+
+def throughput(resources):
+    corpus = bundle(resources)
+    seconds = min(timeit.repeat(lambda: parse_fhir_bundle(corpus, "2025-01-01"), number=1, repeat=5))
+    return len(resources) / seconds
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    rng = random.Random(42)
+    mixed = [rng.choice(BUILDERS)(rng) for _ in range(size)]
+    print(f"{'corpus':>18} {'resources':>10} {'resources/s':>12}")
+    print(f"{'mixed':>18} {size:>10} {throughput(mixed):>12,.0f}")
+    for build in BUILDERS:
+        resources = [build(rng) for _ in range(size // len(BUILDERS))]
+        name = resources[0]["resourceType"]
+        print(f"{name:>18} {len(resources):>10} {throughput(resources):>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
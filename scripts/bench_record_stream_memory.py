@@ -0,0 +1,125 @@
+"""Memory benchmark: ORM .all() vs the streaming record layer.
+
+Seeds a throwaway SQLite database at two sizes (N and 10N records over a
+fixed patient population) and reports each reader's peak RSS growth, measured
+in a fresh subprocess per run. The streaming read stays flat while .all()
+grows with the record count. The cohort index is not bounded the same way:
+it only reads through the stream, but it keeps each patient's distinct
+features and the postings behind them, so it grows with the distinct terms
+per patient. Here each patient gains codes as records are added, and the
+index roughly doubles at 10N (about 12 MB to 27 MB at N=20,000), far below
+.all() but not flat.
+
+Run from the repository root:  python scripts/bench_record_stream_memory.py [N]
+"""
+import json
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+PATIENTS = 500
+MODES = ("orm_all", "stream", "cohort_index")
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+def payload(rng, category):
+    if category == "diagnosis":
+        return {"display": rng.choice(["Multiple myeloma", "Diffuse large B-cell lymphoma"]),
+                "code": f"C{rng.randint(80, 96)}.{rng.randint(0, 9)}", "stage": rng.choice(["I", "II", "III"]),
+                "note": "x" * rng.randint(200, 600)}
+    if category == "treatment":
+        return {"medication": rng.choice(["Lenalidomide", "Bortezomib", "Rituximab"]),
+                "status": "active", "note": "x" * rng.randint(200, 600)}
+    return {"test": "Hemoglobin", "value": round(rng.uniform(8, 16), 1), "unit": "g/dL",
+            "note": "x" * rng.randint(200, 600)}
+
+
+def seed(path, records):
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from api.database import Base, engine
+    import api.models  # noqa: F401  (registers tables)
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    rng = random.Random(7)
+    patients = [str(uuid.uuid4()) for _ in range(PATIENTS)]
+    start = datetime(2024, 1, 1)
+    conn = sqlite3.connect(path)
+    rows = []
+    for i in range(records):
+        category = rng.choice(["diagnosis", "treatment", "lab_results"])
+        rows.append((str(uuid.uuid4()), "bench", rng.choice(patients), category,
+                     json.dumps(payload(rng, category)), (start + timedelta(seconds=i)).isoformat(" ")))
+    conn.executemany(
+        "INSERT INTO extracted_medical_data (id, connection_id, patient_id, data_category,"
+        " deidentified_data, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+def child(mode, path):
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from api.cohort_index import CohortIndex, record_features
+    from api.database import SessionLocal
+    from api.models import ExtractedMedicalData
+    from api.record_stream import PAYLOAD_TEXT, decode_payload, decode_payload_text, record_query
+
+    db = SessionLocal()
+    before = peak_rss_mb()
+    labels = {}
+    if mode == "orm_all":
+        for record in db.query(ExtractedMedicalData).all():
+            for feature in record_features(record.data_category, decode_payload(record.deidentified_data)):
+                labels[feature] = labels.get(feature, 0) + 1
+    elif mode == "stream":
+        query = record_query(db, ExtractedMedicalData.data_category, PAYLOAD_TEXT)
+        for category, raw in query:
+            for feature in record_features(category, decode_payload_text(raw)):
+                labels[feature] = labels.get(feature, 0) + 1
+    else:
+        index = CohortIndex()
+        index.sync(db, db.query(ExtractedMedicalData.patient_id).distinct())
+    print(f"{peak_rss_mb() - before:.1f}")
+
+
+def main():
+    base = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    print(f"{'records':>9} " + " ".join(f"{mode + ' MB':>16}" for mode in MODES))
+    with tempfile.TemporaryDirectory() as tmp:
+        for records in (base, base * 10):
+            path = os.path.join(tmp, f"bench_{records}.db")
+            subprocess.run([sys.executable, __file__, "--seed", path, str(records)], check=True)
+            peaks = [
+                subprocess.run(
+                    [sys.executable, __file__, "--child", mode, path],
+                    check=True, capture_output=True, text=True,
+                ).stdout.strip()
+                for mode in MODES
+            ]
+            print(f"{records:>9} " + " ".join(f"{peak:>16}" for peak in peaks))
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--seed"]:
+        seed(sys.argv[2], int(sys.argv[3]))
+    elif sys.argv[1:2] == ["--child"]:
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -18,6 +18,7 @@ const CohortBuilder = () => {
   const [showAddRule, setShowAddRule] = useState(null); // 'inclusion' or 'exclusion'
   const [newRule, setNewRule] = useState({ field: '', operator: 'IS', value: '' });
   const [outputFormat, setOutputFormat] = useState('csv');
+  const [unavailableFormats, setUnavailableFormats] = useState([]);
   const [deidentLevel, setDeidentLevel] = useState('limited_dataset');
   const [extracting, setExtracting] = useState(false);
 
@@ -212,6 +213,16 @@ const CohortBuilder = () => {
       .then(data => { setVariableInventory(data); setInventoryError(null); })
       .catch(err => setInventoryError(err.message));
 
+    // Parquet and Arrow are only offered where the server can write them
+    fetch(`${API_URL}/api/extraction/formats`, { headers: authHeaders() })
+      .then(res => (res.ok ? res.json() : { unavailable_formats: [] }))
+      .then(data => {
+        const unavailable = data.unavailable_formats || [];
+        setUnavailableFormats(unavailable);
+        setOutputFormat(prev => (unavailable.includes(prev) ? 'csv' : prev));
+      })
+      .catch(() => setUnavailableFormats([]));
+
     fetch(`${API_URL}/api/researcher/studies`, { headers: authHeaders() })
       .then(res => (res.ok ? res.json() : []))
       .then(list => {
@@ -325,7 +336,7 @@ const CohortBuilder = () => {
         headers: { 'Content-Type': 'application/json', ...authHeaders() },
         body: JSON.stringify({
           study_id: activeStudyId,
-          variables: selectedVariableIds,
+          variables: qualifiedVariableIds,
           output_format: outputFormat,
           deidentification_level: deidentLevel,
         }),
@@ -340,7 +351,90 @@ const CohortBuilder = () => {
     }
   };
 
+  // A queued job runs on the extraction worker; follow it until it finishes.
+  // Progress comes from the job's event stream, which EventSource opens with a
+  // short-lived ?token= (it cannot send the Authorization header); if the
+  // stream is unavailable or drops, the job list is polled instead.
+  const extractJobId = extractJob?.job_id;
+  const extractJobActive = ['queued', 'running'].includes(extractJob?.status);
+  useEffect(() => {
+    if (!extractJobId || !extractJobActive) return undefined;
+    let source = null;
+    let timer = null;
+    let stopped = false;
+
+    const refresh = async () => {
+      try {
+        const res = await fetch(`${API_URL}/api/extraction/jobs?study_id=${activeStudyId}`, { headers: authHeaders() });
+        if (!res.ok) return;
+        const job = (await res.json()).find(j => j.id === extractJobId);
+        if (job) {
+          setExtractJob(prev => ({
+            ...prev,
+            status: job.status,
+            stage: job.stage,
+            progress: job.progress,
+            patient_count: job.patient_count ?? prev.patient_count,
+            message: job.error_message || prev.message,
+          }));
+        }
+      } catch (err) {
+        // Retried on the next tick
+      }
+    };
+    const poll = () => {
+      if (!stopped && !timer) timer = setInterval(refresh, 2000);
+    };
+
+    (async () => {
+      try {
+        if (typeof EventSource === 'undefined') throw new Error('No EventSource');
+        const res = await fetch(`${API_URL}/api/extraction/jobs/${extractJobId}/events/token`, {
+          method: 'POST',
+          headers: authHeaders(),
+        });
+        if (!res.ok) throw new Error('No event stream token');
+        const { token } = await res.json();
+        if (stopped) return;
+        source = new EventSource(
+          `${API_URL}/api/extraction/jobs/${extractJobId}/events?token=${encodeURIComponent(token)}`
+        );
+        source.addEventListener('progress', event => {
+          const update = JSON.parse(event.data);
+          setExtractJob(prev => ({
+            ...prev,
+            status: update.status,
+            stage: update.stage,
+            progress: update.progress,
+            message: update.error_message || prev.message,
+          }));
+          if (!['queued', 'running'].includes(update.status)) {
+            source.close();
+            refresh(); // the final patient count is not part of the stream
+          }
+        });
+        source.onerror = () => {
+          // Reconnecting would reuse an expired token; poll instead.
+          source.close();
+          poll();
+        };
+      } catch (err) {
+        poll();
+      }
+    })();
+
+    return () => {
+      stopped = true;
+      if (source) source.close();
+      if (timer) clearInterval(timer);
+    };
+  }, [extractJobId, extractJobActive, activeStudyId]);
+
   const selectedVariableIds = Object.values(selectedVars).flat();
+  // "<category>.<field>" lets the extraction read only the chosen categories.
+  const qualifiedVariableIds = Object.entries(selectedVars).flatMap(
+    ([category, ids]) => ids.map(id => `${category}.${id}`)
+  );
   const totalVars = selectedVariableIds.length;
 
   const regDocuments = siteData?.central || [];
@@ -963,8 +1057,9 @@ const CohortBuilder = () => {
                       {[
                         { id: 'csv', label: 'CSV', desc: 'REDCap-ready' },
                         { id: 'parquet', label: 'Parquet', desc: 'For Python/R' },
+                        { id: 'arrow', label: 'Arrow', desc: 'pandas / DuckDB' },
                         { id: 'fhir', label: 'FHIR', desc: 'Interoperability' }
-                      ].map(opt => (
+                      ].filter(opt => !unavailableFormats.includes(opt.id)).map(opt => (
                         <button
                           key={opt.id}
                           onClick={() => setOutputFormat(opt.id)}
@@ -1057,14 +1152,24 @@ const CohortBuilder = () => {
                 className="bg-white/5 border border-white/10 p-8 text-center"
               >
                 <div className="w-16 h-16 bg-emerald-500/20 flex items-center justify-center mx-auto mb-4">
-                  <span className="text-2xl text-emerald-400">✓</span>
+                  <span className="text-2xl text-emerald-400">
+                    {{ completed: '✓', failed: '!', cancelled: '–' }[extractJob.status] || '…'}
+                  </span>
                 </div>
                 <h2 className="text-xl font-semibold mb-2">
-                  {extractJob.status === 'completed' ? 'Extraction Complete' : 'Extraction Queued'}
+                  {{
+                    completed: 'Extraction Complete',
+                    failed: 'Extraction Failed',
+                    cancelled: 'Extraction Cancelled',
+                    running: 'Extraction Running',
+                  }[extractJob.status] || 'Extraction Queued'}
                 </h2>
                 <p className="text-white/40 mb-6">
                   {(extractJob.patient_count ?? 0).toLocaleString()} patients · {totalVars} variables
                 </p>
+                {extractJob.status === 'failed' && extractJob.message && (
+                  <p className="text-red-400 text-sm mb-6">{extractJob.message}</p>
+                )}
 
                 <div className="bg-white/5 p-4 text-left mb-6">
                   <div className="text-sm space-y-2">
@@ -1074,7 +1179,12 @@ const CohortBuilder = () => {
                     </div>
                     <div className="flex justify-between gap-4">
                       <span className="text-white/40">Status</span>
-                      <span>{extractJob.status}</span>
+                      <span>
+                        {extractJob.status}
+                        {extractJob.status === 'running' && extractJob.progress != null
+                          ? ` · ${Math.round(extractJob.progress * 100)}%${extractJob.stage ? ` (${extractJob.stage})` : ''}`
+                          : ''}
+                      </span>
                     </div>
                     <div className="flex justify-between gap-4">
                       <span className="text-white/40">Study</span>
@@ -1103,7 +1213,8 @@ const CohortBuilder = () => {
                         const url = URL.createObjectURL(blob);
                         const a = document.createElement('a');
                         a.href = url;
-                        a.download = `${extractJob.job_id}.csv`;
+                        const extension = { parquet: 'parquet', arrow: 'arrow' }[outputFormat] || 'csv';
+                        a.download = `${extractJob.job_id}.${extension}`;
                         a.click();
                         URL.revokeObjectURL(url);
                       }}
@@ -147,23 +147,21 @@ const PatientPortal = () => {
     event.target.value = '';
     if (!file) return;
 
-    let bundle;
-    try {
-      bundle = JSON.parse(await file.text());
-    } catch (err) {
-      alert('That file is not valid JSON.');
-      return;
-    }
-
     setIsSubmitting(true);
     try {
-      const response = await fetch(`${API_URL}/api/patient/connections/fhir`, {
+      // The file goes up as-is and is parsed entry by entry on the server, so
+      // multi-hundred-MB portal exports never have to be decoded in the browser.
+      // Bulk Data exports (.ndjson) hold one resource per line.
+      const isNdjson = file.name.toLowerCase().endsWith('.ndjson');
+      const endpoint = isNdjson ? 'ndjson' : 'stream';
+      const sourceName = encodeURIComponent(file.name);
+      const response = await fetch(`${API_URL}/api/patient/connections/fhir/${endpoint}?source_name=${sourceName}`, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json',
+          'Content-Type': isNdjson ? 'application/fhir+ndjson' : 'application/fhir+json',
           Authorization: `Bearer ${token}`,
         },
-        body: JSON.stringify({ bundle, source_name: file.name }),
+        body: file,
       });
       const data = await response.json();
       if (response.ok) {
@@ -908,11 +906,11 @@ const PatientPortal = () => {
                     <p className="text-white font-medium">
                       {isSubmitting ? 'Importing…' : 'Upload health records (FHIR export)'}
                     </p>
-                    <p className="text-white/40 text-sm">Choose a JSON file exported by your patient portal</p>
+                    <p className="text-white/40 text-sm">Choose a JSON or NDJSON file exported by your patient portal</p>
                   </div>
                   <input
                     type="file"
-                    accept=".json,application/json"
+                    accept=".json,.ndjson,application/json"
                     onChange={handleFHIRUpload}
                     disabled={isSubmitting}
                     className="hidden"
@@ -931,7 +929,8 @@ const PatientPortal = () => {
                 <p className="text-white/40 text-xs leading-relaxed">
                   Your file is de-identified in transit: names, addresses, contact details, record
                   numbers and exact dates are stripped before anything is stored. Only coded clinical
-                  facts (conditions, medications, procedures, labs), age bands and years are kept.
+                  facts (conditions, medications, procedures, labs, reports, allergies), age bands and
+                  years are kept.
                 </p>
               </div>
             </motion.div>
@@ -0,0 +1,27 @@
+"""Shared pytest setup: every test runs against a throwaway SQLite database.
+
+``DATABASE_URL`` is read when api.database is first imported, so it is set
+here, before any test module imports the application.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+_DB_DIR = tempfile.mkdtemp(prefix="healthdb-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_DB_DIR, "test.db")
+
+
+@pytest.fixture(scope="module")
+def db():
+    """A session on freshly created tables, dropped again after the module."""
+    from api.database import Base, SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
@@ -0,0 +1,162 @@
+"""The SQL cohort compiler (api/cohort_query.py) must select exactly the
+patients, with the same per-category record counts, as the cohort index path
+it replaces when ``COHORT_QUERY_ENGINE=sql``.
+"""
+
+from datetime import datetime, timedelta
+import json
+
+import pytest
+
+from api import main
+from api.cohort_index import CohortIndex
+from api.cohort_query import run_cohort_query
+from api.consent_scope import consented_patient_query
+from api.models import Consent, ExtractedMedicalData, MedicalRecordConnection, PatientProfile
+
+# patient -> (consent status or None, consent expiry offset in days, records)
+PATIENTS = {
+    "myeloma": ("active", None, [
+        ("diagnosis", {"display": "Multiple myeloma", "code": "C90.0", "stage": "III"}),
+        ("treatment", {"medication": "Lenalidomide"}),
+        ("treatment", {"medication": "Bortezomib", "regimen": "VRd"}),
+        ("lab_results", {"test": "Hemoglobin", "value": 9.8}),
+    ]),
+    "lymphoma": ("active", None, [
+        ("diagnosis", {"display": "Diffuse large B-cell lymphoma", "icd_code": "C83.3"}),
+        # Stage criteria match any category, not only diagnoses.
+        ("treatment", {"regimen": "R-CHOP", "stage": "II"}),
+    ]),
+    "leukemia": ("active", 30, [
+        ("diagnosis", {"cancer_type": "Acute myeloid leukemia", "code": "C92.0"}),
+        ("treatment", {"medication": "Cytarabine", "procedure": "Induction"}),
+    ]),
+    # "myeloma" only in a treatment: no diagnosis match, and the reverse.
+    "crossed": ("active", None, [
+        ("diagnosis", {"display": "Breast cancer", "code": "C50.9"}),
+        ("treatment", {"display": "Myeloma protocol", "medication": "Tamoxifen"}),
+    ]),
+    "staged_lab": ("active", None, [
+        ("lab_results", {"test": "Marrow biopsy", "stage": "IIIa"}),
+    ]),
+    "no_records": ("active", None, []),
+    # Legacy payloads stored as a double-encoded JSON string.
+    "legacy": ("active", None, [
+        ("diagnosis", json.dumps({"display": "Mantle cell lymphoma", "code": "C83.1", "stage": "IV"})),
+        ("treatment", json.dumps("free-text note, not a JSON object")),
+    ]),
+    # Out of consent scope: never in either result.
+    "revoked": ("revoked", None, [
+        ("diagnosis", {"display": "Multiple myeloma", "code": "C90.0"}),
+    ]),
+    "expired": ("active", -1, [
+        ("diagnosis", {"display": "Multiple myeloma", "code": "C90.0"}),
+    ]),
+    "unconsented": (None, None, [
+        ("treatment", {"medication": "Lenalidomide"}),
+    ]),
+}
+
+
+@pytest.fixture(scope="module")
+def seeded(db):
+    now = datetime.utcnow()
+    ids = {}
+    for name, (status, expires_in_days, records) in PATIENTS.items():
+        patient = PatientProfile()
+        db.add(patient)
+        db.flush()
+        ids[name] = str(patient.id)
+        if status is not None:
+            db.add(Consent(
+                patient_id=patient.id,
+                consent_type="research_data_sharing",
+                status=status,
+                expires_at=now + timedelta(days=expires_in_days) if expires_in_days is not None else None,
+            ))
+        connection = MedicalRecordConnection(
+            patient_id=patient.id, source_type="fhir", source_name="test", connection_status="connected"
+        )
+        db.add(connection)
+        db.flush()
+        for category, payload in records:
+            db.add(ExtractedMedicalData(
+                connection_id=connection.id,
+                patient_id=patient.id,
+                data_category=category,
+                deidentified_data=payload,
+            ))
+    db.commit()
+    return ids
+
+
+@pytest.fixture
+def index(monkeypatch):
+    fresh = CohortIndex()
+    monkeypatch.setattr(main, "cohort_index", fresh)
+    return fresh
+
+
+def _sql(db, criteria):
+    return run_cohort_query(db, criteria, consented_patient_query(db).subquery())
+
+
+def _index(db, criteria):
+    return main._index_cohort_counts(db, criteria, main._consented_patient_ids(db))
+
+
+CASES = [
+    # (criteria, expected patients)
+    ({}, {"myeloma", "lymphoma", "leukemia", "crossed", "staged_lab", "no_records", "legacy"}),
+    ({"cancer_types": ["myeloma"]}, {"myeloma"}),
+    ({"treatment_types": ["lenalidomide"]}, {"myeloma"}),
+    ({"cancer_types": ["MULTIPLE Myeloma"]}, {"myeloma"}),
+    # Any term of a criterion.
+    ({"cancer_types": ["myeloma", "lymphoma"]}, {"myeloma", "lymphoma", "legacy"}),
+    ({"cancer_types": ["myeloma"], "icd_codes": ["c92"]}, {"myeloma", "leukemia"}),
+    ({"icd_codes": ["C83.3", "C50"]}, {"lymphoma", "crossed"}),
+    # Every criterion.
+    ({"cancer_types": ["myeloma"], "treatment_types": ["lenalidomide"]}, {"myeloma"}),
+    ({"cancer_types": ["myeloma"], "treatment_types": ["cytarabine"]}, set()),
+    ({"cancer_types": ["leukemia", "lymphoma"], "treatment_types": ["chop", "induction"]}, {"leukemia", "lymphoma"}),
+    # Category-qualified: diagnosis and treatment terms only match their own category.
+    ({"treatment_types": ["myeloma"]}, {"crossed"}),
+    ({"cancer_types": ["lenalidomide"]}, set()),
+    ({"treatment_types": ["vrd"]}, {"myeloma"}),
+    # Stage matches in any category.
+    ({"stages": ["iii"]}, {"myeloma", "staged_lab"}),
+    ({"stages": ["II"]}, {"myeloma", "lymphoma", "staged_lab"}),
+    ({"stages": ["iii"], "cancer_types": ["myeloma"]}, {"myeloma"}),
+    ({"stages": ["iv"], "icd_codes": ["c83"]}, {"legacy"}),
+    ({"treatment_types": ["free-text"]}, set()),
+    # No match, and LIKE wildcards taken literally.
+    ({"cancer_types": ["glioblastoma"]}, set()),
+    ({"cancer_types": ["%"]}, set()),
+    ({"treatment_types": ["_"]}, set()),
+    ({"treatment_types": ["r-chop"]}, {"lymphoma"}),
+]
+
+
+@pytest.mark.parametrize("fields,expected", CASES, ids=[repr(fields) for fields, _ in CASES])
+def test_sql_matches_index(db, seeded, index, fields, expected):
+    criteria = main.CohortCriteria(**fields)
+    sql = _sql(db, criteria)
+    in_index = _index(db, criteria)
+
+    assert set(sql) == {seeded[name] for name in expected}
+    assert sql == in_index
+
+
+def test_record_counts_per_category(db, seeded, index):
+    counts = _sql(db, main.CohortCriteria(cancer_types=["myeloma"]))
+
+    assert counts == {seeded["myeloma"]: {"diagnosis": 1, "treatment": 2, "lab_results": 1}}
+    assert _sql(db, main.CohortCriteria())[seeded["no_records"]] == {}
+
+
+def test_batch_index_matches_sql(db, seeded, index):
+    criteria_list = [main.CohortCriteria(**fields) for fields, _ in CASES]
+    batch = main._index_batch_cohort_counts(db, criteria_list, main._consented_patient_ids(db))
+
+    assert batch == [_sql(db, criteria) for criteria in criteria_list]
+
@@ -0,0 +1,60 @@
+"""``BundleEntryStream`` (api/fhir_stream.py) must return the same resources
+wherever the body is split into chunks.
+"""
+
+import json
+
+import pytest
+
+from api.fhir_stream import BundleEntryStream, BundleStreamError
+
+BODIES = {
+    "decimal_total": '{"resourceType":"Bundle","total":12.5,"entry":[]}',
+    "exponents": '{"total":-1.5E+3,"resourceType":"Bundle","n":2e-2,"entry":[]}',
+    "entries": json.dumps({
+        "resourceType": "Bundle",
+        "total": 3.25,
+        "entry": [
+            {"resource": {"resourceType": "Observation", "valueQuantity": {"value": 1e-3}}},
+            {"fullUrl": "urn:uuid:1"},
+            {"resource": {"resourceType": "Condition", "code": {"text": "Multiple myeloma é"}}},
+        ],
+        "timestamp": 10,
+    }),
+}
+
+
+def _parse(chunks: list[bytes]) -> list[dict]:
+    parser = BundleEntryStream()
+    resources = []
+    for chunk in chunks:
+        resources.extend(parser.feed(chunk))
+    resources.extend(parser.close())
+    return resources
+
+
+@pytest.mark.parametrize("name", sorted(BODIES))
+def test_every_chunk_boundary(name):
+    body = BODIES[name].encode()
+    expected = [
+        entry["resource"] for entry in json.loads(body)["entry"] if "resource" in entry
+    ]
+    assert _parse([body]) == expected
+    for cut in range(1, len(body)):
+        assert _parse([body[:cut], body[cut:]]) == expected, cut
+
+
+def test_byte_at_a_time():
+    body = BODIES["entries"].encode()
+    assert _parse([body[i:i + 1] for i in range(len(body))]) == _parse([body])
+
+
+@pytest.mark.parametrize("body", [
+    '{"resourceType":"Bundle","total":12.,"entry":[]}',
+    '{"resourceType":"Bundle","total":1e,"entry":[]}',
+    '{"resourceType":"Patient","entry":[]}',
+    '{"resourceType":"Bundle","entry":[}',
+])
+def test_malformed_bodies_are_rejected(body):
+    with pytest.raises(BundleStreamError):
+        _parse([body.encode()])